@@ -1,15 +1,27 @@
 import hashlib
 import time
 from src.blockchain.merkle_tree import MerkleTree
+from src.blockchain.sealable import Sealable, sealable
 
 
-class Block:
+def hash_header(index, timestamp, merkle_root, previous_hash, nonce):
+    """Hash block header fields, matching Block.calculate_hash"""
+    block_string = f"{index}{timestamp}{merkle_root}{previous_hash}{nonce}"
+    return hashlib.sha256(block_string.encode()).hexdigest()
+
+
+@sealable
+class Block(Sealable):
+    __slots__ = ("index", "timestamp", "transactions", "previous_hash", "nonce", "merkle_tree", "merkle_root",
+                 "hash", "_header_hash")
+
     def __init__(self, index, transactions, previous_hash):
         self.index = index
         self.timestamp = time.time()
         self.transactions = transactions
         self.previous_hash = previous_hash
         self.nonce = 0
+        self._header_hash = None
 
         # Generate Merkle root
         self.merkle_root = self.calculate_merkle_root()
@@ -18,16 +30,69 @@ class Block:
 
     def calculate_merkle_root(self):
         """Generate Merkle root using Merkle class"""
-        if not self.transactions:
-            return None
+        tree = MerkleTree(self.transactions) if self.transactions else None
+        if not self.sealed:
+            self.merkle_tree = tree
+        return tree.merkle_root if tree else None
 
-        merkle_tree = MerkleTree(self.transactions)
-        return merkle_tree.merkle_root
+    def add_transaction(self, transaction):
+        """Append a transaction, updating the Merkle root incrementally"""
+        if self.merkle_tree is None:
+            self.transactions = list(self.transactions or [])
+            self.merkle_tree = MerkleTree()
+        self.transactions.append(transaction)
+        self.merkle_tree.append(transaction)
+        self.merkle_root = self.merkle_tree.merkle_root
+        self.hash = self.calculate_hash()
+
+    def header_prefix(self):
+        """Encode the header fields that precede the nonce"""
+        return f"{self.index}{self.timestamp}{self.merkle_root}{self.previous_hash}".encode()
 
     def calculate_hash(self):
-        """Calculate the hash of the block"""
-        block_string = f"{self.index}{self.timestamp}{self.merkle_root}{self.previous_hash}{self.nonce}"
-        return hashlib.sha256(block_string.encode()).hexdigest()
+        """Calculate the hash of the block, computed once after sealing"""
+        if self._header_hash is not None:
+            return self._header_hash
+        digest = hash_header(self.index, self.timestamp, self.merkle_root, self.previous_hash, self.nonce)
+        if self.sealed:
+            object.__setattr__(self, "_header_hash", digest)
+        return digest
+
+    def seal(self):
+        """Freeze the block and its transactions; the incremental Merkle tree is dropped"""
+        if self.sealed:
+            return self
+        if isinstance(self.transactions, list):
+            self.transactions = tuple(self.transactions)
+        for transaction in self.transactions or ():
+            if isinstance(transaction, Sealable):
+                transaction.seal()
+        self.merkle_tree = None
+        return Sealable.seal(self)
+
+    def to_bytes(self):
+        """Canonical binary encoding, the same bytes the network codec sends"""
+        from src.network.messages import encode_payload
+        return bytes(encode_payload("BLOCK", self.to_dict()))
+
+    @staticmethod
+    def from_bytes(data, verify=True):
+        """Decode a sealed block; verify recomputes the Merkle root from the transactions"""
+        from src.network.messages import decode_payload
+        from src.blockchain.transaction import Transaction
+        fields = decode_payload("BLOCK", data)
+        block = Block.from_header(fields)
+        transactions = fields.get("transactions")
+        if isinstance(transactions, list) and all(isinstance(tx, dict) and "sender" in tx for tx in transactions):
+            transactions = [Transaction.from_dict(tx) for tx in transactions]
+        block.transactions = transactions
+        if verify:
+            block.merkle_root = block.calculate_merkle_root()
+        return block.seal()
+
+    def header_fields(self):
+        """Header fields as a plain tuple, cheap to send to worker processes"""
+        return (self.index, self.timestamp, self.merkle_root, self.previous_hash, self.nonce, self.hash)
 
     def to_dict(self):
         """Convert the Block object to a dictionary."""
@@ -41,5 +106,34 @@ class Block:
             "nonce": self.nonce
         }
 
+    def to_header(self):
+        """Convert the Block object to a dictionary without its transactions."""
+        header = self.to_dict()
+        del header["transactions"]
+        return header
+
+    @staticmethod
+    def from_header(data):
+        """Rebuild a header-only block, keeping the received timestamp, nonce and hash"""
+        block = Block.__new__(Block)
+        block.index = data["index"]
+        block.timestamp = data["timestamp"]
+        block.transactions = None
+        block.previous_hash = data["previous_hash"]
+        block.nonce = data["nonce"]
+        block.merkle_tree = None
+        block.merkle_root = data["merkle_root"]
+        block.hash = data["hash"]
+        block._header_hash = None
+        return block
+
+    @staticmethod
+    def from_dict(data):
+        """Rebuild a block from a dictionary, recomputing its Merkle root"""
+        block = Block.from_header(data)
+        block.transactions = data["transactions"]
+        block.merkle_root = block.calculate_merkle_root()
+        return block.seal()
+
     def __str__(self):
         return f"Block(Index : {self.index}, Hash : {self.hash})"
@@ -0,0 +1,253 @@
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+from src.blockchain.block import Block
+from src.network.messages import decode_payload
+
+# segment, offset, length, crc32 of the record, block hash
+INDEX_RECORD = struct.Struct(">IQII32s")
+SEGMENT_SIZE = 128 * 1024 * 1024
+INDEX_FILE = "index.dat"
+
+
+def segment_name(segment):
+  return f"blk{segment:05d}.dat"
+
+
+class CorruptStoreError(ValueError):
+  """Raised when stored blocks are damaged anywhere but a torn tail"""
+
+
+class BlockStore:
+  """Append-only block files with a fixed-size height index.
+
+  Blocks are encoded with the network block codec and appended to segment
+  files of at most segment_size bytes. index.dat holds one fixed-size
+  record per height, so locating any block is a single pread, and the
+  block itself is decoded straight out of a read-only mmap of its segment.
+  The data is written before its index record; on open, anything past the
+  last complete record is cut off, and so are trailing records of the last
+  segment whose bytes did not reach the disk, so a crash mid-append loses
+  at most the blocks that were not synced. Damage anywhere else raises
+  CorruptStoreError instead of silently dropping the blocks after it.
+  """
+
+  def __init__(self, directory, segment_size=SEGMENT_SIZE, sync=False):
+    self.directory = directory
+    self.segment_size = segment_size
+    self.sync = sync
+    self.lock = threading.RLock()
+    self.maps = {}
+    os.makedirs(directory, exist_ok=True)
+    index_path = os.path.join(directory, INDEX_FILE)
+    self.index_file = open(index_path, "ab+")
+    try:
+      self._recover()
+    except CorruptStoreError:
+      self.index_file.close()
+      raise
+
+  def _segment_path(self, segment):
+    return os.path.join(self.directory, segment_name(segment))
+
+  def _segments(self):
+    return sorted(int(name[3:8]) for name in os.listdir(self.directory)
+                  if name.startswith("blk") and name.endswith(".dat"))
+
+  def _recover(self):
+    index_size = os.fstat(self.index_file.fileno()).st_size
+    self.count = index_size // INDEX_RECORD.size
+    if self.count:
+      last_segment = self.record(self.count - 1)[0]
+      while self.count and not self._intact(self.count - 1):
+        segment = self.record(self.count - 1)[0]
+        if segment != last_segment:
+          raise CorruptStoreError(f"Stored block {self.count - 1} in {segment_name(segment)} is corrupt")
+        print(f"Dropping torn block {self.count - 1} from the block store")
+        self.count -= 1
+    self.index_file.truncate(self.count * INDEX_RECORD.size)
+    if self.count:
+      segment, offset, length, _, _ = self.record(self.count - 1)
+      self._cut(segment, offset + length)
+    else:
+      self._cut(0, 0)
+
+  def _intact(self, height):
+    """True if the bytes of the block at height are on disk and match their checksum"""
+    segment, offset, length, crc, _ = self.record(height)
+    try:
+      with open(self._segment_path(segment), "rb") as segment_file:
+        data = os.pread(segment_file.fileno(), length, offset)
+    except FileNotFoundError:
+      return False
+    return len(data) == length and zlib.crc32(data) == crc
+
+  def _cut(self, segment, size):
+    """Make segment the active one, truncated to size, and delete later segments"""
+    for existing in self._segments():
+      if existing > segment:
+        self._unmap(existing)
+        os.remove(self._segment_path(existing))
+    self._unmap(segment)
+    self.active = segment
+    self.active_file = open(self._segment_path(segment), "ab+")
+    self.active_file.truncate(size)
+    self.active_size = size
+
+  def _unmap(self, segment):
+    mapped = self.maps.pop(segment, None)
+    if mapped is not None:
+      mapped.close()
+    if segment == getattr(self, "active", None) and getattr(self, "active_file", None) is not None:
+      self.active_file.close()
+      self.active_file = None
+
+  def __len__(self):
+    return self.count
+
+  def record(self, height):
+    """(segment, offset, length, crc, hash) of the block at height"""
+    if not 0 <= height < self.count:
+      raise IndexError(f"No stored block at height {height}")
+    data = os.pread(self.index_file.fileno(), INDEX_RECORD.size, height * INDEX_RECORD.size)
+    return INDEX_RECORD.unpack(data)
+
+  def block_hash(self, height):
+    """Hash of the block at height, read from the index without touching the block"""
+    return self.record(height)[4].hex()
+
+  def append(self, block):
+    """Store a block as the next height"""
+    payload = block.to_bytes()
+    with self.lock:
+      if block.index != self.count:
+        raise ValueError(f"Expected block {self.count}, got {block.index}")
+      if self.active_size and self.active_size + len(payload) > self.segment_size:
+        self.active_file.close()
+        self._cut(self.active + 1, 0)
+      offset = self.active_size
+      self.active_file.write(payload)
+      self.active_file.flush()
+      if self.sync:
+        os.fsync(self.active_file.fileno())
+      self.active_size += len(payload)
+      self.index_file.write(INDEX_RECORD.pack(
+        self.active, offset, len(payload), zlib.crc32(payload), bytes.fromhex(block.hash)
+      ))
+      self.index_file.flush()
+      if self.sync:
+        os.fsync(self.index_file.fileno())
+      self.count += 1
+
+  def _map(self, segment, end):
+    mapped = self.maps.get(segment)
+    if mapped is None or len(mapped) < end:
+      if mapped is not None:
+        mapped.close()
+      with open(self._segment_path(segment), "rb") as segment_file:
+        mapped = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+      self.maps[segment] = mapped
+    return mapped
+
+  def read(self, height, decode=None):
+    """Decode the stored block at height straight from the mapped segment, as a dict by default"""
+    with self.lock:
+      segment, offset, length, crc, _ = self.record(height)
+      mapped = self._map(segment, offset + length)
+      view = memoryview(mapped)[offset:offset + length]
+      try:
+        if zlib.crc32(view) != crc:
+          raise CorruptStoreError(f"Stored block {height} is corrupt")
+        return decode(view) if decode else decode_payload("BLOCK", view)
+      finally:
+        view.release()
+
+  def read_block(self, height):
+    """The stored block at height as a sealed Block, its stored header kept as is"""
+    return self.read(height, lambda view: Block.from_bytes(view, verify=False))
+
+  def truncate(self, count):
+    """Drop every block at height count and above, for reorgs"""
+    with self.lock:
+      if count >= self.count:
+        return
+      segment, offset, _, _, _ = self.record(count)
+      self.count = count
+      self.index_file.truncate(count * INDEX_RECORD.size)
+      self.index_file.flush()
+      self._unmap(self.active)
+      self._cut(segment, offset)
+
+  def close(self):
+    with self.lock:
+      for segment in list(self.maps):
+        self.maps.pop(segment).close()
+      if self.active_file is not None:
+        self.active_file.close()
+      self.index_file.close()
+
+
+class StoredChain:
+  """List-like chain backed by a BlockStore.
+
+  Only the newest window blocks stay decoded in memory, plus a small LRU of
+  older blocks that were read recently; any other height is decoded from
+  the store on demand. Supports what Blockchain does with its chain list:
+  len, indexing, slicing, iteration, append and del chain[height:].
+  """
+
+  def __init__(self, store, window=1024, cache_size=256):
+    self.store = store
+    self.window = window
+    self.cache_size = cache_size
+    self.recent = {}
+    self.cache = OrderedDict()
+
+  def __len__(self):
+    return len(self.store)
+
+  def __iter__(self):
+    for height in range(len(self)):
+      yield self._get(height)
+
+  def __getitem__(self, key):
+    if isinstance(key, slice):
+      return [self._get(height) for height in range(*key.indices(len(self)))]
+    if key < 0:
+      key += len(self)
+    if not 0 <= key < len(self):
+      raise IndexError("chain index out of range")
+    return self._get(key)
+
+  def __delitem__(self, key):
+    if not isinstance(key, slice) or key.stop is not None or key.step is not None:
+      raise TypeError("Only the tail of a stored chain can be removed")
+    self.truncate(key.indices(len(self))[0])
+
+  def _get(self, height):
+    block = self.recent.get(height)
+    if block is None:
+      block = self.cache.get(height)
+      if block is None:
+        block = self.store.read_block(height)
+        self.cache[height] = block
+        if len(self.cache) > self.cache_size:
+          self.cache.popitem(last=False)
+      else:
+        self.cache.move_to_end(height)
+    return block
+
+  def append(self, block):
+    self.store.append(block)
+    self.recent[block.index] = block
+    self.recent.pop(block.index - self.window, None)
+
+  def truncate(self, count):
+    self.store.truncate(count)
+    for cached in (self.recent, self.cache):
+      for height in [h for h in cached if h >= count]:
+        del cached[height]
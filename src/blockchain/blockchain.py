@@ -1,181 +1,456 @@
+import os
 import random
+from concurrent.futures import ProcessPoolExecutor
 from time import sleep
 
 from src.blockchain.staking import StakingSystem
-from src.blockchain.block import Block
+from src.blockchain.block import Block, hash_header
+from src.blockchain.block_store import BlockStore, CorruptStoreError, StoredChain
+from src.blockchain.chain_index import ChainIndex
+from src.blockchain.miner import ProofOfWorkMiner
+from src.blockchain.mempool import Mempool
+from src.blockchain.merkle_tree import MerkleTree
+from src.blockchain.state import AccountState
+from src.staking.sampler import StakeSampler
+
+# A checkpoint is kept for every block height that is a multiple of this
+CHECKPOINT_INTERVAL = 1000
+# Most transactions taken from the mempool for one block
+MAX_BLOCK_TRANSACTIONS = 5000
+# Fewer blocks than this are always validated in-process
+PARALLEL_VALIDATION_THRESHOLD = 20000
+
+
+def validate_segment(previous_hash, headers):
+  """Check the hashes and links of consecutive header tuples.
+
+  Returns None when the segment is valid, else (index, reason) for the
+  first bad block.
+  """
+  for index, timestamp, merkle_root, block_previous_hash, nonce, block_hash in headers:
+    if block_hash != hash_header(index, timestamp, merkle_root, block_previous_hash, nonce):
+      return index, "an invalid hash"
+    if block_previous_hash != previous_hash:
+      return index, "an invalid previous hash"
+    previous_hash = block_hash
+  return None
 
 class Blockchain :
-  def __init__(self):
-    self.chain = []
-    self.staking_pool = {}
+  def __init__(self, data_dir=None, window=1024):
+    # With a data directory blocks live on disk and only the newest window stay in memory
+    self.chain = [] if data_dir is None else StoredChain(BlockStore(data_dir), window)
+    self.checkpoints = {}
+    self.validator_sampler = StakeSampler()
     self.slash_penalty = 0.1 # 10% of stake
-    self.balances = {}
-    self.create_genesis_block()
-    self.pending_transactions = []
+    # Stakes are journaled with the balances, so reorgs undo staking too
+    self.state = AccountState(on_stake_change=self.validator_sampler.set_stake)
+    self.staking_pool = self.state.stakes
+    self.index = ChainIndex()
+    if len(self.chain) == 0:
+      self.create_genesis_block()
+    else:
+      self.load_state()
+    self.mempool = Mempool()
     self.staking_system = StakingSystem()
 
   def slash_validator(self, validator):
     """Reduce a validator's stake for unknown behaviour"""
     if validator in self.staking_pool:
       penalty = self.staking_pool[validator] * self.slash_penalty
-      self.staking_pool[validator] -= penalty
+      self.set_stake(validator, self.staking_pool[validator] - penalty)
       print(f"Validator {validator} has been slashed by {penalty:.2f} tokens")
-      if self.staking_pool[validator] <= 0:
+      if validator not in self.staking_pool:
         print(f"Validator {validator} is removed from staking pool")
-        del self.staking_pool[validator]
 
-  def validate_block(self):
+  def set_stake(self, address, amount):
+    """Update the staking pool, which keeps the validator sampler in step"""
+    self.state.set_stake(address, amount)
+
+  def validate_block(self, block=None):
     """Simulate block validation by other nodes"""
     return random.choice([True, True, False])
 
   def create_genesis_block(self):
     genesis_block = Block(0, "Genesis Block", "0")
     self.chain.append(genesis_block)
-    self.balances["Network"] = 1000
+    self.index.add_block(genesis_block)
+    self.state.set_balance("Network", 1000)
+
+  def load_state(self):
+    """Rebuild account state by replaying the stored blocks after a restart.
+
+    The store already dropped a torn tail, so a block that cannot be read or
+    applied means the store is damaged; CorruptStoreError is raised rather
+    than discarding every block above it.
+    """
+    self.state.set_balance("Network", 1000)
+    self.index.add_block(self.chain[0])
+    for height in range(1, len(self.chain)):
+      block = self.chain[height]
+      transactions = self.block_transactions(block)
+      if not self.apply_block(block, transactions):
+        raise CorruptStoreError(f"Stored block {height} cannot be applied to the account state")
+      self.index.add_block(block)
+    self.record_checkpoints(self.chain, 1)
+
+  @property
+  def balances(self):
+    return self.state.balances
+
+  def get_balance(self, address):
+    return self.state.get_balance(address)
+
+  def update_balance(self, address, amount):
+    self.state.update_balance(address, amount)
+
+  @staticmethod
+  def block_transactions(block):
+    """The block's transactions as Transaction objects"""
+    from src.blockchain.transaction import Transaction
+    if not isinstance(block.transactions, (list, tuple)):
+      return []
+    return [Transaction.from_dict(tx) if isinstance(tx, dict) else tx for tx in block.transactions]
+
+  def apply_block(self, block, transactions=None):
+    """Apply a block's transactions to account state under an undo journal.
+
+    Fees go to the validator drawn for the block, as in add_block, and are
+    burned when nobody is staking.
+    """
+    if transactions is None:
+      transactions = self.block_transactions(block)
+    validator = self.select_validator(seed=block.previous_hash)
+    self.state.begin_block(block.index)
+    for transaction in transactions:
+      if not self.process_transaction(transaction, validator):
+        self.state.abort_block()
+        print(f"Block {block.index} has a transaction that cannot be applied")
+        return False
+    self.state.commit_block()
+    return True
+
+  def append_block(self, block):
+    """Apply and append a block that extends the tip, dropping its transactions from the mempool"""
+    transactions = self.block_transactions(block)
+    if not self.apply_block(block, transactions):
+      return False
+    self.chain.append(block.seal())
+    self.index.add_block(block)
+    self.mempool.remove_many(transactions)
+    return True
+
+  def truncate_chain(self, height):
+    """Remove the blocks from height up, newest first, from the chain and its indexes.
+
+    Their transactions go back to the mempool, so a reorg does not lose
+    them; callers revert the account state first, so they are checked
+    against the balances at height.
+    """
+    removed = self.chain[height:]
+    for block in reversed(removed):
+      self.index.remove_block(block)
+    del self.chain[height:]
+    for block in removed:
+      for transaction in self.block_transactions(block):
+        self.add_transaction(transaction)
+
+  def find_block(self, block_hash):
+    """The block on the active chain with this hash, or None"""
+    height = self.index.block_height(block_hash)
+    return self.chain[height] if height is not None else None
+
+  def _transaction_at(self, location):
+    height, position = location
+    transaction = self.chain[height].transactions[position]
+    if isinstance(transaction, dict):
+      from src.blockchain.transaction import Transaction
+      return Transaction.from_dict(transaction)
+    return transaction
+
+  def find_transaction(self, transaction_hash):
+    """(transaction, height) of a confirmed transaction, or None"""
+    location = self.index.locate_transaction(transaction_hash)
+    return (self._transaction_at(location), location[0]) if location is not None else None
+
+  def get_transaction_history(self, address, limit=None):
+    """Confirmed transactions sent or received by address, oldest first"""
+    return [self._transaction_at(location) for location in self.index.address_history(address, limit)]
   
   def add_stake(self, address, amount):
     """Allow users to stake their coins"""
-    if address not in self.staking_pool:
-      self.staking_pool[address] = 0
-    self.staking_pool[address] += amount
+    self.set_stake(address, self.staking_pool.get(address, 0) + amount)
     return True
   
-  def select_validator(self):
-    total_stake = sum(self.staking_pool.values())
-    if total_stake == 0:
-      return None
-    
-    selection = random.uniform(0, total_stake)
-    current = 0
-    for validator, stake in self.staking_pool.items():
-      current += stake
-      if current >= selection:
-        return validator
-    return None
+  def select_validator(self, seed=None):
+    """Pick a validator with probability proportional to stake in O(log n)"""
+    return self.validator_sampler.sample(seed)
   
   def add_block(self, transactions):
+    """Build a block on the tip and append it, returns whether it was accepted"""
     previous_block = self.chain[-1]
-    validator = self.select_validator()
+    # Seeding with the parent hash lets every node derive the same validator
+    validator = self.select_validator(seed=previous_block.hash)
     if not validator:
       print("No validator selected -- Empty staking pool")
-      return None
-    
+      return False
+
     print(f"Validator {validator} is selected to create the block")
     new_block = Block(len(self.chain), transactions, previous_block.hash)
-    # Validate block
-    if self.validate_block(new_block):
-      self.chain.append(new_block)
+    # Validate block, applying it pays its fees to the validator
+    if self.validate_block(new_block) and self.append_block(new_block):
       print(f"Block {new_block.index} added by {validator}")
-      # Implement rewarding transaction fees
-      transaction_fees = self.calculate_transaction_fees(transactions)
-      self.reward_validator(validator, transaction_fees)
-    else:
-      print(f"Block {new_block} rejected. {validator} is penalized")
-      self.slash_validator(validator)
+      return True
+    print(f"Block {new_block} rejected. {validator} is penalized")
+    # Journaled with the tip the validator built on, so a reorg past it restores the stake
+    self.state.reopen_block(previous_block.index)
+    self.slash_validator(validator)
+    self.state.commit_block()
+    return False
 
-  def mine_block(self, block, difficulty=4):
+  def mine_block(self, block, difficulty=4, workers=None):
     # PoW : Adjust nonce until hash starts with '0' * difficulty
-    prefix = '0' * difficulty
-    while not block.hash.startswith(prefix):
-      block.nonce += 1
-      block.hash = block.calculate_hash()
+    result = ProofOfWorkMiner(workers).mine(block, difficulty)
+    print(f"Block {block.index} mined with nonce {result.nonce} at {result.hashrate:.0f} H/s")
+    return result
 
 
-  def is_chain_valid(self, chain):
+  def is_chain_valid(self, chain, workers=None):
+    """Validate a blockchain, re-hashing only blocks after the last matching checkpoint.
+
+    A checkpoint matches when chain's block at its height re-hashes to the
+    hash of our own block there, so everything up to it is our chain. The
+    rest is linked to that block and checked in-process, or in parallel
+    chunks when workers > 1 and the range is large.
+    """
     if not chain:
       print("The blockchain is empty")
       return False
 
-    """Validate the entire blockchain"""
-    for i in range(1, len(chain)):
-      current_block = chain[i]
-      previous_block = chain[i-1]
+    checkpoint = self.last_checkpoint(chain)
+    if checkpoint < 0:
+      # Genesis has no previous block to link to
+      failure = self.validate_blocks(chain[0].hash, chain, 1, workers)
+    else:
+      failure = self.validate_blocks(self.checkpoints[checkpoint], chain, checkpoint + 1, workers)
+    if failure is not None:
+      index, reason = failure
+      print(f"Block {index} has {reason}")
+      return False
+    return True
+
+  def validate_blocks(self, previous_hash, chain, start, workers=None):
+    """Re-hash chain[start:] and check that it links to previous_hash.
 
-      if current_block.hash != current_block.calculate_hash():
-        print(f"Block {current_block.index} has an invalid hash")
-        return False
-      
-      if current_block.previous_hash != previous_block.hash:
-        print(f"Block {current_block.index} hash invalid previous hash")
-        return False
+    Returns None when every block is valid, else (index, reason) for the
+    first bad block.
+    """
+    if workers is None or workers == 1 or len(chain) - start < PARALLEL_VALIDATION_THRESHOLD:
+      return validate_segment(previous_hash, (block.header_fields() for block in chain[start:]))
+    return self._validate_parallel(previous_hash, chain, start, workers)
+
+  def _validate_parallel(self, previous_hash, chain, start, workers):
+    workers = workers or os.cpu_count() or 1
+    chunk_size = -(-(len(chain) - start) // workers)
+    previous_hashes = []
+    segments = []
+    for chunk_start in range(start, len(chain), chunk_size):
+      # The last block of the chunk before is re-hashed by its own worker
+      previous_hashes.append(previous_hash if chunk_start == start else chain[chunk_start - 1].hash)
+      segments.append([block.header_fields() for block in chain[chunk_start:chunk_start + chunk_size]])
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+      for failure in executor.map(validate_segment, previous_hashes, segments):
+        if failure is not None:
+          return failure
+    return None
+
+  def last_checkpoint(self, chain):
+    """Highest checkpointed height where chain's block re-hashes to our block, -1 if none"""
+    for height in sorted(self.checkpoints, reverse=True):
+      if height < len(chain) and chain[height].calculate_hash() == self.checkpoints[height]:
+        return height
+    return -1
+
+  def record_checkpoints(self, chain, start=0):
+    """Remember the hashes of our validated chain at every interval height and at the tip"""
+    first_height = -(-start // CHECKPOINT_INTERVAL) * CHECKPOINT_INTERVAL
+    for height in range(first_height, len(chain), CHECKPOINT_INTERVAL):
+      self.checkpoints[height] = chain[height].hash
+    # Only the newest off-interval checkpoint is worth keeping
+    for height in [h for h in self.checkpoints if h % CHECKPOINT_INTERVAL]:
+      del self.checkpoints[height]
+    self.checkpoints[len(chain) - 1] = chain[-1].hash
+
+  def find_fork_height(self, chain):
+    """Height of the last block shared with chain, -1 if even genesis differs"""
+    low, high = 0, min(len(chain), len(self.chain)) - 1
+    fork = -1
+    while low <= high:
+      middle = (low + high) // 2
+      if chain[middle].hash == self.chain[middle].hash:
+        fork = middle
+        low = middle + 1
+      else:
+        high = middle - 1
+    return fork
+
+  def replace_chain(self, chain, workers=None):
+    """Adopt chain if it is longer and valid, keeping our blocks up to the fork.
+
+    Only the blocks above the fork are taken from chain, and every one of
+    them is re-hashed and linked to our block at the fork first, whatever
+    chain claims about the blocks below it.
+    """
+    if len(chain) <= len(self.chain):
+      return False
+    fork_height = self.find_fork_height(chain)
+    if fork_height < 0:
+      print("Rejected chain : it does not share our genesis block")
+      return False
+    failure = self.validate_blocks(self.chain[fork_height].hash, chain, fork_height + 1, workers)
+    if failure is not None:
+      index, reason = failure
+      print(f"Rejected chain : block {index} has {reason}")
+      return False
+    try:
+      self.splice_chain(fork_height, chain[fork_height + 1:])
+    except ValueError as e:
+      print(f"Rejected chain : {e}")
+      return False
+    self.record_checkpoints(self.chain, fork_height + 1)
     return True
   
+  def add_transaction(self, transaction):
+    """Queue a transaction for the next block, False if it is a duplicate, unfunded or rejected"""
+    if self.index.locate_transaction(MerkleTree.hash_leaf(transaction).hex()) is not None:
+      print(f"Transaction {transaction.calculate_hash()} is already on the chain")
+      return False
+    if not self.check_transaction(transaction, self.mempool.pending_spend(transaction.sender)):
+      print(f"Sender {transaction.sender} cannot fund {transaction.calculate_hash()} with its other pending transactions")
+      return False
+    return self.mempool.add(transaction, spend=self.transaction_spend(transaction))
+
+  @property
+  def pending_transactions(self):
+    return list(self.mempool)
+
+  def get_last_block(self):
+    return self.chain[-1]
+
+  def splice_chain(self, fork_height, blocks):
+    """Replace every block after fork_height with blocks.
+
+    Account state is unwound to the fork with the undo journals and the new
+    blocks are applied on top. If one of them cannot be applied, the old
+    branch is restored and ValueError is raised.
+    """
+    if blocks and fork_height >= 0 and blocks[0].previous_hash != self.chain[fork_height].hash:
+      raise ValueError(f"Blocks do not extend the local block at height {fork_height}")
+    if not self.state.can_revert_to(fork_height):
+      raise ValueError(f"Fork at height {fork_height} is deeper than the undo journals")
+
+    old_blocks = self.chain[fork_height + 1:]
+    self.state.revert_to(fork_height)
+    self.truncate_chain(fork_height + 1)
+    for block in blocks:
+      if not self.append_block(block):
+        self.state.revert_to(fork_height)
+        self.truncate_chain(fork_height + 1)
+        for old_block in old_blocks:
+          self.append_block(old_block)
+        raise ValueError(f"Block {block.index} cannot be applied to the account state")
+    stale = [h for h in self.checkpoints if h >= len(self.chain) or self.checkpoints[h] != self.chain[h].hash]
+    for height in stale:
+      del self.checkpoints[height]
+
   def calculate_transaction_fees(self, transactions):
     return len(transactions) * 0.01
   
   def reward_validator(self, validator, reward):
     if validator in self.staking_pool:
-      self.staking_pool[validator] += reward
+      self.set_stake(validator, self.staking_pool[validator] + reward)
       print(f"Validator {validator} rewarded with {reward:.2f} tokens")
 
   def withdraw_stake(self, address, amount):
     """Allow validators to withdraw their staked coins"""
     if address in self.staking_pool and self.staking_pool[address] >= amount:
-      self.staking_pool[address] -= amount
+      self.set_stake(address, self.staking_pool[address] - amount)
       print(f"Validator {address} withdrew {amount:.2f} tokens")
-      if self.staking_pool[address] <= 0:
-        del self.staking_pool[address]
       return True
     print(f"Insufficient stake of {address}")
     return False
   
-  def process_transaction(self, transaction):
-    """Validate and process a transaction"""
+  @staticmethod
+  def transaction_spend(transaction):
+    """What a transaction takes from its sender's balance, fee included"""
+    fee = transaction.fee or 0
+    if transaction.transaction_type == "UNSTAKE":
+      return fee
+    return transaction.amount + fee
+
+  def check_transaction(self, transaction, pending=0):
+    """Check a transaction against current state without applying it.
+
+    pending is what the sender's other pending transactions already spend.
+    """
+    fee = transaction.fee or 0
+    if transaction.amount < 0 or fee < 0:
+      return False
+    if transaction.transaction_type not in ("TRANSFER", "STAKE", "UNSTAKE"):
+      return False
+    if transaction.transaction_type == "UNSTAKE" and self.state.get_stake(transaction.sender) < transaction.amount:
+      return False
+    return self.get_balance(transaction.sender) >= pending + self.transaction_spend(transaction)
+
+  def process_transaction(self, transaction, validator=None):
+    """Validate and process a transaction, paying its fee to validator"""
+    if not self.check_transaction(transaction):
+      return False
+    fee = transaction.fee or 0
     if transaction.transaction_type == "TRANSFER":
-      if self.get_balance(transaction.sender) >= transaction.amount:
-        self.update_balance(transaction.sender, -transaction.amount)
-        self.update_balance(transaction.recipient, transaction.amount)
-        return True
+      self.update_balance(transaction.sender, -(transaction.amount + fee))
+      self.update_balance(transaction.receiver, transaction.amount)
     elif transaction.transaction_type == "STAKE":
-      if self.get_balance(transaction.sender) >= transaction.amount:
-        self.update_balance(transaction.sender, -transaction.amount)
-        return True
+      self.update_balance(transaction.sender, -(transaction.amount + fee))
+      self.state.update_stake(transaction.sender, transaction.amount)
     elif transaction.transaction_type == "UNSTAKE":
-      if self.staking_pool.get_stake(transaction.sender) >= transaction.amount:
-        self.update_balance(transaction.sender, transaction.amount)
-        return True
-    return False
+      self.state.update_stake(transaction.sender, -transaction.amount)
+      self.update_balance(transaction.sender, transaction.amount - fee)
+    if fee and validator is not None:
+      self.update_balance(validator, fee)
+    return True
   
   def create_block(self):
     """Create a new block with a validator selected by DPoS"""
-    active_validators = self.staking_system.select_validator()
+    active_validators = self.staking_system.select_validators()
     if not active_validators:
       raise Exception("No available validators")
     validator = random.choice(active_validators)
-    reward = self.staking_system.calculate_reward(len(active_validators), block_time=8)
+    reward = self.staking_system.calculate_rewards(len(active_validators), block_time=8)
+    transactions = self.mempool.pop_best(MAX_BLOCK_TRANSACTIONS)
     new_block = Block(
-      index=len(self.chain) + 1,
-      transactions=self.pending_transactions,
-      previous_hash=self.get_last_block().hash,
-      validator = validator
+      index=len(self.chain),
+      transactions=transactions,
+      previous_hash=self.get_last_block().hash
     )
-    self.pending_transactions = []
-    self.chain.append(new_block)
-    
+    if not self.append_block(new_block):
+      # The state was left untouched, so the transactions can wait for the next block
+      for transaction in transactions:
+        self.add_transaction(transaction)
+      print(f"Block {new_block.index} by validator {validator} was rejected")
+      return None
+
     # Distribute rewards
     self.staking_system.distribute_rewards(validator, reward)
     print(f"Block created by validator {validator}. Reward : {reward:.2f}")
+    return new_block
 
   def process_staking(self, transaction):
-    """Handle staking transactions"""
-    sender_wallet = self.get_wallet(transaction.sender)
-    if sender_wallet and sender_wallet.balance >= transaction.amount:
-      sender_wallet.balance -= transaction.amount
-      self.staking_pool.add_stake(transaction.sender, transaction.amount)
-      print(f"Staked {transaction.amount} for {transaction.sender}")
-      return True
-    return False
+    """Queue a staking transaction, the stake moves when its block is applied"""
+    return transaction.transaction_type == "STAKE" and self.add_transaction(transaction)
 
   def process_unstaking(self, transaction):
-    """Handle unstaking transactions"""
-    stake = self.staking_pool.get_stake(transaction.sender)
-    if stake and stake >= transaction.amount:
-      self.staking_pool.remove_stake(transaction.sender, transaction.amount)
-      sender_wallet = self.get_wallet(transaction.sender)
-      sender_wallet.balance += transaction.amount
-      print(f"Unstaked {transaction.amount} for {transaction.sender}")
-      return True
-    return False
+    """Queue an unstaking transaction, the stake moves when its block is applied"""
+    return transaction.transaction_type == "UNSTAKE" and self.add_transaction(transaction)
 
   def __len__(self):
     return len(self.chain)
\ No newline at end of file
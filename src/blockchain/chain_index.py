@@ -0,0 +1,72 @@
+from src.blockchain.merkle_tree import MerkleTree
+
+
+def block_entries(block):
+  """The transactions stored in a block, empty for genesis-style payloads"""
+  return block.transactions if isinstance(block.transactions, (list, tuple)) else ()
+
+
+def transaction_parties(transaction):
+  if isinstance(transaction, dict):
+    sender, receiver = transaction.get("sender"), transaction.get("receiver")
+  else:
+    sender, receiver = transaction.sender, transaction.receiver
+  return (sender,) if receiver is None or receiver == sender else (sender, receiver)
+
+
+class ChainIndex:
+  """Lookup tables over the blocks of the active chain.
+
+  transactions maps a transaction hash to its (height, position), blocks
+  maps a block hash to its height and addresses maps an address to the
+  (height, position) of every transaction it sent or received, in chain
+  order. Blocks are only ever added or removed at the tip, so a reorg
+  undoes each entry by popping it off the end of its address list.
+  Transactions are keyed by their Merkle leaf hash, which is the same for
+  a transaction object and its dict form.
+  """
+
+  def __init__(self):
+    self.transactions = {}
+    self.blocks = {}
+    self.addresses = {}
+
+  def add_block(self, block):
+    """Index a block appended at the tip"""
+    height = block.index
+    self.blocks[block.hash] = height
+    for position, transaction in enumerate(block_entries(block)):
+      location = (height, position)
+      self.transactions[MerkleTree.hash_leaf(transaction).hex()] = location
+      for address in transaction_parties(transaction):
+        self.addresses.setdefault(address, []).append(location)
+
+  def remove_block(self, block):
+    """Drop the entries of the block at the tip, the reverse of add_block"""
+    height = block.index
+    if self.blocks.get(block.hash) == height:
+      del self.blocks[block.hash]
+    transactions = block_entries(block)
+    for position in range(len(transactions) - 1, -1, -1):
+      transaction = transactions[position]
+      transaction_hash = MerkleTree.hash_leaf(transaction).hex()
+      if self.transactions.get(transaction_hash) == (height, position):
+        del self.transactions[transaction_hash]
+      for address in transaction_parties(transaction):
+        history = self.addresses.get(address)
+        if history and history[-1] == (height, position):
+          history.pop()
+          if not history:
+            del self.addresses[address]
+
+  def locate_transaction(self, transaction_hash):
+    """(height, position) of a transaction, None if it is not on the chain"""
+    return self.transactions.get(transaction_hash)
+
+  def block_height(self, block_hash):
+    return self.blocks.get(block_hash)
+
+  def address_history(self, address, limit=None):
+    """(height, position) of an address's transactions, oldest first, or the newest limit"""
+    history = self.addresses.get(address, [])
+    return list(history[-limit:] if limit else history)
@@ -0,0 +1,144 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from ecdsa import SigningKey, SECP256k1
+
+# Below this many keys or signatures the process pool costs more than it saves
+MIN_PARALLEL_BATCH = 64
+
+
+@lru_cache(maxsize=16384)
+def load_signing_key(secret):
+  """Parse a hex encoded SECP256k1 secret, caching the key per secret"""
+  return SigningKey.from_string(bytes.fromhex(secret), curve=SECP256k1)
+
+
+def wallet_address(public_key):
+  """Address of a hex encoded public key, as computed by Wallet"""
+  return hashlib.sha256(bytes.fromhex(public_key)).hexdigest()
+
+
+def generate_key_jobs(count):
+  """Generate count key pairs as (address, public key, secret) hex tuples"""
+  keys = []
+  for _ in range(count):
+    signing_key = SigningKey.generate(curve=SECP256k1)
+    public_key = signing_key.get_verifying_key().to_string().hex()
+    keys.append((wallet_address(public_key), public_key, signing_key.to_string().hex()))
+  return keys
+
+
+def sign_jobs(jobs):
+  """Sign (secret, message) pairs, returning hex signatures in the same order"""
+  return [load_signing_key(secret).sign(message).hex() for secret, message in jobs]
+
+
+class Keystore:
+  """Wallet keys kept in one append-only file, with their signing keys cached.
+
+  Each line of the file holds an address, its public key and its secret,
+  in hex. The file is created readable by the owner only and every batch
+  of new keys is appended with one write and one fsync. Parsing a secret
+  derives its public point, the expensive part of loading a key, so
+  parsed keys are cached per process. Bulk generation and batch signing
+  spread over a process pool in contiguous chunks, like BatchVerifier.
+  """
+
+  def __init__(self, path, workers=None, chunk_size=256):
+    self.path = path
+    self.workers = workers or os.cpu_count() or 1
+    self.chunk_size = chunk_size
+    self.keys = {}
+    self._executor = None
+    if os.path.exists(path):
+      self._load()
+
+  def _load(self):
+    with open(self.path) as f:
+      for line in f:
+        if line.strip():
+          address, public_key, secret = line.split()
+          self.keys[address] = (public_key, secret)
+
+  def __len__(self):
+    return len(self.keys)
+
+  def __contains__(self, address):
+    return address in self.keys
+
+  def addresses(self):
+    return list(self.keys)
+
+  def public_key(self, address):
+    return self.keys[address][0]
+
+  def generate(self, count):
+    """Create and persist count new wallets, returning their addresses"""
+    if self.workers == 1 or count < MIN_PARALLEL_BATCH:
+      keys = generate_key_jobs(count)
+    else:
+      chunk_size = max(1, min(self.chunk_size, -(-count // self.workers)))
+      sizes = [min(chunk_size, count - start) for start in range(0, count, chunk_size)]
+      keys = [key for chunk in self._pool().map(generate_key_jobs, sizes) for key in chunk]
+    self._append(keys)
+    for address, public_key, secret in keys:
+      self.keys[address] = (public_key, secret)
+    return [address for address, _, _ in keys]
+
+  def _append(self, keys):
+    fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+    with os.fdopen(fd, "w") as f:
+      f.write("".join(f"{address} {public_key} {secret}\n" for address, public_key, secret in keys))
+      f.flush()
+      os.fsync(f.fileno())
+
+  def signing_key(self, address):
+    if address not in self.keys:
+      raise ValueError(f"No key for wallet {address}")
+    return load_signing_key(self.keys[address][1])
+
+  def wallet(self, address):
+    """A Wallet that signs with the stored key of address"""
+    from src.blockchain.wallet import Wallet
+    return Wallet.from_private_key(self.signing_key(address))
+
+  def sign(self, address, data):
+    """Sign a str or bytes payload with the key of address"""
+    if isinstance(data, str):
+      data = data.encode()
+    return self.signing_key(address).sign(data).hex()
+
+  def sign_batch(self, items):
+    """Sign (address, data) pairs, returning hex signatures in input order.
+
+    Jobs are grouped by address so every worker parses each key at most
+    once, then split across the process pool.
+    """
+    jobs = []
+    for address, data in items:
+      if address not in self.keys:
+        raise ValueError(f"No key for wallet {address}")
+      jobs.append((self.keys[address][1], data.encode() if isinstance(data, str) else data))
+    if self.workers == 1 or len(jobs) < MIN_PARALLEL_BATCH:
+      return sign_jobs(jobs)
+
+    order = sorted(range(len(jobs)), key=lambda i: jobs[i][0])
+    chunk_size = max(1, min(self.chunk_size, -(-len(jobs) // self.workers)))
+    chunks = [[jobs[i] for i in order[start:start + chunk_size]] for start in range(0, len(order), chunk_size)]
+    signatures = [None] * len(jobs)
+    signed = (signature for chunk in self._pool().map(sign_jobs, chunks) for signature in chunk)
+    for position, signature in zip(order, signed):
+      signatures[position] = signature
+    return signatures
+
+  def _pool(self):
+    if self._executor is None:
+      self._executor = ProcessPoolExecutor(max_workers=self.workers)
+    return self._executor
+
+  def close(self):
+    if self._executor is not None:
+      self._executor.shutdown()
+      self._executor = None
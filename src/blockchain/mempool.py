@@ -0,0 +1,154 @@
+import heapq
+import itertools
+import time
+from collections import deque
+
+
+class MempoolEntry:
+  __slots__ = ("transaction", "hash", "fee", "spend", "sender", "arrival", "sequence")
+
+  def __init__(self, transaction, transaction_hash, fee, arrival, sequence, spend=0):
+    self.transaction = transaction
+    self.hash = transaction_hash
+    self.fee = fee
+    self.spend = spend
+    self.sender = transaction.sender
+    self.arrival = arrival
+    self.sequence = sequence
+
+
+class Mempool:
+  """Bounded pool of pending transactions ordered by fee.
+
+  Transactions are deduplicated by hash and indexed by sender, with the
+  total each sender has pending so admission can count it against the
+  sender's balance. A max-heap
+  on fee serves block assembly and a min-heap on fee picks eviction
+  victims when the pool is full, both in O(log n). Removed entries are
+  left in the heaps and skipped lazily; the heaps are rebuilt when stale
+  entries outnumber live ones.
+  """
+
+  def __init__(self, max_size=50000, max_age=3 * 60 * 60, max_per_sender=1000):
+    self.max_size = max_size
+    self.max_age = max_age
+    self.max_per_sender = max_per_sender
+    self.entries = {}
+    self.senders = {}
+    self.spends = {} # Sender to the total its pending transactions spend
+    self._best = []
+    self._worst = []
+    self._arrivals = deque()
+    self._sequence = itertools.count()
+
+  def __len__(self):
+    return len(self.entries)
+
+  def __contains__(self, transaction_hash):
+    return transaction_hash in self.entries
+
+  def __iter__(self):
+    return (entry.transaction for entry in self.entries.values())
+
+  def get(self, transaction_hash):
+    entry = self.entries.get(transaction_hash)
+    return entry.transaction if entry else None
+
+  def get_by_sender(self, sender):
+    """Pending transactions of a sender, oldest first"""
+    return [self.entries[h].transaction for h in self.senders.get(sender, ())]
+
+  def pending_spend(self, sender):
+    """What a sender's pending transactions take from its balance in total"""
+    return self.spends.get(sender, 0)
+
+  def _live(self, transaction_hash, sequence):
+    entry = self.entries.get(transaction_hash)
+    return entry is not None and entry.sequence == sequence
+
+  def lowest_fee(self):
+    """Fee of the cheapest pending transaction, None when empty"""
+    while self._worst and not self._live(self._worst[0][2], -self._worst[0][1]):
+      heapq.heappop(self._worst)
+    return self._worst[0][0] if self._worst else None
+
+  def add(self, transaction, now=None, spend=0):
+    """Admit a transaction that takes spend from its sender; False for duplicates or when it loses to the pool"""
+    transaction_hash = transaction.calculate_hash()
+    if transaction_hash in self.entries:
+      return False
+    now = time.time() if now is None else now
+    self.expire(now)
+
+    fee = getattr(transaction, "fee", 0) or 0
+    sender_hashes = self.senders.get(transaction.sender)
+    if sender_hashes is not None and len(sender_hashes) >= self.max_per_sender:
+      print(f"Sender {transaction.sender} already has {self.max_per_sender} pending transactions")
+      return False
+    if len(self.entries) >= self.max_size:
+      if fee <= self.lowest_fee():
+        return False
+      self.remove(self._worst[0][2])
+
+    entry = MempoolEntry(transaction, transaction_hash, fee, now, next(self._sequence), spend)
+    self.entries[transaction_hash] = entry
+    self.senders.setdefault(entry.sender, {})[transaction_hash] = None
+    if spend:
+      self.spends[entry.sender] = self.spends.get(entry.sender, 0) + spend
+    heapq.heappush(self._best, (-fee, entry.sequence, transaction_hash))
+    # Among equal fees the newest transaction is evicted first
+    heapq.heappush(self._worst, (fee, -entry.sequence, transaction_hash))
+    self._arrivals.append((now, entry.sequence, transaction_hash))
+    return True
+
+  def remove(self, transaction_hash):
+    """Drop a transaction, returning it or None if it was not pending"""
+    entry = self.entries.pop(transaction_hash, None)
+    if entry is None:
+      return None
+    sender_hashes = self.senders[entry.sender]
+    del sender_hashes[transaction_hash]
+    if not sender_hashes:
+      del self.senders[entry.sender]
+      self.spends.pop(entry.sender, None)
+    elif entry.spend:
+      self.spends[entry.sender] -= entry.spend
+    self._maybe_compact()
+    return entry.transaction
+
+  def remove_many(self, transactions):
+    """Drop transactions that were included in a block"""
+    for transaction in transactions:
+      self.remove(transaction.calculate_hash())
+
+  def pop_best(self, max_count=None):
+    """Remove and return the highest fee transactions, O(k log n)"""
+    selected = []
+    while self._best and (max_count is None or len(selected) < max_count):
+      _, sequence, transaction_hash = heapq.heappop(self._best)
+      if self._live(transaction_hash, sequence):
+        selected.append(self.remove(transaction_hash))
+    return selected
+
+  def expire(self, now=None):
+    """Evict transactions older than max_age, returning how many were dropped"""
+    now = time.time() if now is None else now
+    expired = 0
+    while self._arrivals and now - self._arrivals[0][0] > self.max_age:
+      _, sequence, transaction_hash = self._arrivals.popleft()
+      if self._live(transaction_hash, sequence):
+        self.remove(transaction_hash)
+        expired += 1
+    return expired
+
+  def _maybe_compact(self):
+    live = len(self.entries)
+    if len(self._best) > 2 * live + 64:
+      self._best = [(-e.fee, e.sequence, e.hash) for e in self.entries.values()]
+      heapq.heapify(self._best)
+      self._worst = [(e.fee, -e.sequence, e.hash) for e in self.entries.values()]
+      heapq.heapify(self._worst)
+    if len(self._arrivals) > 2 * live + 64:
+      self._arrivals = deque(
+        entry for entry in self._arrivals if self._live(entry[2], entry[1])
+      )
@@ -1,40 +1,133 @@
 import hashlib
 import json  # Import the json module for serialization
 
+from src.blockchain.transaction import transaction_hash
+
 
 class MerkleTree:
-    def __init__(self, transactions):
-        self.transactions = transactions
-        self.merkle_root = self.build_merkle_tree(transactions)
+    """Merkle tree over binary SHA-256 digests.
 
-    def hash_transactions(self, transaction):
-        # Convert dictionary to a JSON string, then encode it
-        transaction_string = json.dumps(transaction, sort_keys=True)
-        return hashlib.sha256(transaction_string.encode()).hexdigest()
+    Every level of the tree is kept, so leaf hashes are computed once and
+    appending a leaf only re-hashes the path from that leaf to the root.
+    """
 
-    def build_merkle_tree(self, transactions):
-        # Recursively build Merkle Tree and return the root hash
-        if not transactions:
+    def __init__(self, transactions=None, leaf_hashes=None):
+        self.transactions = list(transactions) if transactions else []
+        if leaf_hashes is None:
+            leaf_hashes = [self.hash_leaf(tx) for tx in self.transactions]
+        self.levels = [list(leaf_hashes)]
+        self._build()
+
+    @property
+    def root(self):
+        """Binary root digest, or None for an empty tree"""
+        if not self.levels[0]:
             return None
-        # If there's only 1 transaction, return its hash
-        if len(transactions) == 1:
-            return self.hash_transactions(transactions[0])
+        return self.levels[-1][0]
 
-        # Hash each transaction
-        hashed_transactions = [self.hash_transactions(tx) for tx in transactions]
+    @property
+    def merkle_root(self):
+        """Hex encoded root digest, or None for an empty tree"""
+        root = self.root
+        return root.hex() if root is not None else None
+
+    @property
+    def leaf_hashes(self):
+        return self.levels[0]
+
+    def __len__(self):
+        return len(self.levels[0])
+
+    @staticmethod
+    def hash_leaf(transaction):
+        """Hash a single transaction, signature included, into a 32 byte digest"""
+        calculate_hash = getattr(transaction, "calculate_hash", None)
+        if calculate_hash is not None:
+            return MerkleTree._commit_signature(calculate_hash(), getattr(transaction, "signature", None))
+        if isinstance(transaction, dict) and "sender" in transaction and "amount" in transaction:
+            # Same leaf as the Transaction object, so a block hashes alike in either form
+            get = transaction.get
+            return MerkleTree._commit_signature(transaction_hash(
+                get("sender"), get("receiver"), get("amount"), get("transaction_type"), get("timestamp"), get("fee", 0)
+            ), get("signature"))
+        # Convert dictionary to a JSON string, then encode it
+        transaction_string = json.dumps(transaction, sort_keys=True)
+        return hashlib.sha256(transaction_string.encode()).digest()
 
-        # Pair adjacent hashes and combine them
-        while len(hashed_transactions) > 1:
-            temp = []
-            for i in range(0, len(hashed_transactions), 2):
-                left = hashed_transactions[i]
-                right = hashed_transactions[i + 1] if i + 1 < len(hashed_transactions) else left  # Handle odd count
-                temp.append(self.hash_pair(left, right))
-            hashed_transactions = temp
+    @staticmethod
+    def _commit_signature(signed_hash, signature):
+        """Bind the signature to the leaf, so a block cannot swap it for another"""
+        if signature is None:
+            signature = b""
+        elif isinstance(signature, str):
+            signature = signature.encode()
+        # The signed hash is a fixed 32 bytes, so the signature cannot shift into it
+        return hashlib.sha256(bytes.fromhex(signed_hash) + signature).digest()
 
-        return hashed_transactions[0]
+    # Kept for callers that still hash transactions by the old name
+    def hash_transactions(self, transaction):
+        return self.hash_leaf(transaction).hex()
 
     @staticmethod
     def hash_pair(left, right):
-        # Hash a pair of transactions
-        return hashlib.sha256((left + right).encode()).hexdigest()
+        # Hash a pair of child digests
+        return hashlib.sha256(left + right).digest()
+
+    def _build(self):
+        """Build every level above the leaves in one pass"""
+        del self.levels[1:]
+        level = self.levels[0]
+        while len(level) > 1:
+            parent = []
+            for i in range(0, len(level), 2):
+                left = level[i]
+                right = level[i + 1] if i + 1 < len(level) else left  # Handle odd count
+                parent.append(self.hash_pair(left, right))
+            self.levels.append(parent)
+            level = parent
+
+    def _update_path(self, index):
+        """Re-hash the ancestors of the leaf at index, O(log n)"""
+        depth = 0
+        while len(self.levels[depth]) > 1:
+            level = self.levels[depth]
+            left_index = index & ~1
+            left = level[left_index]
+            right = level[left_index + 1] if left_index + 1 < len(level) else left
+            parent_hash = self.hash_pair(left, right)
+
+            if depth + 1 == len(self.levels):
+                self.levels.append([])
+            parent = self.levels[depth + 1]
+            index //= 2
+            if index < len(parent):
+                parent[index] = parent_hash
+            else:
+                parent.append(parent_hash)
+            depth += 1
+
+    def append(self, transaction, leaf_hash=None):
+        """Add a leaf and update the root along its path"""
+        if leaf_hash is None:
+            leaf_hash = self.hash_leaf(transaction)
+        self.transactions.append(transaction)
+        self.levels[0].append(leaf_hash)
+        self._update_path(len(self.levels[0]) - 1)
+        return self.root
+
+    def extend(self, transactions):
+        """Append several leaves, returning the new root"""
+        for transaction in transactions:
+            self.append(transaction)
+        return self.root
+
+    def update(self, index, transaction):
+        """Replace the leaf at index and update the root along its path"""
+        self.transactions[index] = transaction
+        self.levels[0][index] = self.hash_leaf(transaction)
+        self._update_path(index)
+        return self.root
+
+    def build_merkle_tree(self, transactions):
+        """Return the hex root of a fresh tree built from transactions"""
+        return MerkleTree(transactions).merkle_root
@@ -0,0 +1,141 @@
+import hashlib
+import multiprocessing
+import os
+import queue
+import time
+
+# Workers check the shared stop flag after this many attempts
+CHECK_INTERVAL = 4096
+MAX_NONCE = 2 ** 64
+# Seconds between checks that the workers are still alive while waiting for results
+RESULT_POLL = 0.5
+
+
+def difficulty_target(difficulty):
+  """Largest digest value whose hex form starts with `difficulty` zeros"""
+  return 1 << (256 - 4 * difficulty)
+
+
+def search_nonces(prefix, target, start, stop, step=1, stop_event=None):
+  """Scan nonces in range(start, stop, step) for a digest below target.
+
+  The constant header prefix is hashed once and its SHA-256 state copied
+  for every nonce. Returns (nonce, hex_digest, attempts); nonce is None
+  when the range was exhausted or the search was stopped.
+  """
+  midstate = hashlib.sha256(prefix)
+  attempts = 0
+  for nonce in range(start, stop, step):
+    sha = midstate.copy()
+    sha.update(str(nonce).encode())
+    digest = sha.digest()
+    attempts += 1
+    if int.from_bytes(digest, "big") < target:
+      return nonce, digest.hex(), attempts
+    if stop_event is not None and attempts % CHECK_INTERVAL == 0 and stop_event.is_set():
+      break
+  return None, None, attempts
+
+
+def _mining_worker(prefix, target, start, stop, step, stop_event, results):
+  nonce, block_hash, attempts = search_nonces(prefix, target, start, stop, step, stop_event)
+  if nonce is not None:
+    stop_event.set()
+  results.put((nonce, block_hash, attempts))
+
+
+class MiningResult:
+  def __init__(self, nonce, block_hash, attempts, elapsed):
+    self.nonce = nonce
+    self.hash = block_hash
+    self.attempts = attempts
+    self.elapsed = elapsed
+
+  @property
+  def hashrate(self):
+    """Hashes per second achieved by the search"""
+    return self.attempts / self.elapsed if self.elapsed > 0 else 0.0
+
+  def to_dict(self):
+    return {
+      "nonce" : self.nonce,
+      "hash" : self.hash,
+      "attempts" : self.attempts,
+      "elapsed" : self.elapsed,
+      "hashrate" : self.hashrate
+    }
+
+  def __str__(self):
+    return f"MiningResult(Nonce : {self.nonce}, Hashrate : {self.hashrate:.0f} H/s)"
+
+
+class ProofOfWorkMiner:
+  """Proof-of-work search split across worker processes.
+
+  Worker i tries nonces start + i, start + i + workers, ... so the nonce
+  space is partitioned without coordination, and the first worker to find
+  a solution sets a shared event that stops the others.
+  """
+
+  def __init__(self, workers=None):
+    self.workers = workers or os.cpu_count() or 1
+
+  def mine(self, block, difficulty=4, start_nonce=0, max_nonce=MAX_NONCE):
+    """Find a nonce for block, store it with the hash and return a MiningResult"""
+    prefix = block.header_prefix()
+    target = difficulty_target(difficulty)
+    started = time.perf_counter()
+
+    if self.workers == 1:
+      nonce, block_hash, attempts = search_nonces(prefix, target, start_nonce, max_nonce)
+    else:
+      nonce, block_hash, attempts = self._mine_parallel(prefix, target, start_nonce, max_nonce)
+
+    result = MiningResult(nonce, block_hash, attempts, time.perf_counter() - started)
+    if nonce is None:
+      raise Exception(f"No valid nonce found for block {block.index} below {max_nonce}")
+    block.nonce = nonce
+    block.hash = block_hash
+    return result
+
+  def _mine_parallel(self, prefix, target, start_nonce, max_nonce):
+    stop_event = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = [
+      multiprocessing.Process(
+        target=_mining_worker,
+        args=(prefix, target, start_nonce + i, max_nonce, self.workers, stop_event, results),
+        daemon=True
+      )
+      for i in range(self.workers)
+    ]
+    for process in processes:
+      process.start()
+
+    solution = (None, None)
+    attempts = 0
+    reported = 0
+    try:
+      while reported < len(processes):
+        try:
+          nonce, block_hash, worker_attempts = results.get(timeout=RESULT_POLL)
+        except queue.Empty:
+          # A worker that exits normally reports first, so a non-zero exit code means it died
+          dead = [process.exitcode for process in processes if process.exitcode not in (None, 0)]
+          if dead and solution[0] is not None:
+            break
+          if dead:
+            raise Exception(f"Mining worker died with exit code {dead[0]}")
+          continue
+        reported += 1
+        attempts += worker_attempts
+        if nonce is not None:
+          stop_event.set()
+          # Several workers can succeed in the same window; keep the lowest nonce
+          if solution[0] is None or nonce < solution[0]:
+            solution = (nonce, block_hash)
+    finally:
+      stop_event.set()
+      for process in processes:
+        process.join()
+    return solution[0], solution[1], attempts
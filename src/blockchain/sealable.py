@@ -0,0 +1,43 @@
+import sys
+
+
+def _refuse(self, name, value):
+  raise AttributeError(f"{type(self).__name__} is sealed, cannot set {name}")
+
+
+class Sealable:
+  """Base for slotted objects that become read-only once sealed.
+
+  seal() switches the instance to a read-only twin of its class, so open
+  objects pay nothing for the check and every assignment on a sealed one
+  raises. That is what makes caching derived values such as hashes on
+  sealed objects safe.
+  """
+
+  __slots__ = ()
+  sealed = False
+  sealed_class = None
+
+  def __setstate__(self, state):
+    # Unpickling sets slots directly, which a sealed instance would refuse
+    _, slots = state
+    for name, value in slots.items():
+      object.__setattr__(self, name, value)
+
+  def seal(self):
+    if not self.sealed:
+      self.__class__ = self.sealed_class
+    return self
+
+
+def sealable(cls):
+  """Class decorator creating the read-only twin that seal() switches to"""
+  name = f"Sealed{cls.__name__}"
+  sealed_class = type(name, (cls,), {
+    "__slots__" : (), "sealed" : True, "__setattr__" : _refuse,
+    "__module__" : cls.__module__, "__qualname__" : name,
+  })
+  # Registered in the module so sealed instances can be pickled for worker processes
+  setattr(sys.modules[cls.__module__], name, sealed_class)
+  cls.sealed_class = sealed_class
+  return cls
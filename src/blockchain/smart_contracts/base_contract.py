@@ -1,5 +1,6 @@
 import hashlib
 import time
+from contextlib import contextmanager
 
 class BaseContract:
   def __init__(self, creator_address):
@@ -19,11 +20,28 @@ class BaseContract:
     self.events.append(event)
     print(f"Event emitted : {event}")
 
+  @contextmanager
+  def atomic(self):
+    """Run a block of changes on a copy-on-write snapshot of the state, kept only if it does not raise"""
+    from src.blockchain.smart_contracts.state_view import StateView, apply_writes
+    state, events = self.state, self.events
+    self.state, self.events = StateView(state), []
+    try:
+      yield self.state
+      apply_writes(state, self.state.writes)
+      events.extend(self.events)
+    finally:
+      self.state, self.events = state, events
+
   def get_state(self):
     """Return the current state of the contract"""
     return self.state
   
-  def execute(self, *args, **kwargs):
-    """Execute the contract's main function -- To be overriden by subclasses"""
-    raise NotImplementedError("Subclasses must implement this method")
+  def execute(self, method, *args, **kwargs):
+    """Call one of the contract's methods atomically, its state changes are kept only if it succeeds"""
+    from src.blockchain.smart_contracts.execution import ContractCall, ExecutionEngine
+    outcome = ExecutionEngine(workers=1).execute([ContractCall(self, method, *args, **kwargs)])[0]
+    if outcome.error is not None:
+      raise outcome.error
+    return outcome.result
 
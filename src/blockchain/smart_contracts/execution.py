@@ -0,0 +1,153 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from src.blockchain.smart_contracts.state_view import StateView, WriteLog, apply_writes
+
+# Below this many calls forking workers costs more than it saves
+MIN_PARALLEL_CALLS = 256
+# Calls handed to a worker at a time
+CHUNK_SIZE = 512
+
+# Calls of the block being speculated, set in each worker by its pool's initializer
+_BLOCK = None
+
+
+class ContractCall:
+  """One call of a contract method, as scheduled in a block"""
+
+  def __init__(self, contract, method, *args, **kwargs):
+    self.contract = contract
+    self.method = method
+    self.args = args
+    self.kwargs = kwargs
+
+
+class CallResult:
+  __slots__ = ("result", "error", "reexecuted")
+
+  def __init__(self, result, error, reexecuted=False):
+    self.result = result
+    self.error = error
+    self.reexecuted = reexecuted
+
+  @property
+  def ok(self):
+    return self.error is None
+
+
+def run_call(call, view):
+  """Run a call with its contract's state replaced by view, returning (result, error, events)"""
+  # A shallow clone, so the call sees view and its own event list as self.state and self.events
+  contract = call.contract
+  scope = object.__new__(type(contract))
+  scope.__dict__.update(contract.__dict__, state=view, events=[])
+  try:
+    return getattr(scope, call.method)(*call.args, **call.kwargs), None, scope.events
+  except Exception as e:
+    return None, e, scope.events
+
+
+def _init_worker(block):
+  global _BLOCK
+  _BLOCK = block
+
+
+def _speculate_range(bounds):
+  """Run calls start..stop of the worker's block against the state at the start of the block"""
+  start, stop = bounds
+  outcomes = []
+  for index, call in _BLOCK[start:stop]:
+    view = StateView(call.contract.state, (index,))
+    result, error, events = run_call(call, view)
+    outcomes.append((view.reads, view.writes, result, error, events))
+  return outcomes
+
+
+class ExecutionEngine:
+  """Optimistic parallel execution of a block's contract calls.
+
+  1. Every call runs speculatively in a forked worker against the state
+     at the start of the block, through a StateView recording the keys
+     it read and buffering the ones it wrote.
+  2. Calls are then committed in block order. A call whose reads include
+     a key written by an earlier call of the block is run again against
+     the committed state; every other call's buffered writes are applied
+     as they are.
+
+  The outcome is the same as running the calls one by one in order, on
+  any number of workers. Calls are atomic: a call that raises leaves no
+  writes or events behind and its error is returned in its CallResult.
+
+  Each pool's workers receive the block through the pool initializer, so
+  engines may run concurrently. Forking copies locks held by other
+  threads, which can deadlock a worker, so workers are forked only while
+  the process has a single thread. Otherwise they are started from a
+  forkserver and the block is pickled to them. Without either start
+  method the block runs serially.
+  """
+
+  def __init__(self, workers=None, min_parallel=MIN_PARALLEL_CALLS, chunk_size=CHUNK_SIZE):
+    self.workers = workers or os.cpu_count() or 1
+    self.min_parallel = min_parallel
+    self.chunk_size = chunk_size
+
+  def execute(self, calls):
+    """Execute calls in block order, returning one CallResult per call"""
+    contracts = {}
+    block = [(contracts.setdefault(id(call.contract), len(contracts)), call) for call in calls]
+    speculated = None
+    start_method = self._start_method()
+    if self.workers > 1 and len(block) >= self.min_parallel and start_method is not None:
+      speculated = self._speculate(block, start_method)
+    if speculated is None:
+      return [self._commit(call, *self._run(index, call)) for index, call in block]
+
+    log = WriteLog()
+    results = []
+    for (index, call), (reads, writes, result, error, events) in zip(block, speculated):
+      reexecuted = log.conflicts(reads, 1)
+      if reexecuted:
+        writes, result, error, events = self._run(index, call)
+      results.append(self._commit(call, writes, result, error, events, reexecuted))
+      if error is None:
+        log.record(writes, 1)
+    return results
+
+  def _run(self, index, call):
+    view = StateView(call.contract.state, (index,))
+    result, error, events = run_call(call, view)
+    return view.writes, result, error, events
+
+  def _commit(self, call, writes, result, error, events, reexecuted=False):
+    if error is None:
+      apply_writes(call.contract.state, writes, 1)
+      call.contract.events.extend(events)
+    return CallResult(result, error, reexecuted)
+
+  @staticmethod
+  def _start_method():
+    """fork while no other thread runs, else forkserver, else None"""
+    methods = multiprocessing.get_all_start_methods()
+    if "fork" in methods and threading.active_count() == 1:
+      return "fork"
+    return "forkserver" if "forkserver" in methods else None
+
+  def _speculate(self, block, start_method):
+    """Outcomes of every call run against the current state, or None if the workers failed"""
+    chunk_size = max(1, min(self.chunk_size, -(-len(block) // self.workers)))
+    ranges = [(start, min(start + chunk_size, len(block))) for start in range(0, len(block), chunk_size)]
+    try:
+      with ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context(start_method),
+                               initializer=_init_worker, initargs=(block,)) as pool:
+        return [outcome for outcomes in pool.map(_speculate_range, ranges) for outcome in outcomes]
+    except Exception as e:
+      # Unpicklable calls or results, or a dead worker, run the block serially instead
+      print(f"Speculative execution failed, executing serially : {e}")
+      return None
+
+
+def execute_calls(calls, workers=None):
+  """Execute a block's contract calls with an ExecutionEngine"""
+  return ExecutionEngine(workers).execute(calls)
@@ -0,0 +1,194 @@
+import copy
+from collections.abc import MutableMapping
+
+_MISSING = object()
+_MUTABLE_TYPES = (dict, list, set)
+
+
+class _Deleted:
+  """Marks a key deleted in a write set; unpickles to the same object"""
+
+  def __reduce__(self):
+    return "DELETED"
+
+  def __repr__(self):
+    return "DELETED"
+
+
+DELETED = _Deleted()
+
+
+class StateView(MutableMapping):
+  """Contract state seen through one call: reads are recorded, writes are buffered.
+
+  Keys are tracked as paths (prefix + (key,)) for top-level entries and
+  (prefix + (key, sub)) for the entries of a top-level dict such as the
+  token balances, with sub None standing for a read of the whole map.
+  Mutable values below that are copied on first access and counted as
+  written. The underlying state is never touched until apply_writes(),
+  which makes a view a copy-on-write snapshot: dropping it rolls back.
+  """
+
+  def __init__(self, base, prefix=()):
+    self.base = base
+    self.prefix = prefix
+    self.reads = set()
+    self.writes = {}
+    self._maps = {}
+
+  def __getitem__(self, key):
+    path = self.prefix + (key,)
+    if path in self.writes:
+      value = self.writes[path]
+      if value is DELETED:
+        raise KeyError(key)
+      return value
+    value = self.base.get(key, _MISSING)
+    # Also wraps the maps of another view, so views can be stacked
+    if isinstance(value, (dict, TrackedMap)):
+      tracked = self._maps.get(key)
+      if tracked is None:
+        tracked = self._maps[key] = TrackedMap(self, key, value)
+      return tracked
+    self.reads.add(path)
+    if value is _MISSING:
+      raise KeyError(key)
+    if isinstance(value, _MUTABLE_TYPES):
+      value = self.writes[path] = copy.deepcopy(value)
+    return value
+
+  def _replace(self, key, value):
+    # A new top-level value supersedes every write below it
+    depth = len(self.prefix)
+    for path in [path for path in self.writes if len(path) > depth + 1 and path[depth] == key]:
+      del self.writes[path]
+    self._maps.pop(key, None)
+    self.writes[self.prefix + (key,)] = value
+
+  def __setitem__(self, key, value):
+    self._replace(key, value)
+
+  def __delitem__(self, key):
+    if key not in self:
+      raise KeyError(key)
+    self._replace(key, DELETED)
+
+  def __contains__(self, key):
+    path = self.prefix + (key,)
+    if path in self.writes:
+      return self.writes[path] is not DELETED
+    self.reads.add(path)
+    return key in self.base
+
+  def __iter__(self):
+    self.reads.add(self.prefix + (None,))
+    depth = len(self.prefix)
+    written = {path[depth] : value for path, value in self.writes.items() if len(path) == depth + 1}
+    keys = [key for key in self.base if written.get(key) is not DELETED]
+    keys.extend(key for key, value in written.items() if value is not DELETED and key not in self.base)
+    return iter(keys)
+
+  def __len__(self):
+    return sum(1 for _ in self)
+
+
+class TrackedMap(MutableMapping):
+  """One top-level dict of a StateView, tracking each of its keys separately"""
+
+  def __init__(self, view, key, base):
+    self.view = view
+    self.key = key
+    self.base = base
+    self.path = view.prefix + (key,)
+
+  def __getitem__(self, sub):
+    path = self.path + (sub,)
+    writes = self.view.writes
+    if path in writes:
+      value = writes[path]
+      if value is DELETED:
+        raise KeyError(sub)
+      return value
+    self.view.reads.add(path)
+    value = self.base.get(sub, _MISSING)
+    if value is _MISSING:
+      raise KeyError(sub)
+    if isinstance(value, _MUTABLE_TYPES):
+      value = writes[path] = copy.deepcopy(value)
+    return value
+
+  def __setitem__(self, sub, value):
+    self.view.writes[self.path + (sub,)] = value
+
+  def __delitem__(self, sub):
+    if sub not in self:
+      raise KeyError(sub)
+    self.view.writes[self.path + (sub,)] = DELETED
+
+  def __contains__(self, sub):
+    path = self.path + (sub,)
+    if path in self.view.writes:
+      return self.view.writes[path] is not DELETED
+    self.view.reads.add(path)
+    return sub in self.base
+
+  def __iter__(self):
+    self.view.reads.add(self.path + (None,))
+    depth = len(self.path)
+    written = {path[depth] : value for path, value in self.view.writes.items()
+               if len(path) == depth + 1 and path[:depth] == self.path}
+    keys = [sub for sub in self.base if written.get(sub) is not DELETED]
+    keys.extend(sub for sub, value in written.items() if value is not DELETED and sub not in self.base)
+    return iter(keys)
+
+  def __len__(self):
+    return sum(1 for _ in self)
+
+
+def apply_writes(state, writes, depth=0):
+  """Apply a view's write set to state, where each path starts after depth prefix entries"""
+  for path, value in writes.items():
+    key = path[depth]
+    if len(path) == depth + 1:
+      if value is DELETED:
+        state.pop(key, None)
+      else:
+        state[key] = value
+      continue
+    target = state.setdefault(key, {})
+    if value is DELETED:
+      target.pop(path[depth + 1], None)
+    else:
+      target[path[depth + 1]] = value
+
+
+class WriteLog:
+  """Paths written so far in a block, answering whether a read set is stale"""
+
+  def __init__(self):
+    self.paths = set()
+    self.maps = set() # Top-level paths with a write to one of their keys
+    self.prefixes = set() # Prefixes with a top-level write
+
+  def record(self, writes, depth):
+    for path in writes:
+      self.paths.add(path)
+      if len(path) == depth + 1:
+        self.prefixes.add(path[:depth])
+      else:
+        self.maps.add(path[:depth + 1])
+
+  def conflicts(self, reads, depth):
+    """True if any read may have seen a value an earlier write changed"""
+    paths = self.paths
+    for path in reads:
+      if path in paths:
+        return True
+      if len(path) == depth + 1:
+        if path in self.maps or (path[depth] is None and path[:depth] in self.prefixes):
+          return True
+        continue
+      parent = path[:depth + 1]
+      if parent in paths or (path[depth + 1] is None and parent in self.maps):
+        return True
+    return False
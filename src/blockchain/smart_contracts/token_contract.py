@@ -19,6 +19,26 @@ class TokenContract(BaseContract):
 
     self.emit_event("Transfer", {"from" : sender, "to" : recipient, "amount" : amount })
 
+  def transfer_batch(self, transfers):
+    """Apply (sender, recipient, amount) transfers in order, all of them or none"""
+    balances = self.state["balances"]
+    # Only the balances the batch changes, merged in once every transfer is valid
+    changed = {}
+    count = total = 0
+    for sender, recipient, amount in transfers:
+      if amount < 0:
+        raise Exception("Transfer amount cannot be negative")
+      available = changed[sender] if sender in changed else balances.get(sender)
+      if available is None or available < amount:
+        raise Exception(f"Insufficient balance for {sender}")
+      changed[sender] = available - amount
+      changed[recipient] = (changed[recipient] if recipient in changed else balances.get(recipient, 0)) + amount
+      count += 1
+      total += amount
+    balances.update(changed)
+
+    self.emit_event("BatchTransfer", {"count" : count, "amount" : total, "accounts" : len(changed) })
+
   def mint(self, recipient, amount):
     """Mint new tokens  and add them to a recipient's balance"""
     if self.creator_address !=  recipient:
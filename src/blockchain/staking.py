@@ -1,41 +1,39 @@
-import random
+from src.staking.sampler import StakeSampler
 
 class StakingSystem:
-  def __init__(self):
+  def __init__(self, seed=None):
     self.stakes = {}
+    self.sampler = StakeSampler(seed=seed)
     self.delegations = {}
     self.validator_candidates = {}
 
   def stake_tokens(self, node_id, amount):
       """Allow a node to stake tokens"""
-      if node_id in self.stakes:
-        self.stakes[node_id] += amount
-      else:
-        self.stakes[node_id] = amount
+      self._set_stake(node_id, self.stakes.get(node_id, 0) + amount)
       print(f"Node {node_id} stakes {amount}. Total stake : {self.stakes[node_id]}")
 
-  def select_validator(self):
+  def _set_stake(self, node_id, amount):
+    self.stakes[node_id] = amount
+    self.sampler.set_stake(node_id, amount)
+
+  def select_validator(self, seed=None):
       """Select a validator based on stake"""
-      total_stake = sum(self.stakes.value())
-      if total_stake == 0:
+      selected_node = self.sampler.sample(seed)
+      if selected_node is None:
         raise Exception("No stakes available for validation")
-      
-      weights = [stake/total_stake for stake in self.stakes.value()]
-      nodes = list(self.stakes.keys())
-      selected_node = random.choices(nodes, weights=weights, k=1)[0]
       print(f"Validator selected : {selected_node}")
       return selected_node
     
   def slash_tokens(self, node_id, penalty):
     """Penalize a node for misbehaviour"""
     if node_id in self.stakes:
-      self.stakes[node_id] = max(0, self.stakes[node_id] - penalty)
+      self._set_stake(node_id, max(0, self.stakes[node_id] - penalty))
       print(f"Node {node_id} penalized by {penalty}. Remaining stake : {self.stakes[node_id]}")
 
   def distribute_rewards(self, validator, reward_amount):
     """Distribute rewards to the validator"""
     if validator in self.stakes:
-      self.stakes[validator] += reward_amount
+      self._set_stake(validator, self.stakes[validator] + reward_amount)
       print(f"Validator {validator} rewarded with {reward_amount}. Total stake : {self.stakes[validator]}")
 
   def register_candidate(self, candidate_id):
@@ -78,7 +76,7 @@ class StakingSystem:
   def slash_validator(self, validator_id, penalty):
     """Penalize a validator for misbehaviour"""
     if validator_id in self.stakes:
-      self.stakes[validator_id] = max(0, self.stakes[validator_id] - penalty)
+      self._set_stake(validator_id, max(0, self.stakes[validator_id] - penalty))
       print(f"Validator {validator_id} slashed by {penalty}. Remaining stake : {self.stakes[validator_id]}")
       if self.stakes[validator_id] == 0:
         self.remove_validator(validator_id)
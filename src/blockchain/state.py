@@ -0,0 +1,106 @@
+_MISSING = object()
+
+
+class AccountState:
+  """Account balances and stakes with a per-block undo journal.
+
+  Reads and writes are plain dict operations. While a block is being
+  applied, the first write to each account records its previous balance
+  or stake, so reverting a block costs O(accounts it touched) and a reorg
+  only unwinds the blocks above the fork instead of replaying from genesis.
+  Every stake write, undos included, is passed to on_stake_change so a
+  validator sampler can follow the stakes.
+  """
+
+  def __init__(self, balances=None, max_journals=1000, on_stake_change=None):
+    self.balances = dict(balances or {})
+    self.stakes = {}
+    self.max_journals = max_journals
+    self.on_stake_change = on_stake_change
+    self.journals = {}
+    self._journal = None
+    self._stake_journal = None
+    self._height = None
+
+  def get_balance(self, address):
+    return self.balances.get(address, 0)
+
+  def set_balance(self, address, amount):
+    journal = self._journal
+    if journal is not None and address not in journal:
+      journal[address] = self.balances.get(address, _MISSING)
+    self.balances[address] = amount
+
+  def update_balance(self, address, delta):
+    self.set_balance(address, self.balances.get(address, 0) + delta)
+
+  def get_stake(self, address):
+    return self.stakes.get(address, 0)
+
+  def set_stake(self, address, amount):
+    """Set an address's stake, removing it from the stakers when amount is not positive"""
+    journal = self._stake_journal
+    if journal is not None and address not in journal:
+      journal[address] = self.stakes.get(address, _MISSING)
+    self._write_stake(address, amount if amount > 0 else _MISSING)
+
+  def update_stake(self, address, delta):
+    self.set_stake(address, self.stakes.get(address, 0) + delta)
+
+  def _write_stake(self, address, amount):
+    if amount is _MISSING:
+      self.stakes.pop(address, None)
+    else:
+      self.stakes[address] = amount
+    if self.on_stake_change is not None:
+      self.on_stake_change(address, 0 if amount is _MISSING else amount)
+
+  def begin_block(self, height):
+    """Start journaling the writes of the block at height"""
+    if self._journal is not None:
+      raise Exception(f"Block {self._height} is still being applied")
+    self._journal = {}
+    self._stake_journal = {}
+    self._height = height
+
+  def reopen_block(self, height):
+    """Journal further writes with the committed block at height, so reverting it undoes them too"""
+    if self._journal is not None:
+      raise Exception(f"Block {self._height} is still being applied")
+    self._journal, self._stake_journal = self.journals.get(height, ({}, {}))
+    self._height = height
+
+  def commit_block(self):
+    """Keep the current block's writes and store its undo journal"""
+    self.journals[self._height] = (self._journal, self._stake_journal)
+    self._journal = None
+    self._stake_journal = None
+    self._height = None
+    if self.max_journals is not None and len(self.journals) > self.max_journals:
+      del self.journals[min(self.journals)]
+
+  def abort_block(self):
+    """Undo every write of the block being applied"""
+    self._undo((self._journal, self._stake_journal))
+    self._journal = None
+    self._stake_journal = None
+    self._height = None
+
+  def revert_to(self, height):
+    """Undo every committed block above height, newest first"""
+    for block_height in sorted((h for h in self.journals if h > height), reverse=True):
+      self._undo(self.journals.pop(block_height))
+
+  def can_revert_to(self, height):
+    """True if the journals still reach back to the block after height"""
+    return not self.journals or min(self.journals) <= height + 1
+
+  def _undo(self, journal):
+    balances, stakes = journal
+    for address, previous in balances.items():
+      if previous is _MISSING:
+        self.balances.pop(address, None)
+      else:
+        self.balances[address] = previous
+    for address, previous in stakes.items():
+      self._write_stake(address, previous)
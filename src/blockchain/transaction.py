@@ -1,16 +1,46 @@
-from ecdsa import SECP256k1
+import hashlib
+import json
+from functools import lru_cache
+from ecdsa import SECP256k1, VerifyingKey
 from datetime import datetime
+from src.blockchain.sealable import Sealable, sealable
 from src.utils.Database import Database as db
 
+# Prefix of the encoding hashed for transactions that pay a fee
+FEE_HASH_VERSION = b"tx-v2:"
 
-class Transaction:
-  def __init__(self, sender, receiver, amount, signature=None, transaction_type = None, timestamp=None):
+
+@lru_cache(maxsize=4096)
+def load_verifying_key(public_key):
+  """Parse a hex encoded SECP256k1 public key, caching the result per key"""
+  return VerifyingKey.from_string(bytes.fromhex(public_key), curve=SECP256k1)
+
+
+def transaction_hash(sender, receiver, amount, transaction_type, timestamp, fee=0):
+  """Hash of the signed transaction fields, shared by objects and transaction dicts"""
+  if fee:
+    # A versioned JSON array keeps each field and its type apart, so no
+    # other timestamp and fee pair can produce the same bytes
+    fields = json.dumps([sender, receiver, amount, transaction_type, timestamp, fee], separators=(",", ":"), default=str)
+    return hashlib.sha256(FEE_HASH_VERSION + fields.encode()).hexdigest()
+  # Fee-less transactions keep the hashes they were signed with
+  transaction_string = f"{sender}{receiver}{amount}{transaction_type}{timestamp}"
+  return hashlib.sha256(transaction_string.encode()).hexdigest()
+
+
+@sealable
+class Transaction(Sealable):
+  __slots__ = ("sender", "receiver", "amount", "signature", "transaction_type", "timestamp", "fee", "_hash")
+
+  def __init__(self, sender, receiver, amount, signature=None, transaction_type = None, timestamp=None, fee=0):
     self.sender = sender
     self.receiver = receiver
     self.amount = amount
     self.signature = signature
     self.transaction_type = transaction_type
     self.timestamp = timestamp
+    self.fee = fee
+    self._hash = None
 
   def to_dict(self):
     """Convert the transaction to a dictionary"""
@@ -20,32 +50,47 @@ class Transaction:
       "amount" : self.amount,
       "signature" : self.signature,
       "transaction_type" : self.transaction_type,
-      "timestamp" : self.timestamp
+      "timestamp" : self.timestamp,
+      "fee" : self.fee
     }
   def save_to_db(self):
     """Save to database"""
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    query = """ INSERT INTO transactions (sender, receiver, amount, signature, transaction_type, timestamp) VALUES (%s, %s, %s, %s, %s, %s) """
-    cursor.execute(query, (self.sender, self.receiver, self.amount, self.signature, self.transaction_type, self.timestamp))
-    conn.commit()
-    db.release_connection(conn)
+    from src.blockchain.transaction_store import insert_transactions
+    insert_transactions([self])
+
+  @staticmethod
+  def save_many_to_db(transactions):
+    """Save many transactions with multi-row INSERTs and one commit"""
+    from src.blockchain.transaction_store import insert_transactions
+    return insert_transactions(transactions)
   
   def calculate_hash(self):
-    """Generate a unique hash for the transaction"""
-    import hashlib
-    transaction_string = f"{self.sender}{self.receiver}{self.amount}{self.transaction_type}{self.timestamp}"
-    return hashlib.sha256(transaction_string.encode()).hexdigest()
+    """Generate a unique hash for the transaction, computed once after sealing"""
+    if self._hash is not None:
+      return self._hash
+    digest = transaction_hash(self.sender, self.receiver, self.amount, self.transaction_type, self.timestamp, self.fee)
+    if self.sealed:
+      object.__setattr__(self, "_hash", digest)
+    return digest
+
+  def to_bytes(self):
+    """Canonical binary encoding, the same bytes the network codec sends"""
+    from src.network.messages import encode_payload
+    return bytes(encode_payload("TRANSACTION", self))
+
+  @staticmethod
+  def from_bytes(data):
+    from src.network.messages import decode_payload
+    return Transaction.from_dict(decode_payload("TRANSACTION", data))
   
   def is_valid(self, public_key):
     """Verify the transaction signature with the public key"""
-    from ecdsa import VerifyingKey, BadSignatureError
+    from ecdsa import BadSignatureError
     if self.sender == "Network" :
       return True
     
     try:
-      public_key_bytes = bytes.fromhex(public_key)
-      verifying_key = VerifyingKey.from_string(public_key_bytes, curve=SECP256k1)
+      verifying_key = load_verifying_key(public_key)
       verifying_key.verify(bytes.fromhex(self.signature), self.calculate_hash().encode())
       return True
     except BadSignatureError:
@@ -54,14 +99,18 @@ class Transaction:
   @staticmethod
   def from_dict(data):
     """Reconstruct a transaction from a dictionary"""
-    return Transaction(sender=data["sender"], receiver=data["receiver"], amount=data["amount"], signature=data.get("signature"), transaction_type=data.get("transaction_type", "TRANSFER"), timestamp=data.get("timestamp", datetime.now().timestamp()))
+    return Transaction(sender=data["sender"], receiver=data["receiver"], amount=data["amount"], signature=data.get("signature"), transaction_type=data.get("transaction_type", "TRANSFER"), timestamp=data.get("timestamp", datetime.now().timestamp()), fee=data.get("fee", 0)).seal()
 
   @staticmethod
   def load_from_db(transaction_id):
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    query = """SELECT * FROM transactions WHERE id = %s"""
-    cursor.execute(query, (transaction_id,))
-    row = cursor.fetchone()
-    db.release_connection(conn)
-    return Transaction(*row) if row else None
\ No newline at end of file
+    from src.blockchain.transaction_store import SELECT_TRANSACTIONS
+    with db.cursor() as cursor:
+      db.execute_prepared(cursor, SELECT_TRANSACTIONS + " WHERE id = %s", (transaction_id,))
+      row = cursor.fetchone()
+    return Transaction(*row) if row else None
+
+  @staticmethod
+  def stream_from_db(**filters):
+    """Iterate over stored transactions matching filters without loading them all at once"""
+    from src.blockchain.transaction_store import stream_transactions
+    return stream_transactions(**filters)
\ No newline at end of file
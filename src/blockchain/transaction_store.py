@@ -0,0 +1,179 @@
+import queue
+import threading
+import time
+
+from psycopg2.extras import execute_values
+
+from src.utils.Database import Database as db
+
+# In Transaction constructor order, so a row rebuilds the transaction it stored
+TRANSACTION_COLUMNS = ("sender", "receiver", "amount", "signature", "transaction_type", "timestamp", "fee")
+INSERT_TRANSACTIONS = f"INSERT INTO transactions ({', '.join(TRANSACTION_COLUMNS)}) VALUES %s"
+SELECT_TRANSACTIONS = f"SELECT {', '.join(TRANSACTION_COLUMNS)} FROM transactions"
+# Tables created before fees were stored lack the column
+ADD_FEE_COLUMN = "ALTER TABLE transactions ADD COLUMN IF NOT EXISTS fee DOUBLE PRECISION NOT NULL DEFAULT 0"
+# Conditions stream_transactions can filter on, each filled from one parameter
+TRANSACTION_FILTERS = {
+  "after_id" : "id > %s",
+  "sender" : "sender = %s",
+  "receiver" : "receiver = %s",
+  "transaction_type" : "transaction_type = %s",
+}
+# Rows per multi-row INSERT statement
+INSERT_PAGE_SIZE = 1000
+# Rows fetched per round trip by the streaming loader
+STREAM_BATCH = 2000
+
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+
+def transaction_row(transaction):
+  return (transaction.sender, transaction.receiver, transaction.amount, transaction.signature,
+          transaction.transaction_type, transaction.timestamp, transaction.fee or 0)
+
+
+def ensure_schema():
+  """Add the fee column to an older transactions table, once per process"""
+  global _schema_ready
+  with _schema_lock:
+    if not _schema_ready:
+      with db.cursor() as cursor:
+        cursor.execute(ADD_FEE_COLUMN)
+      _schema_ready = True
+
+
+def insert_transactions(transactions, page_size=INSERT_PAGE_SIZE):
+  """Insert transactions with multi-row INSERTs under a single commit"""
+  rows = [transaction_row(transaction) for transaction in transactions]
+  if not rows:
+    return 0
+  ensure_schema()
+  with db.cursor() as cursor:
+    execute_values(cursor, INSERT_TRANSACTIONS, rows, page_size=page_size)
+  return len(rows)
+
+
+def transaction_filters(**filters):
+  """Build a WHERE clause and its parameters from TRANSACTION_FILTERS, ignoring None values"""
+  conditions, params = [], []
+  for name, value in filters.items():
+    if name not in TRANSACTION_FILTERS:
+      raise ValueError(f"Unknown transaction filter : {name}")
+    if value is not None:
+      conditions.append(TRANSACTION_FILTERS[name])
+      params.append(value)
+  return (" WHERE " + " AND ".join(conditions) if conditions else ""), tuple(params)
+
+
+def stream_transactions(batch_size=STREAM_BATCH, **filters):
+  """Yield stored transactions in id order through a server-side cursor.
+
+  Postgres only sends batch_size rows per round trip, so memory stays flat
+  however many transactions are stored. filters are TRANSACTION_FILTERS
+  names, e.g. after_id=1000 or sender="alice", passed as query parameters.
+  """
+  from src.blockchain.transaction import Transaction
+  where, params = transaction_filters(**filters)
+  query = SELECT_TRANSACTIONS + where + " ORDER BY id"
+  with db.connection() as conn:
+    # Named cursors live inside the transaction the pool ends on release
+    with conn.cursor(name=f"stream_transactions_{threading.get_ident()}_{time.monotonic_ns()}") as cursor:
+      cursor.itersize = batch_size
+      cursor.execute(query, params)
+      for row in cursor:
+        yield Transaction(*row)
+
+
+class TransactionWriter:
+  """Persist transactions from a queue on a background thread.
+
+  submit() never touches the database: it only enqueues, so network
+  threads cannot block on Postgres. The writer drains up to batch_size
+  transactions, waiting at most max_delay for a batch to fill, and stores
+  each batch with insert_transactions in one commit.
+  """
+
+  def __init__(self, batch_size=5000, max_delay=0.2, queue_size=200000, retries=3):
+    self.batch_size = batch_size
+    self.max_delay = max_delay
+    self.retries = retries
+    self.queue = queue.Queue(maxsize=queue_size)
+    self.thread = None
+    self.written = 0
+    self.dropped = 0
+    self._closed = False
+
+  def start(self):
+    if self.thread is None:
+      self.thread = threading.Thread(target=self._run, daemon=True)
+      self.thread.start()
+    return self
+
+  def submit(self, transaction):
+    """Queue a transaction for storage; False if the queue is full"""
+    try:
+      self.queue.put_nowait(transaction)
+      return True
+    except queue.Full:
+      self.dropped += 1
+      print("Transaction writer queue is full, dropping transaction")
+      return False
+
+  def submit_many(self, transactions):
+    return sum(self.submit(transaction) for transaction in transactions)
+
+  def flush(self):
+    """Block until every queued transaction has been written"""
+    self.queue.join()
+
+  def close(self):
+    """Write what is queued and stop the writer thread"""
+    if self.thread is not None and not self._closed:
+      self._closed = True
+      self.queue.put(None)
+      self.thread.join()
+      self.thread = None
+
+  def _next_batch(self):
+    first = self.queue.get()
+    if first is None:
+      return None
+    batch = [first]
+    deadline = time.monotonic() + self.max_delay
+    while len(batch) < self.batch_size:
+      remaining = deadline - time.monotonic()
+      try:
+        transaction = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+      except queue.Empty:
+        break
+      if transaction is None:
+        # Put the stop marker back so the loop ends after this batch
+        self.queue.task_done()
+        self.queue.put(None)
+        break
+      batch.append(transaction)
+    return batch
+
+  def _write(self, batch):
+    for attempt in range(1, self.retries + 1):
+      try:
+        self.written += insert_transactions(batch)
+        return
+      except Exception as e:
+        print(f"Failed to store {len(batch)} transactions (attempt {attempt}) : {e}")
+        time.sleep(min(0.1 * 2 ** attempt, 2))
+    self.dropped += len(batch)
+
+  def _run(self):
+    while True:
+      batch = self._next_batch()
+      if batch is None:
+        self.queue.task_done()
+        return
+      try:
+        self._write(batch)
+      finally:
+        for _ in batch:
+          self.queue.task_done()
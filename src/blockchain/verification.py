@@ -0,0 +1,92 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from ecdsa import BadSignatureError
+from ecdsa.errors import MalformedPointError
+
+from src.blockchain.transaction import load_verifying_key
+
+# Below this many signatures the process pool costs more than it saves
+MIN_PARALLEL_BATCH = 64
+
+
+def verify_signature_jobs(jobs):
+  """Verify (public_key, signature, message) tuples, returning a list of bools"""
+  results = []
+  for public_key, signature, message in jobs:
+    try:
+      load_verifying_key(public_key).verify(bytes.fromhex(signature), message)
+      results.append(True)
+    except (BadSignatureError, MalformedPointError, ValueError, TypeError):
+      results.append(False)
+  return results
+
+
+class BatchVerifier:
+  """Verify many transaction signatures at once.
+
+  Jobs are grouped by sender so every worker parses each verifying key at
+  most once, then spread over a process pool in contiguous chunks.
+  """
+
+  def __init__(self, workers=None, chunk_size=256):
+    self.workers = workers or os.cpu_count() or 1
+    self.chunk_size = chunk_size
+    self._executor = None
+
+  def verify(self, transactions, public_keys):
+    """Return one bool per transaction, in input order.
+
+    public_keys maps a transaction sender to its hex encoded public key.
+    Transactions sent by the Network are always valid; unknown senders and
+    unsigned transactions are invalid.
+    """
+    results = [False] * len(transactions)
+    positions = []
+    jobs = []
+    for position, transaction in enumerate(transactions):
+      if transaction.sender == "Network":
+        results[position] = True
+        continue
+      public_key = public_keys.get(transaction.sender)
+      if public_key is None or transaction.signature is None:
+        continue
+      positions.append(position)
+      jobs.append((public_key, transaction.signature, transaction.calculate_hash().encode()))
+
+    # Keep each sender's jobs together so key parsing is cached per chunk
+    order = sorted(range(len(jobs)), key=lambda i: jobs[i][0])
+    jobs = [jobs[i] for i in order]
+    positions = [positions[i] for i in order]
+
+    for position, valid in zip(positions, self._run(jobs)):
+      results[position] = valid
+    return results
+
+  def _run(self, jobs):
+    if self.workers == 1 or len(jobs) < MIN_PARALLEL_BATCH:
+      return verify_signature_jobs(jobs)
+
+    chunk_size = max(1, min(self.chunk_size, -(-len(jobs) // self.workers)))
+    chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+    if self._executor is None:
+      self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    verified = []
+    for chunk_results in self._executor.map(verify_signature_jobs, chunks):
+      verified.extend(chunk_results)
+    return verified
+
+  def close(self):
+    if self._executor is not None:
+      self._executor.shutdown()
+      self._executor = None
+
+
+def verify_transactions(transactions, public_keys, workers=None):
+  """Verify a batch of transactions with a short-lived BatchVerifier"""
+  verifier = BatchVerifier(workers)
+  try:
+    return verifier.verify(transactions, public_keys)
+  finally:
+    verifier.close()
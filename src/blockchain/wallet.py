@@ -16,6 +16,17 @@ class Wallet:
 
         self.balance = 100  # Default balance
 
+    @classmethod
+    def from_private_key(cls, private_key):
+        """Build a wallet around an existing SigningKey or hex encoded secret"""
+        if isinstance(private_key, str):
+            from src.blockchain.keystore import load_signing_key
+            private_key = load_signing_key(private_key)
+        wallet = cls(address=hashlib.sha256(private_key.get_verifying_key().to_string()).hexdigest())
+        wallet.private_key = private_key
+        wallet.public_key = private_key.get_verifying_key()
+        return wallet
+
     def sign_transaction(self, transaction_data):
         """Sign transaction data with the private key"""
         if not hasattr(self, 'private_key'):
@@ -1,27 +1,78 @@
-from network.peer_discovery import BootstrapNode
-from network.node import Node
+import asyncio
+
+from src.network.peer_discovery import BootstrapNode, RateLimiter, parse_address
+
+# Longest request line accepted from a peer
+MAX_LINE = 1024
+# Seconds a connection may stay idle before it is closed
+IDLE_TIMEOUT = 10.0
+
+
+class BootstrapServer:
+  """Serves REGISTER requests for many nodes at once from one event loop.
+
+  Each request is a line "REGISTER host:port" answered with a comma
+  separated sample of other live peers, "ERROR" for a malformed request
+  or address, or "RATE_LIMITED" when the source host exceeds its token
+  bucket. A connection may send several requests.
+  """
+
+  def __init__(self, bootstrap_node=None, rate_limiter=None, idle_timeout=IDLE_TIMEOUT):
+    self.bootstrap_node = bootstrap_node or BootstrapNode()
+    self.rate_limiter = rate_limiter or RateLimiter()
+    self.idle_timeout = idle_timeout
+    self.server = None
+
+  async def start(self, host, port):
+    self.server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_LINE)
+    print(f"Bootstrap node running on {host}:{port} ...")
+    return self.server
+
+  async def close(self):
+    if self.server is not None:
+      self.server.close()
+      await self.server.wait_closed()
+
+  def handle_request(self, line, source):
+    """The response line for one request from source"""
+    parts = line.split()
+    if len(parts) != 2 or parts[0] != "REGISTER" or parse_address(parts[1]) is None:
+      return "ERROR"
+    if not self.rate_limiter.allow(source):
+      return "RATE_LIMITED"
+    return ",".join(self.bootstrap_node.register_peer(parts[1]))
+
+  async def handle_connection(self, reader, writer):
+    source = (writer.get_extra_info("peername") or ("unknown",))[0]
+    try:
+      while True:
+        line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+        if not line:
+          break
+        writer.write((self.handle_request(line.decode(errors="replace"), source) + "\n").encode())
+        await writer.drain()
+    except (asyncio.TimeoutError, asyncio.LimitOverrunError, ValueError, ConnectionError):
+      pass
+    finally:
+      writer.close()
 
-bootstrap_node = BootstrapNode()
 
 def start_bootstrap_server(host, port):
-  import socket
-  server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-  server.bind((host, port))
-  server.listen(5)
-  print(f"Bootstrap node running on {host}:{port} ...")
-
-  while True:
-    conn, addr = server.accept()
-    data = conn.recv(1024).decode()
-    if data.startswith("REGISTER"):
-      _, address = data.split()
-      peers = bootstrap_node.register_peer(address)
-      conn.send(",".join(peers).encode())
-    conn.close()
+  """Run a bootstrap server in the current thread until interrupted"""
+  async def serve():
+    server = await BootstrapServer().start(host, port)
+    async with server:
+      await server.serve_forever()
+  asyncio.run(serve())
 
 
 if __name__ == "__main__":
-  start_bootstrap_server("127.0.0.1", 8000)
+  from src.network.node import Node
+  from src.network.p2p import EventLoopThread
+
+  event_loop = EventLoopThread()
+  event_loop.start()
+  event_loop.submit(BootstrapServer().start("127.0.0.1", 8000)).result()
   node = Node("127.0.0.1", 5000)
-  node.connect_to_bootstrap("127.0.0.1", 8000)
-  node.start()
\ No newline at end of file
+  node.connect_to_bootstrap_node("127.0.0.1", 8000)
+  node.start()
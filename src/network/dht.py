@@ -1,29 +1,231 @@
+import asyncio
 import hashlib
-from collections import defaultdict
+import heapq
+import threading
+from collections import OrderedDict
+
+from src.network.messages import FRAME_HEADER, decode_header, decode_message, encode_message
+
+# Peers per bucket and per lookup result
+K = 20
+# Peers queried concurrently in each round of a lookup
+ALPHA = 3
+ID_BITS = 256
+
+
+class KBucket:
+    """Up to k peers ordered from least to most recently seen.
+
+    A full bucket keeps its long-lived peers: newcomers wait in a bounded
+    replacement cache and are promoted only when a resident peer is removed.
+    """
+
+    def __init__(self, k=K):
+        self.k = k
+        self.peers = OrderedDict()
+        self.replacements = OrderedDict()
+
+    def __len__(self):
+        return len(self.peers)
+
+    def add(self, peer_id, peer_address):
+        """Insert or refresh a peer; returns the least recently seen peer if the bucket is full"""
+        if peer_id in self.peers:
+            self.peers[peer_id] = peer_address
+            self.peers.move_to_end(peer_id)
+            return None
+        if len(self.peers) < self.k:
+            self.peers[peer_id] = peer_address
+            return None
+        self.replacements[peer_id] = peer_address
+        self.replacements.move_to_end(peer_id)
+        if len(self.replacements) > self.k:
+            self.replacements.popitem(last=False)
+        return next(iter(self.peers.items()))
+
+    def remove(self, peer_id):
+        """Evict a peer and promote the most recently seen replacement"""
+        if self.peers.pop(peer_id, None) is None:
+            self.replacements.pop(peer_id, None)
+            return
+        if self.replacements:
+            replacement_id, replacement_address = self.replacements.popitem(last=True)
+            self.peers[replacement_id] = replacement_address
+
 
 class DHT:
-    def __init__(self):
+    """Kademlia routing table over 256-bit ids with iterative lookups.
+
+    Peers are kept in one k-bucket per XOR distance bit length. closest_peers
+    walks the buckets outward from the target's, and lookup walks towards
+    the target by querying alpha peers at a time, which finishes in
+    O(log n) rounds. A newcomer for a full bucket only gets in once the
+    bucket's least recently seen peer fails a ping. The routing table is
+    shared by network threads and the event loop, so it is guarded by a lock.
+    """
+
+    def __init__(self, k=K, alpha=ALPHA, ping=None):
         self.node_id = None  # Initialize node_id directly
-        self.routing_table = defaultdict(list)
+        self.k = k
+        self.alpha = alpha
+        # Coroutine function pinging an address, raising if the peer does not answer
+        self.ping = ping
+        self.routing_table = [KBucket(k) for _ in range(ID_BITS + 1)]
+        self.lock = threading.RLock()
+        self._pinging = set()
+        # Eviction pings started by lookups, referenced until they finish
+        self._background = set()
 
     def set_node_id(self, public_key):
         """Set the node's unique ID using the hash of its public key"""
         self.node_id = hashlib.sha256(public_key.encode()).hexdigest()  # Corrected the attribute name
 
+    def distance(self, peer_id, target_id=None):
+        return int(peer_id, 16) ^ int(target_id or self.node_id, 16)
+
     def add_peer(self, peer_id, peer_address):
-        """Add a peer to the DHT routing table"""
-        bucket = self._get_bucket(peer_id)
-        if peer_address not in bucket:
-            bucket.append(peer_address)
+        """Add a peer to the DHT routing table.
+
+        Returns None, or the (id, address) of the least recently seen peer in
+        a full bucket; the caller should ping it and remove_peer() it if it
+        does not answer, which lets the newcomer in. learn() does both.
+        """
+        if peer_id == self.node_id:
+            return None
+        with self.lock:
+            return self._get_bucket(peer_id).add(peer_id, peer_address)
+
+    def remove_peer(self, peer_id):
+        with self.lock:
+            self._get_bucket(peer_id).remove(peer_id)
+
+    async def learn(self, peer_id, peer_address, ping=None):
+        """Add a peer, pinging the least recently seen peer of its bucket first if it is full.
+
+        An unresponsive peer is evicted, which promotes the newcomer from the
+        replacement cache. A peer that answers is kept, since long-lived peers
+        are the likeliest to stay, and the newcomer waits as a replacement.
+        """
+        await self._ping_oldest(self.add_peer(peer_id, peer_address), ping)
+
+    def learn_soon(self, peer_id, peer_address, ping=None):
+        """Add a peer now and leave any eviction ping to a background task"""
+        oldest = self.add_peer(peer_id, peer_address)
+        if oldest is None or (ping or self.ping) is None or oldest[0] in self._pinging:
+            return None
+        task = asyncio.ensure_future(self._ping_oldest(oldest, ping))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    async def _ping_oldest(self, oldest, ping=None):
+        """Evict the least recently seen peer of a full bucket if it does not answer"""
+        ping = ping or self.ping
+        if oldest is None or ping is None or oldest[0] in self._pinging:
+            return
+        oldest_id, oldest_address = oldest
+        self._pinging.add(oldest_id)
+        try:
+            await ping(oldest_address)
+        except Exception:
+            self.remove_peer(oldest_id)
+        else:
+            self.add_peer(oldest_id, oldest_address)
+        finally:
+            self._pinging.discard(oldest_id)
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(bucket) for bucket in self.routing_table)
+
+    def closest_peers(self, target_id, count=None):
+        """The count (default k) known peers closest to target_id as (id, address) pairs.
+
+        With L the bucket index of the target, peers of bucket L are closer to
+        it than those of every bucket below L, which are closer than those of
+        bucket L + 1, L + 2 and so on. Buckets are read in that order and the
+        walk stops once count peers are collected, so only the buckets near
+        the target are touched.
+        """
+        count = count or self.k
+        target = int(target_id, 16)
+        nearest = self.distance(target_id).bit_length()
+        groups = [(nearest,), range(nearest), range(nearest + 1, ID_BITS + 1)]
+        closest = []
+        with self.lock:
+            for group in groups[:2]:
+                closest += heapq.nsmallest(count - len(closest), self._bucket_peers(group), key=lambda peer: int(peer[0], 16) ^ target)
+            for index in groups[2]:
+                if len(closest) >= count:
+                    break
+                closest += heapq.nsmallest(count - len(closest), self._bucket_peers((index,)), key=lambda peer: int(peer[0], 16) ^ target)
+        return closest
+
+    def _bucket_peers(self, indexes):
+        return [peer for index in indexes for peer in self.routing_table[index].peers.items()]
 
     def get_peers(self, target_id):
         """Find the closest peers to the target ID"""
-        bucket = self._get_bucket(target_id)
-        return bucket
+        return [address for _, address in self.closest_peers(target_id)]
 
     def _get_bucket(self, target_id):
         """Determine the bucket based on XOR distance"""
         # XOR the node_id and target_id, then calculate the bit length to find the bucket
-        distance = int(self.node_id, 16) ^ int(target_id, 16)  # Correct XOR operation
-        bucket_index = distance.bit_length()
-        return self.routing_table[bucket_index]
+        return self.routing_table[self.distance(target_id).bit_length()]
+
+    async def lookup(self, target_id, find_node, count=None):
+        """Iteratively find the count peers closest to target_id across the network.
+
+        find_node(address, target_id) is awaited for alpha peers at a time and
+        must return the (id, address) pairs that peer knows closest to the
+        target. Peers that answer are learned into the routing table, with any
+        eviction ping left to run in the background so it never holds up a
+        round; peers they report only join the shortlist until they answer
+        themselves. Peers that fail are removed. The search stops once the
+        closest count peers seen have all been queried. Returns (closest
+        peers, rounds).
+        """
+        count = count or self.k
+        target = int(target_id, 16)
+        # Without a ping of its own the table pings with a FIND_NODE for our id
+        ping = self.ping or (lambda address: find_node(address, self.node_id))
+        shortlist = dict(self.closest_peers(target_id, count))
+        queried = set()
+        rounds = 0
+        while True:
+            closest = heapq.nsmallest(count, shortlist.items(), key=lambda peer: int(peer[0], 16) ^ target)
+            pending = [peer for peer in closest if peer[0] not in queried][:self.alpha]
+            if not pending:
+                return closest, rounds
+            rounds += 1
+            queried.update(peer_id for peer_id, _ in pending)
+            answers = await asyncio.gather(
+                *(find_node(address, target_id) for _, address in pending), return_exceptions=True
+            )
+            for (peer_id, address), answer in zip(pending, answers):
+                if isinstance(answer, Exception):
+                    shortlist.pop(peer_id, None)
+                    self.remove_peer(peer_id)
+                    continue
+                self.learn_soon(peer_id, address, ping)
+                for found_id, found_address in answer:
+                    if found_id != self.node_id and found_id not in shortlist:
+                        shortlist[found_id] = found_address
+
+
+async def request_nodes(address, target_id, sender=None, timeout=5.0):
+    """Ask the node at "host:port" for its closest peers to target_id over one short connection"""
+    host, port = address.rsplit(":", 1)
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, int(port)), timeout)
+    try:
+        writer.write(encode_message({ "type" : "FIND_NODE", "data" : { "target" : target_id, "sender" : sender } }))
+        await writer.drain()
+        header = await asyncio.wait_for(reader.readexactly(FRAME_HEADER.size), timeout)
+        message_type, length = decode_header(header)
+        payload = await asyncio.wait_for(reader.readexactly(length), timeout)
+        message = decode_message(message_type, payload)
+        if message["type"] != "NODES":
+            raise ValueError(f"Expected NODES, got {message['type']}")
+        return [tuple(peer) for peer in message["data"]]
+    finally:
+        writer.close()
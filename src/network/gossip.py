@@ -0,0 +1,145 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from src.network.messages import create_block_message, create_transaction_message, send_message
+
+# Hashes remembered as already seen
+SEEN_CACHE_SIZE = 100000
+# Announced payloads kept to answer GET_DATA, and for how long
+RELAY_CACHE_SIZE = 10000
+RELAY_CACHE_TTL = 15 * 60
+# Seconds before an unanswered GET_DATA may be sent to another peer
+REQUEST_TIMEOUT = 10.0
+# Peers each new item is announced to
+RELAY_FANOUT = 8
+# Most hashes read from one INV or GET_DATA message
+MAX_INVENTORY = 5000
+
+INVENTORY_KINDS = ("transactions", "blocks")
+
+_MISSING = object()
+
+
+class SeenCache:
+  """Bounded LRU map of hashes, dropping entries older than ttl seconds if set.
+
+  The least recently added hash is evicted once capacity is reached, so
+  memory stays flat no matter how much traffic passes through.
+  """
+
+  def __init__(self, capacity=SEEN_CACHE_SIZE, ttl=None):
+    self.capacity = capacity
+    self.ttl = ttl
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+
+  def __len__(self):
+    return len(self.entries)
+
+  def __contains__(self, key):
+    return self.get(key, _MISSING) is not _MISSING
+
+  def _expired(self, added, now):
+    return self.ttl is not None and now - added > self.ttl
+
+  def add(self, key, value=None, now=None):
+    """Remember key, returns False if it was already present"""
+    now = time.monotonic() if now is None else now
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is not None and not self._expired(entry[0], now):
+        return False
+      self.entries[key] = (now, value)
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.capacity:
+        self.entries.popitem(last=False)
+      return True
+
+  def get(self, key, default=None, now=None):
+    now = time.monotonic() if now is None else now
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None:
+        return default
+      if self._expired(entry[0], now):
+        del self.entries[key]
+        return default
+      return entry[1]
+
+  def discard(self, key):
+    with self.lock:
+      self.entries.pop(key, None)
+
+
+def inventory_message(kind, hashes):
+  return { "type" : "INV", "data" : { kind : list(hashes) } }
+
+
+class Gossip:
+  """Inventory based relay of transactions and blocks.
+
+  Instead of forwarding every payload to every peer, a node announces the
+  hashes of new items (INV) to a random subset of RELAY_FANOUT peers. A
+  peer asks for the ones it has not seen (GET_DATA) and the payloads are
+  sent back on the same connection, so each item crosses a link at most
+  once and bandwidth grows with the fan-out rather than with the network.
+  Hashes that were seen, or were requested less than REQUEST_TIMEOUT ago,
+  are never fetched twice.
+  """
+
+  def __init__(self, node, fanout=RELAY_FANOUT):
+    self.node = node
+    self.fanout = fanout
+    self.seen = SeenCache()
+    self.requested = SeenCache(ttl=REQUEST_TIMEOUT)
+    self.relay_cache = SeenCache(RELAY_CACHE_SIZE, ttl=RELAY_CACHE_TTL)
+
+  def accept(self, item_hash):
+    """Mark an incoming payload as seen, returns False for duplicates"""
+    self.requested.discard(item_hash)
+    return self.seen.add(item_hash)
+
+  def remember(self, item_hash, message):
+    """Keep a payload we originate or relay so peers can fetch it"""
+    self.seen.add(item_hash)
+    self.relay_cache.add(item_hash, message)
+
+  def announce(self, kind, item_hash, message):
+    """Relay an accepted item to a random subset of peers"""
+    self.remember(item_hash, message)
+    node = self.node
+    if node.peer_pool is not None:
+      node.peer_pool.relay(inventory_message(kind, [item_hash]), self.fanout)
+      return
+    # Plain sockets never read replies, so push the payload itself
+    for peer in random.sample(node.peers, min(self.fanout, len(node.peers))):
+      send_message(peer, message)
+
+  def handle_inv(self, inventory, reply):
+    """Request the announced items we have neither seen nor already asked for"""
+    wanted = {}
+    for kind in INVENTORY_KINDS:
+      for item_hash in inventory.get(kind, ())[:MAX_INVENTORY]:
+        if item_hash not in self.seen and self.requested.add(item_hash):
+          wanted.setdefault(kind, []).append(item_hash)
+    if wanted:
+      reply({ "type" : "GET_DATA", "data" : wanted })
+
+  def handle_get_data(self, request, reply):
+    """Send back the requested items we still have"""
+    for kind in INVENTORY_KINDS:
+      for item_hash in request.get(kind, ())[:MAX_INVENTORY]:
+        message = self.relay_cache.get(item_hash) or self._lookup(kind, item_hash)
+        if message is not None:
+          reply(message)
+
+  def _lookup(self, kind, item_hash):
+    blockchain = self.node.blockchain
+    if kind == "transactions":
+      mempool = getattr(blockchain, "mempool", None)
+      transaction = mempool.get(item_hash) if mempool is not None else None
+      return create_transaction_message(transaction) if transaction is not None else None
+    block = blockchain.find_block(item_hash) if hasattr(blockchain, "find_block") else None
+    return create_block_message(block) if block is not None else None
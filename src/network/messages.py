@@ -1,5 +1,388 @@
+import json
+import re
+import struct
+
+# Frame layout : magic (2 bytes), message type code (1 byte), payload length (4 bytes)
+MAGIC = b"PC"
+FRAME_HEADER = struct.Struct(">2sBI")
+MAX_MESSAGE_SIZE = 32 * 1024 * 1024
+# Bytes read at a time from a socket, so memory follows the bytes a peer really sends
+READ_CHUNK_SIZE = 64 * 1024
+
+MESSAGE_TYPES = {
+  "BLOCK" : 1,
+  "TRANSACTION" : 2,
+  "REQUEST_CHAIN" : 3,
+  "CHAIN_RESPONSE" : 4,
+  "PEER_UPDATE" : 5,
+  "SECURE_MESSAGE" : 6,
+  "TIP" : 7,
+  "GET_HEADERS" : 8,
+  "HEADERS" : 9,
+  "GET_BLOCKS" : 10,
+  "BLOCKS" : 11,
+  "FIND_NODE" : 12,
+  "NODES" : 13,
+  "INV" : 14,
+  "GET_DATA" : 15,
+  "HANDSHAKE" : 16,
+  "HANDSHAKE_FINISH" : 17,
+  "SESSION_ERROR" : 18,
+}
+# Payloads that are a list of blocks or block headers
+BLOCK_LIST_MESSAGES = {"CHAIN_RESPONSE", "HEADERS", "BLOCKS"}
+MESSAGE_NAMES = {code : name for name, code in MESSAGE_TYPES.items()}
+
+TRANSACTION_FIELDS = ("sender", "receiver", "amount", "signature", "transaction_type", "timestamp", "fee")
+FULL_TRANSACTION = (1 << len(TRANSACTION_FIELDS)) - 1
+# Fields Transaction.from_dict cannot default
+REQUIRED_TRANSACTION_FIELDS = ("sender", "receiver", "amount")
+
+# Field tags
+NONE = 0
+TEXT = 1
+HEX = 2
+INT = 1
+FLOAT = 2
+TX_LIST = 0
+TX_JSON = 1
+TX_NONE = 2
+
+_DOUBLE = struct.Struct(">d")
+_HEX_STRING = re.compile(r"(?:[0-9a-f]{2})+\Z")
+
+
 def create_block_message(block):
   return { "type" : "BLOCK", "data" : block.to_dict() }
 
 def create_transaction_message(transaction):
-  return { "type" : "TRANSACTION", "data" : transaction.to_dict() }
\ No newline at end of file
+  return { "type" : "TRANSACTION", "data" : transaction.to_dict() }
+
+
+class ProtocolError(Exception):
+  """Raised when a peer sends a malformed or oversized frame"""
+
+
+# Primitive encoders
+
+def _write_varint(buf, value):
+  while value > 0x7f:
+    buf.append((value & 0x7f) | 0x80)
+    value >>= 7
+  buf.append(value)
+
+def _read_varint(data, offset):
+  result = 0
+  shift = 0
+  while True:
+    byte = data[offset]
+    offset += 1
+    result |= (byte & 0x7f) << shift
+    if byte < 0x80:
+      return result, offset
+    shift += 7
+
+def _write_text(buf, value):
+  """Strings, with lowercase hex (hashes, signatures, keys) packed as raw bytes"""
+  if value is None:
+    buf.append(NONE)
+    return
+  if _HEX_STRING.match(value):
+    raw = bytes.fromhex(value)
+    buf.append(HEX)
+  else:
+    raw = value.encode()
+    buf.append(TEXT)
+  if len(raw) < 0x80:
+    buf.append(len(raw))
+  else:
+    _write_varint(buf, len(raw))
+  buf += raw
+
+def _read_text(data, offset):
+  tag = data[offset]
+  if tag == NONE:
+    return None, offset + 1
+  length = data[offset + 1]
+  offset += 2
+  if length >= 0x80:
+    length, offset = _read_varint(data, offset - 1)
+  raw = data[offset:offset + length]
+  offset += length
+  if tag == HEX:
+    return raw.hex(), offset
+  return str(raw, "utf-8"), offset
+
+def _write_number(buf, value):
+  """Amounts and timestamps : zigzag varint for ints, IEEE double for floats"""
+  if value is None:
+    buf.append(NONE)
+  elif isinstance(value, int) and not isinstance(value, bool):
+    buf.append(INT)
+    _write_varint(buf, value * 2 if value >= 0 else -value * 2 - 1)
+  else:
+    buf.append(FLOAT)
+    buf += _DOUBLE.pack(value)
+
+def _read_number(data, offset):
+  tag = data[offset]
+  if tag == NONE:
+    return None, offset + 1
+  if tag == INT:
+    value, offset = _read_varint(data, offset + 1)
+    return (value >> 1) ^ -(value & 1), offset
+  return _DOUBLE.unpack_from(data, offset + 1)[0], offset + 9
+
+def _write_json(buf, value):
+  raw = json.dumps(value, separators=(",", ":")).encode()
+  _write_varint(buf, len(raw))
+  buf += raw
+
+def _read_json(data, offset):
+  length, offset = _read_varint(data, offset)
+  return json.loads(bytes(data[offset:offset + length])), offset + length
+
+
+# Transactions and blocks
+
+def _is_plain_transaction(transaction):
+  if isinstance(transaction, dict):
+    return all(key in TRANSACTION_FIELDS for key in transaction)
+  # Transaction objects are written straight from their slots
+  return hasattr(transaction, "calculate_hash") and hasattr(transaction, "fee")
+
+def _write_transaction(buf, transaction):
+  if not isinstance(transaction, dict):
+    buf.append(FULL_TRANSACTION)
+    _write_text(buf, transaction.sender)
+    _write_text(buf, transaction.receiver)
+    _write_number(buf, transaction.amount)
+    _write_text(buf, transaction.signature)
+    _write_text(buf, transaction.transaction_type)
+    _write_number(buf, transaction.timestamp)
+    _write_number(buf, transaction.fee)
+    return
+  # Bitmask of the fields present, so absent keys stay absent after decoding
+  present = 0
+  for bit, field in enumerate(TRANSACTION_FIELDS):
+    if field in transaction:
+      present |= 1 << bit
+  buf.append(present)
+  get = transaction.get
+  _write_text(buf, get("sender"))
+  _write_text(buf, get("receiver"))
+  _write_number(buf, get("amount"))
+  _write_text(buf, get("signature"))
+  _write_text(buf, get("transaction_type"))
+  _write_number(buf, get("timestamp"))
+  _write_number(buf, get("fee"))
+
+def _read_transaction(data, offset):
+  present = data[offset]
+  offset += 1
+  sender, offset = _read_text(data, offset)
+  receiver, offset = _read_text(data, offset)
+  amount, offset = _read_number(data, offset)
+  signature, offset = _read_text(data, offset)
+  transaction_type, offset = _read_text(data, offset)
+  timestamp, offset = _read_number(data, offset)
+  fee, offset = _read_number(data, offset)
+  transaction = {
+    "sender" : sender,
+    "receiver" : receiver,
+    "amount" : amount,
+    "signature" : signature,
+    "transaction_type" : transaction_type,
+    "timestamp" : timestamp,
+    "fee" : fee
+  }
+  if present != FULL_TRANSACTION:
+    for bit, field in enumerate(TRANSACTION_FIELDS):
+      if not present & (1 << bit):
+        del transaction[field]
+  return transaction, offset
+
+def _write_block(buf, block):
+  _write_varint(buf, block["index"])
+  _write_number(buf, block["timestamp"])
+  _write_text(buf, block["previous_hash"])
+  _write_text(buf, block["merkle_root"])
+  _write_text(buf, block["hash"])
+  _write_varint(buf, block["nonce"])
+  if "transactions" not in block:
+    # Header only
+    buf.append(TX_NONE)
+    return
+  transactions = block["transactions"]
+  if isinstance(transactions, (list, tuple)) and all(_is_plain_transaction(tx) for tx in transactions):
+    buf.append(TX_LIST)
+    _write_varint(buf, len(transactions))
+    for transaction in transactions:
+      _write_transaction(buf, transaction)
+  else:
+    buf.append(TX_JSON)
+    _write_json(buf, transactions)
+
+def _read_block(data, offset):
+  index, offset = _read_varint(data, offset)
+  timestamp, offset = _read_number(data, offset)
+  previous_hash, offset = _read_text(data, offset)
+  merkle_root, offset = _read_text(data, offset)
+  block_hash, offset = _read_text(data, offset)
+  nonce, offset = _read_varint(data, offset)
+  block = {
+    "index" : index,
+    "timestamp" : timestamp,
+    "previous_hash" : previous_hash,
+    "merkle_root" : merkle_root,
+    "hash" : block_hash,
+    "nonce" : nonce
+  }
+  tag = data[offset]
+  offset += 1
+  if tag == TX_NONE:
+    return block, offset
+  if tag == TX_LIST:
+    count, offset = _read_varint(data, offset)
+    transactions = []
+    for _ in range(count):
+      transaction, offset = _read_transaction(data, offset)
+      transactions.append(transaction)
+  else:
+    transactions, offset = _read_json(data, offset)
+  block["transactions"] = transactions
+  return block, offset
+
+
+def encode_payload(message_type, data):
+  buf = bytearray()
+  if message_type == "TRANSACTION" and _is_plain_transaction(data):
+    buf.append(TX_LIST)
+    _write_transaction(buf, data)
+  elif message_type == "TRANSACTION":
+    buf.append(TX_JSON)
+    _write_json(buf, data)
+  elif message_type == "BLOCK":
+    _write_block(buf, data)
+  elif message_type in BLOCK_LIST_MESSAGES:
+    _write_varint(buf, len(data))
+    for block in data:
+      _write_block(buf, block)
+  elif message_type == "SECURE_MESSAGE":
+    # Session id, then the ciphertext as raw bytes up to the end of the frame
+    _write_text(buf, data["session"])
+    buf += data["ciphertext"]
+  else:
+    _write_json(buf, data)
+  return buf
+
+def decode_payload(message_type, payload):
+  data = memoryview(payload)
+  if message_type == "TRANSACTION":
+    if data[0] == TX_LIST:
+      return _read_transaction(data, 1)[0]
+    transaction = _read_json(data, 1)[0]
+    if not isinstance(transaction, dict) or not all(key in transaction for key in REQUIRED_TRANSACTION_FIELDS):
+      raise ValueError("Transaction payload is not a transaction")
+    return transaction
+  if message_type == "BLOCK":
+    return _read_block(data, 0)[0]
+  if message_type in BLOCK_LIST_MESSAGES:
+    count, offset = _read_varint(data, 0)
+    blocks = []
+    for _ in range(count):
+      block, offset = _read_block(data, offset)
+      blocks.append(block)
+    return blocks
+  if message_type == "SECURE_MESSAGE":
+    session, offset = _read_text(data, 0)
+    return { "session" : session, "ciphertext" : bytes(data[offset:]) }
+  return _read_json(data, 0)[0]
+
+
+def encode_message(message):
+  """Serialize a {"type", "data"} message into one length-prefixed frame"""
+  message_type = message["type"]
+  if message_type not in MESSAGE_TYPES:
+    raise ValueError(f"Unknown message type : {message_type}")
+  payload = encode_payload(message_type, message.get("data"))
+  if len(payload) > MAX_MESSAGE_SIZE:
+    raise ValueError(f"Message of {len(payload)} bytes exceeds the {MAX_MESSAGE_SIZE} byte limit")
+  return FRAME_HEADER.pack(MAGIC, MESSAGE_TYPES[message_type], len(payload)) + payload
+
+def decode_header(header):
+  """Return (message type, payload length) from a frame header"""
+  magic, type_code, length = FRAME_HEADER.unpack(header)
+  if magic != MAGIC:
+    raise ProtocolError("Bad frame magic")
+  if type_code not in MESSAGE_NAMES:
+    raise ProtocolError(f"Unknown message type code : {type_code}")
+  if length > MAX_MESSAGE_SIZE:
+    raise ProtocolError(f"Frame of {length} bytes exceeds the {MAX_MESSAGE_SIZE} byte limit")
+  return MESSAGE_NAMES[type_code], length
+
+def decode_message(message_type, payload):
+  try:
+    return { "type" : message_type, "data" : decode_payload(message_type, payload) }
+  except (IndexError, KeyError, TypeError, ValueError, struct.error) as e:
+    raise ProtocolError(f"Malformed {message_type} payload : {e}") from e
+
+
+def _recv_exact(sock, size):
+  """Read exactly size bytes, or return None if the peer closed the connection"""
+  buf = bytearray(size)
+  view = memoryview(buf)
+  received = 0
+  while received < size:
+    count = sock.recv_into(view[received:], size - received)
+    if count == 0:
+      return None
+    received += count
+  return buf
+
+def _recv_chunked(sock, size):
+  """Read exactly size bytes in chunks, growing the buffer only as data arrives"""
+  buf = bytearray()
+  while len(buf) < size:
+    chunk = sock.recv(min(READ_CHUNK_SIZE, size - len(buf)))
+    if not chunk:
+      return None
+    buf += chunk
+  return buf
+
+def send_message(sock, message):
+  """Frame and send a message on a blocking socket"""
+  sock.sendall(encode_message(message))
+
+def read_message(sock):
+  """Read one framed message from a blocking socket, None on a clean close"""
+  header = _recv_exact(sock, FRAME_HEADER.size)
+  if header is None:
+    return None
+  message_type, length = decode_header(header)
+  payload = _recv_chunked(sock, length)
+  if payload is None:
+    raise ProtocolError("Connection closed mid-frame")
+  return decode_message(message_type, payload)
+
+
+class FrameDecoder:
+  """Incremental decoder for a byte stream that may split or merge frames"""
+
+  def __init__(self):
+    self.buffer = bytearray()
+
+  def feed(self, data):
+    """Add received bytes and return every complete message"""
+    self.buffer += data
+    messages = []
+    offset = 0
+    while len(self.buffer) - offset >= FRAME_HEADER.size:
+      message_type, length = decode_header(bytes(self.buffer[offset:offset + FRAME_HEADER.size]))
+      end = offset + FRAME_HEADER.size + length
+      if len(self.buffer) < end:
+        break
+      messages.append(decode_message(message_type, self.buffer[offset + FRAME_HEADER.size:end]))
+      offset = end
+    del self.buffer[:offset]
+    return messages
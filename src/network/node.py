@@ -1,36 +1,127 @@
 import socket
 import threading
-import json
-
-from cryptography.hazmat.primitives import serialization
+import time
+from collections import OrderedDict
 
 from src.blockchain.transaction import Transaction
+from src.blockchain.transaction_store import TransactionWriter
 from src.staking.staking_pool import StakingPool
-from src.utils.crypto_utils import generate_keys, serialize_key
-from src.network.dht import DHT
-
-from src.network.messages import create_block_message, create_transaction_message
-from src.utils.crypto_utils import encrypt_message, sign_message, decrypt_message, verify_signature
+from src.utils.crypto_utils import serialize_key
+from src.utils.identity import DEFAULT_KEY_TYPE, load_identity
+from src.network.dht import DHT, request_nodes
+from src.network.gossip import Gossip
+from src.network.p2p import EventLoopThread, P2PServer
+from src.network.peer_discovery import parse_address
+from src.network.peer_pool import PeerPool
+from src.network.session import Handshake, HandshakeError
+from src.network.sync import ChainSync
+
+from src.network.messages import create_block_message, create_transaction_message, send_message, read_message, ProtocolError
 from src.utils.Database import Database as db
 
 
+SYNC_HANDLERS = {
+  "TIP" : "handle_tip",
+  "GET_HEADERS" : "handle_get_headers",
+  "HEADERS" : "handle_headers",
+  "GET_BLOCKS" : "handle_get_blocks",
+  "BLOCKS" : "handle_blocks",
+}
+
+# Inbound sessions kept before the least recently used one is dropped
+MAX_SESSIONS = 4096
+# Answered handshakes kept while waiting for the initiator to finish them
+MAX_PENDING_HANDSHAKES = 256
+# Seconds before the registered nodes are reloaded from the database
+KNOWN_NODES_TTL = 300
+
+GOSSIP_HANDLERS = {
+  "INV" : "handle_inv",
+  "GET_DATA" : "handle_get_data",
+}
+
+
 class Node:
-  def __init__(self, host, port):
+  def __init__(self, host, port, identity_path=None, key_type=DEFAULT_KEY_TYPE):
     self.host = host
     self.port = port
     self.peers = [] # Connected nodes
     self.blockchain = None
-    self.private_key, self.public_key = generate_keys()
-    print(f"Node public key : {serialize_key(self.public_key).decode()}")
-    self.dht = DHT()
-    self.dht.set_node_id(self.public_key.public_bytes(encoding=serialization.Encoding.PEM, format=serialization.PublicFormat.SubjectPublicKeyInfo).decode())
+    # Loaded from identity_path when given, so the node keeps its id across restarts
+    self.private_key, self.public_key = load_identity(identity_path, key_type)
+    self.public_key_pem = serialize_key(self.public_key).decode()
+    print(f"Node public key : {self.public_key_pem}")
+    # A full bucket pings its oldest peer with a FIND_NODE before evicting it
+    self.dht = DHT(ping=lambda address: request_nodes(address, self.dht.node_id))
+    self.dht.set_node_id(self.public_key_pem)
     self.staking_pool = StakingPool()
-
-  def start(self):
+    self.event_loop = None
+    self.p2p = None
+    self.peer_pool = None
+    self.known_nodes = set() # Pooled (host, port) loaded from the database
+    self.known_nodes_loaded_at = None
+    self.transaction_writer = None
+    self.sync = ChainSync(self)
+    self.gossip = Gossip(self)
+    self.sessions = OrderedDict() # Session id to (peer public key, channel)
+    self.pending_handshakes = OrderedDict() # Session id to (handshake, peer public key, channel) until finished
+    self.peer_sessions = {} # Serialized peer public key to our outbound channel
+    self.session_lock = threading.Lock()
+
+  def start(self, use_asyncio=False):
     """Start the node server"""
+    if use_asyncio:
+      self.start_async()
+      return
     server_thread = threading.Thread(target=self.listen_for_connections)
     server_thread.start()
 
+  def start_async(self, **server_options):
+    """Serve peers from a single asyncio event loop instead of a thread per connection"""
+    self.event_loop = EventLoopThread()
+    self.event_loop.start()
+    self.p2p = P2PServer(self, **server_options)
+    self.event_loop.submit(self.p2p.start()).result()
+    self.peer_pool = PeerPool(self.event_loop, self.p2p)
+
+  def ensure_event_loop(self):
+    """Return the background event loop, starting it if needed"""
+    if self.event_loop is None:
+      self.event_loop = EventLoopThread()
+      self.event_loop.start()
+    return self.event_loop
+
+  def ensure_peer_pool(self):
+    """Opt in to the outbound peer pool, starting an event loop for it if needed.
+
+    Nodes started with start_async() always have one. Threaded nodes keep
+    sending over their own sockets unless this is called.
+    """
+    if self.peer_pool is None:
+      self.peer_pool = PeerPool(self.ensure_event_loop(), self.p2p)
+    return self.peer_pool
+
+  def ensure_transaction_writer(self):
+    """Return the background writer that persists transactions in batches"""
+    if self.transaction_writer is None:
+      self.transaction_writer = TransactionWriter().start()
+    return self.transaction_writer
+
+  def stop_async(self):
+    """Close every asyncio connection and stop the event loop"""
+    if self.event_loop is not None:
+      if self.peer_pool is not None:
+        self.peer_pool.close()
+      if self.p2p is not None:
+        self.event_loop.submit(self.p2p.close()).result()
+      self.event_loop.stop()
+      self.event_loop = None
+      self.p2p = None
+      self.peer_pool = None
+    if self.transaction_writer is not None:
+      self.transaction_writer.close()
+      self.transaction_writer = None
+
   def listen_for_connections(self):
     """Listen for incoming connections"""
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -48,73 +139,102 @@ class Node:
     """Handle incoming messages from a peer"""
     try:
       while True:
-        data = client_socket.recv(1024).decode()
-        if data:
-          message = json.loads(data)
-          self.handle_message(message)
+        message = read_message(client_socket)
+        if message is None:
+          break
+        self.handle_message(message, reply=lambda response: send_message(client_socket, response))
     except ConnectionResetError:
       print("Connection lost")
+    except ProtocolError as e:
+      print(f"Dropping peer after protocol error : {e}")
     finally:
       client_socket.close()
 
-  def handle_message(self, message):
+  def handle_message(self, message, reply=None):
     """Handle incoming messages from a peer"""
     print("Received message : ", message)
     if message["type"] == "BLOCK":
-      self.add_block_to_chain(message["data"])
+      self.handle_block(message["data"])
     elif message["type"] == "TRANSACTION":
       transaction_data = message["data"]
       transaction = Transaction.from_dict(transaction_data)
+      transaction_hash = transaction.calculate_hash()
+      if transaction_hash in self.gossip.seen:
+        return
       # Handle staking/unstaking separately
       if transaction.transaction_type == "STAKE":
-        self.handle_staking(transaction)
+        admitted = self.handle_staking(transaction)
       elif transaction.transaction_type == "UNSTAKE":
-        self.handle_unstaking(transaction)
+        admitted = self.handle_unstaking(transaction)
       else :
-        self.add_transaction_to_pool(transaction_data)
-    elif message["type"] == "REQUEST_CHAIN":
-      self.broadcast_chain(peer_socket)
+        admitted = self.add_transaction_to_pool(transaction_data)
+      # Only admitted transactions are seen, so a copy rejected now can still get in later
+      if admitted:
+        self.gossip.accept(transaction_hash)
+    elif message["type"] == "REQUEST_CHAIN" and reply is not None:
+      self.broadcast_chain(reply)
     elif message["type"] == "CHAIN_RESPONSE":
       self.handle_chain_request(message["data"])
     elif message["type"] == "PEER_UPDATE":
       self.handle_peer_update(message["data"])
+    elif message["type"] == "HANDSHAKE" and reply is not None:
+      self.handle_handshake(message["data"], reply)
+    elif message["type"] == "HANDSHAKE_FINISH":
+      self.handle_handshake_finish(message["data"])
+    elif message["type"] == "SECURE_MESSAGE":
+      self.handle_secure_message(message["data"], reply=reply)
+    elif message["type"] == "SESSION_ERROR":
+      self.handle_session_error(message["data"])
+    elif message["type"] == "FIND_NODE" and reply is not None:
+      self.handle_find_node(message["data"], reply)
+    elif reply is not None and message["type"] in SYNC_HANDLERS:
+      getattr(self.sync, SYNC_HANDLERS[message["type"]])(message["data"], reply)
+    elif reply is not None and message["type"] in GOSSIP_HANDLERS:
+      getattr(self.gossip, GOSSIP_HANDLERS[message["type"]])(message["data"], reply)
 
   def handle_staking(self, transaction):
     """Process staking transactions"""
     if self.blockchain.process_staking(transaction):
       print(f"Staking transaction : {transaction.to_dict()}")
-      self.broadcast(create_transaction_message(transaction))
-    else:
-      print(f"Failed to process staking transaction : {transaction.to_dict()}")
+      self.relay_transaction(transaction)
+      return True
+    print(f"Failed to process staking transaction : {transaction.to_dict()}")
+    return False
 
   def handle_unstaking(self, transaction):
     """Process unstaking transactions"""
     if self.blockchain.process_unstaking(transaction):
       print(f"Unstaking transaction processed : {transaction.to_dict()}")
-      self.broadcast(create_transaction_message(transaction))
-    else :
-      print(f"Failed to process unstaking transaction : {transaction.to_dict()}")
+      self.relay_transaction(transaction)
+      return True
+    print(f"Failed to process unstaking transaction : {transaction.to_dict()}")
+    return False
+
   def create_staking_transaction(self, amount):
     """Create and broadcast a staking transaction"""
     transaction = {
-      "sender" : serialize_key(self.public_key).decode(),
-      "recipient" : None,
+      "sender" : self.public_key_pem,
+      "receiver" : None,
       "amount" : amount,
       "transaction_type" : "STAKE"
     }
-    self.broadcast(transaction)
+    self.broadcast({ "type" : "TRANSACTION", "data" : transaction })
 
   def create_unstaking_transaction(self, amount):
     transaction = {
-      "sender" : serialize_key(self.public_key).decode(),
-      "recipient" : None,
+      "sender" : self.public_key_pem,
+      "receiver" : None,
       "amount" : amount,
       "transaction_type" : "UNSTAKE"
     }
-    self.broadcast(transaction)
+    self.broadcast({ "type" : "TRANSACTION", "data" : transaction })
 
   def connect_to_peer(self, peer_host, peer_port):
     """Connect to another peer"""
+    if self.peer_pool is not None:
+      # Pooled connections reconnect on their own, so this never fails
+      self.peer_pool.add_peer(peer_host, peer_port)
+      return
     try:
       peer_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
       peer_socket.connect((peer_host, peer_port))
@@ -123,20 +243,53 @@ class Node:
     except ConnectionError:
       print(f"Failed to connect to peer at {peer_host}:{peer_port}")
 
+  def relay_transaction(self, transaction):
+    """Announce an accepted transaction to a random subset of peers"""
+    self.gossip.announce("transactions", transaction.calculate_hash(), create_transaction_message(transaction))
+
+  def push_transaction(self, transaction):
+    """Send a transaction we created to every peer, remembering it so echoes are dropped"""
+    message = create_transaction_message(transaction)
+    self.gossip.remember(transaction.calculate_hash(), message)
+    self.broadcast(message)
+
   def broadcast(self, message):
     """Send a message to all connected peers"""
+    if self.peer_pool is not None:
+      self.peer_pool.broadcast(message)
+      return
     for peer in self.peers:
-      peer.send(json.dumps(message).encode())
+      send_message(peer, message)
 
-  def add_block_to_chain(self, block_data):
+  def handle_block(self, block_data):
+    """Check a gossiped block and mark it seen only once it decodes, re-hashes and links to our chain"""
+    from src.blockchain.block import Block
+    try:
+      block = Block.from_dict(block_data)
+      block_hash = block.calculate_hash()
+    except Exception as error:
+      print(f"Dropping malformed block : {error}")
+      return
+    if block_hash in self.gossip.seen:
+      return
+    # The claimed hash is only trusted once it matches our own
+    if block.hash != block_hash:
+      print(f"Dropping block {block.index} with an invalid hash")
+      return
+    parent_height = self.blockchain.index.block_height(block.previous_hash)
+    if parent_height is None or parent_height + 1 != block.index:
+      print(f"Dropping block {block.index} that does not extend a known block")
+      return
+    if self.gossip.accept(block_hash):
+      self.add_block_to_chain(block)
+
+  def add_block_to_chain(self, new_block):
     """Add a block to the local blockchain"""
     validator = self.select_validator()
-    if validator == serialize_key(self.public_key).decode():
-      from src.blockchain.block import Block
-      new_block = Block.from_dict(block_data)
+    if validator == self.public_key_pem:
       if self.blockchain.add_block(new_block.transactions):
         print(f"Block {new_block.index} added to the blockchain")
-        self.broadcast(create_block_message(new_block))
+        self.gossip.announce("blocks", new_block.hash, create_block_message(new_block))
         self.reward_validator(validator, 10)
       else:
         print("Block validation failed")
@@ -144,16 +297,29 @@ class Node:
         print("This node is not selected to add the block")
 
   def add_transaction_to_pool(self, transaction_data):
-    """Add a transaction to the blockchain's transaction pool"""
+    """Add a transaction to the blockchain's transaction pool, returns whether it was admitted"""
     from src.blockchain.transaction import Transaction
     new_transaction = Transaction.from_dict(transaction_data)
 
     if new_transaction.transaction_type in ["STAKE", "UNSTAKE"]:
       print("This transaction type should be processed through handle_staking and handle_unstaking")
-      return
-    if self.blockchain.process_transaction(new_transaction):
-      print(f"Transaction added to the pool : {new_transaction.to_dict()}")
-      self.broadcast(create_transaction_message(new_transaction))
+      return False
+    # Funds are checked against the balance and the sender's other pending transactions,
+    # balances only change when a block is applied, so reorgs can undo them
+    if not self.blockchain.add_transaction(new_transaction):
+      print(f"Transaction already pending or rejected by the pool : {new_transaction.calculate_hash()}")
+      return False
+    print(f"Transaction added to the pool : {new_transaction.to_dict()}")
+    self.relay_transaction(new_transaction)
+    return True
+
+  def sync_with_peers(self):
+    """Ask peers for the headers following our tip"""
+    self.broadcast(self.sync.get_headers_message())
+
+  def announce_tip(self):
+    """Advertise our tip so lagging peers start a headers-first sync"""
+    self.broadcast(self.sync.tip_message())
 
   def request_chain_from_peers(self):
     """Request the latest blockchain from all peers"""
@@ -167,57 +333,135 @@ class Node:
     """Replace the local blockchain if the received chain is longer and valid"""
     from src.blockchain.block import Block
     new_chain = [Block.from_dict(block) for block in chain_data]
-    if len(new_chain) > len(self.blockchain.chain) and self.blockchain.is_chain_valid(new_chain):
-      self.blockchain.chain = new_chain
+    if self.blockchain.replace_chain(new_chain):
       print("Local blockchain updated to the received chain")
     else :
       print("Received chain not longer than the local one")
 
-  def broadcast_chain(self, peer_socket):
-    """Send the local blockchain to a peer"""
+  def broadcast_chain(self, reply):
+    """Send the local blockchain to the peer that requested it"""
     chain_data = [ block.to_dict() for block in self.blockchain.chain ]
     message = {
-      "type" : "BLOCK",
+      "type" : "CHAIN_RESPONSE",
       "data" : chain_data
     }
-    peer_socket.send(json.dumps(message).encode())
+    reply(message)
 
   def send_secure_message(self, peer_socket, message, recipient_public_key):
-    """Encrypt and sign a message before sending it to a peer"""
-    encrypted_message = encrypt_message(message, recipient_public_key)
-    signature = sign_message(message, self.private_key)
-    payload = {
-      "encrypted_message" : encrypted_message.hex(),
-      "signature" : signature.hex()
-    }
-    peer_socket.send(json.dumps(payload).encode())
-
-  def handle_secure_message(self, payload, sender_public_key):
-    """Decrypt and verify a message from a peer"""
-    encrypted_message = bytes.fromhex(payload["encrypted_message"])
-    signature = bytes.fromhex(payload["signature"])
-
-    message = decrypt_message(encrypted_message, self.private_key)
-
-    if verify_signature(message, signature, sender_public_key):
-      print("Verified message : ", message)
-      return message
-    else:
-      print("Failed to verify message")
+    """Encrypt a message with the session we share with the peer, opening one if needed"""
+    with self.session_lock:
+      channel = self.peer_sessions.get(serialize_key(recipient_public_key))
+    if channel is None:
+      channel = self.open_session(peer_socket, recipient_public_key)
+    channel.send(message, lambda ciphertext: send_message(
+      peer_socket, { "type" : "SECURE_MESSAGE", "data" : { "session" : channel.session_id, "ciphertext" : ciphertext } }
+    ))
+
+  def open_session(self, peer_socket, recipient_public_key):
+    """Run the signed key exchange with a peer over its socket and cache the session"""
+    handshake = Handshake(self.private_key, self.public_key)
+    send_message(peer_socket, handshake.message())
+    response = read_message(peer_socket)
+    # Session errors for frames we sent earlier may arrive before the answer
+    while response is not None and response["type"] == "SESSION_ERROR":
+      self.handle_session_error(response["data"])
+      response = read_message(peer_socket)
+    if response is None or response["type"] != "HANDSHAKE":
+      raise HandshakeError("Peer did not answer the handshake")
+    _, channel, finish = handshake.complete(response["data"], recipient_public_key)
+    send_message(peer_socket, finish)
+    with self.session_lock:
+      self.peer_sessions[serialize_key(recipient_public_key)] = channel
+    return channel
+
+  def handle_handshake(self, data, reply):
+    """Answer a peer's key exchange, keeping the session until the peer finishes it"""
+    handshake = Handshake(self.private_key, self.public_key)
+    try:
+      peer_public_key, channel, response = handshake.respond(data)
+    except HandshakeError as e:
+      print(f"Rejected handshake : {e}")
+      return
+    with self.session_lock:
+      self.pending_handshakes[channel.session_id] = (handshake, peer_public_key, channel)
+      if len(self.pending_handshakes) > MAX_PENDING_HANDSHAKES:
+        self.pending_handshakes.popitem(last=False)
+    reply(response)
+
+  def handle_handshake_finish(self, data):
+    """Open the session once the initiator has signed the handshake transcript"""
+    with self.session_lock:
+      pending = self.pending_handshakes.pop(data.get("session"), None)
+    if pending is None:
+      print("Handshake finish for an unknown session")
+      return
+    handshake, peer_public_key, channel = pending
+    try:
+      handshake.finish(data)
+    except HandshakeError as e:
+      print(f"Rejected handshake : {e}")
+      return
+    with self.session_lock:
+      self.sessions[channel.session_id] = (peer_public_key, channel)
+      if len(self.sessions) > MAX_SESSIONS:
+        self.sessions.popitem(last=False)
+
+  def handle_session_error(self, data):
+    """Forget an outbound session the peer no longer has, so the next message opens a new one"""
+    with self.session_lock:
+      for peer, channel in list(self.peer_sessions.items()):
+        if channel.session_id == data.get("session"):
+          del self.peer_sessions[peer]
+          print("Peer dropped our session, a new one opens with the next message")
+
+  def handle_secure_message(self, payload, sender_public_key=None, reply=None):
+    """Decrypt a message received on a session, optionally checking who opened it"""
+    with self.session_lock:
+      session = self.sessions.get(payload["session"])
+      if session is not None:
+        self.sessions.move_to_end(payload["session"])
+    if session is None:
+      print("Secure message for an unknown session")
+      if reply is not None:
+        # After an eviction or a restart, tell the sender to open a new session
+        reply({ "type" : "SESSION_ERROR", "data" : { "session" : payload["session"] } })
+      return None
+    peer_public_key, channel = session
+    if sender_public_key is not None and serialize_key(sender_public_key) != serialize_key(peer_public_key):
+      print("Secure message from an unexpected sender")
+      return None
+    # Decrypted under the channel's own lock, so one peer's frames never stall the others
+    try:
+      message = channel.decrypt(payload["ciphertext"]).decode()
+    except ValueError as e:
+      print(f"Failed to verify message : {e}")
       return None
+    print("Verified message : ", message)
+    return message
 
   def connect_to_bootstrap_node(self, bootstrap_host, boostrap_port):
-    import socket
+    """Register with a bootstrap node and connect to the sample of peers it returns"""
     try:
-      with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.connect((bootstrap_host, boostrap_port))
-        s.sendall(f"REGISTER {self.host}:{self:port}".encode())
-        response = s.recv(1024).decode()
-        peers = response.split(",")
-        self.peers.extend(peers)
-        print(f"Connected to bootstrap. Peers : {self.peers}")
+      with socket.create_connection((bootstrap_host, boostrap_port), timeout=10) as s:
+        s.sendall(f"REGISTER {self.host}:{self.port}\n".encode())
+        response = s.makefile().readline().strip()
     except Exception as e:
       print(f"Failed to connect to bootstrap node : {e}")
+      return []
+    if response in ("RATE_LIMITED", "ERROR"):
+      print(f"Bootstrap node refused registration : {response}")
+      return []
+    peers = []
+    for peer in response.split(","):
+      address = parse_address(peer)
+      if address is None:
+        if peer:
+          print(f"Skipping malformed peer address from bootstrap : {peer!r}")
+        continue
+      peers.append(peer)
+      self.connect_to_peer(*address)
+    print(f"Connected to bootstrap. Peers : {peers}")
+    return peers
 
   def broadcast_peers(self):
     """Send the updated peer list to all connected peers"""
@@ -253,6 +497,25 @@ class Node:
     print(f"Found peers closest to {target_id} : {peers}")
     return peers
 
+  def handle_find_node(self, request, reply):
+    """Learn the requesting node and answer with our closest peers to its target"""
+    sender = request.get("sender")
+    if sender and self.event_loop is not None:
+      # Pinging a full bucket's oldest peer happens off the request path
+      self.event_loop.submit(self.dht.learn(sender["id"], sender["address"]))
+    elif sender:
+      self.dht.add_peer(sender["id"], sender["address"])
+    reply({ "type" : "NODES", "data" : [list(peer) for peer in self.dht.closest_peers(request["target"])] })
+
+  def lookup_peers(self, target_id=None):
+    """Run an iterative Kademlia lookup, by default for our own id to discover neighbours"""
+    self.ensure_event_loop()
+    sender = { "id" : self.dht.node_id, "address" : f"{self.host}:{self.port}" }
+    find_node = lambda address, target: request_nodes(address, target, sender)
+    peers, rounds = self.event_loop.submit(self.dht.lookup(target_id or self.dht.node_id, find_node)).result()
+    print(f"Lookup finished after {rounds} rounds with {len(peers)} peers")
+    return peers
+
   def stake_coins(self, amount):
     """Allows a user to stake their coins"""
     if self.blockchain.balance >= amount:
@@ -284,45 +547,58 @@ class Node:
   def stake(self, sender, amount):
     """Create and broadcast a staking transaction"""
     transaction = Transaction(sender=sender, receiver=None, amount=amount, transaction_type="STAKE")
-    self.broadcast(create_transaction_message(transaction))
+    self.push_transaction(transaction)
 
   def unstake(self, sender, amount):
     """Create and broadcast an unstaking transaction"""
     transaction = Transaction(sender=sender, receiver=None, amount=amount, transaction_type="UNSTAKE")
-    self.broadcast(create_transaction_message(transaction))
+    self.push_transaction(transaction)
 
   def to_dict(self):
     return {"public_key" : self.public_key, "host" : self.host, "port" : self.port}
 
   def save_to_db(self):
     """Save the node to the database"""
-    conn = db.get_connection()
-    cursor = conn.cursor()
     query = """INSERT INTO nodes (public_key, host, port) VALUES (%s, %s, %s) ON CONFLICT (public_key) DO NOTHING;"""
-    public_key_pem = self.public_key.public_bytes(encoding=serialization.Encoding.PEM, format=serialization.PublicFormat.SubjectPublicKeyInfo).decode('utf-8')
-    cursor.execute(query, (public_key_pem, self.host, self.port))
-    conn.commit()
-    db.release_connection(conn)
+    with db.cursor() as cursor:
+      cursor.execute(query, (self.public_key_pem, self.host, self.port))
 
   @staticmethod
   def load_all_nodes():
     """Load all nodes from the database"""
-    conn = db.get_connection()
-    cursor = conn.cursor()
     query = "SELECT public_key, host, port FROM nodes;"
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    db.release_connection(conn)
+    with db.cursor() as cursor:
+      cursor.execute(query)
+      rows = cursor.fetchall()
     return [Node(*row) for row in rows]
 
+  @staticmethod
+  def load_node_addresses():
+    """Load the (host, port) of every registered node from the database"""
+    query = "SELECT host, port FROM nodes;"
+    with db.cursor() as cursor:
+      db.execute_prepared(cursor, query)
+      return cursor.fetchall()
+
+  def refresh_known_nodes(self):
+    """Pool every registered node, dropping the ones no longer registered"""
+    addresses = {(host, int(port)) for host, port in Node.load_node_addresses() if host != self.host or port != self.port}
+    for host, port in addresses - self.known_nodes:
+      self.peer_pool.add_peer(host, port)
+    for host, port in self.known_nodes - addresses:
+      self.peer_pool.remove_peer(host, port)
+    self.known_nodes = addresses
+    self.known_nodes_loaded_at = time.monotonic()
+
   def broadcast_transaction(self, transaction):
-    """Broadcast a transaction to all connected nodes"""
-    nodes = Node.load_all_nodes()
-    for node in nodes:
-      if node.host != self.host or node.port != self.port:
-        print(f"Sending a transaction to {node.host}:{node.port}")
+    """Broadcast a transaction to all connected nodes, and to every registered node when pooling"""
+    if self.peer_pool is not None:
+      loaded_at = self.known_nodes_loaded_at
+      if loaded_at is None or time.monotonic() - loaded_at > KNOWN_NODES_TTL:
+        self.refresh_known_nodes()
+    self.push_transaction(transaction)
 
   def add_transaction(self, transaction):
-    """Add a transaction to the database and broadcast it"""
-    transaction.save_to_db()
+    """Queue a transaction for the database and broadcast it"""
+    self.ensure_transaction_writer().submit(transaction)
     self.broadcast_transaction(transaction)
\ No newline at end of file
@@ -0,0 +1,199 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.network.messages import FRAME_HEADER, decode_header, decode_message, encode_message, ProtocolError
+
+# Handlers for these messages verify signatures or validate blocks
+CPU_BOUND_MESSAGES = {"BLOCK", "TRANSACTION", "CHAIN_RESPONSE", "HEADERS", "BLOCKS"}
+# Payloads larger than this are decoded off the event loop
+EXECUTOR_DECODE_SIZE = 64 * 1024
+# Largest frame accepted from a peer, enough for a full BLOCKS batch
+MAX_FRAME_SIZE = 8 * 1024 * 1024
+# Bytes of frames larger than the read buffer held at once across all peers
+LARGE_FRAME_BUDGET = 64 * 1024 * 1024
+# Seconds a peer has to deliver the body of a large frame
+LARGE_FRAME_TIMEOUT = 30.0
+
+
+class EventLoopThread:
+  """An asyncio event loop running in a background daemon thread"""
+
+  def __init__(self):
+    self.loop = asyncio.new_event_loop()
+    self.thread = threading.Thread(target=self._run, daemon=True)
+
+  def _run(self):
+    asyncio.set_event_loop(self.loop)
+    self.loop.run_forever()
+
+  def start(self):
+    self.thread.start()
+
+  def submit(self, coroutine):
+    """Schedule a coroutine from any thread, returning a concurrent future"""
+    return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+  def stop(self):
+    self.loop.call_soon_threadsafe(self.loop.stop)
+    self.thread.join()
+
+
+class P2PServer:
+  """Non-blocking server and client connections for a Node.
+
+  One event loop multiplexes every peer socket. Each connection has a
+  bounded read buffer, a maximum frame size and a write buffer limit past
+  which the peer is dropped as too slow. Frames larger than the read
+  buffer also draw from a budget shared by every connection, so many
+  peers sending large frames at once cannot exhaust memory. CPU heavy
+  handlers run on an executor so they never stall accept, read or write.
+  """
+
+  def __init__(self, node, max_connections=4096, read_buffer_limit=256 * 1024, max_frame_size=MAX_FRAME_SIZE,
+               write_buffer_limit=1024 * 1024, large_frame_budget=LARGE_FRAME_BUDGET, executor=None):
+    self.node = node
+    self.max_connections = max_connections
+    self.read_buffer_limit = read_buffer_limit
+    self.max_frame_size = min(max_frame_size, large_frame_budget)
+    self.write_buffer_limit = write_buffer_limit
+    self.large_frame_budget = large_frame_budget
+    self.large_frame_bytes = 0
+    self.large_frame_released = asyncio.Condition()
+    self.executor = executor or ThreadPoolExecutor(thread_name_prefix="p2p-handler")
+    self.connections = {}
+    self.tasks = set()
+    self.server = None
+    self.loop = None
+
+  def spawn(self, coroutine):
+    """Run a coroutine as a task the server keeps a reference to until it finishes"""
+    task = asyncio.ensure_future(coroutine)
+    self.tasks.add(task)
+    task.add_done_callback(self.tasks.discard)
+    return task
+
+  async def start(self):
+    """Start accepting peer connections on the node's host and port"""
+    self.loop = asyncio.get_running_loop()
+    self.server = await asyncio.start_server(
+      self._handle_connection, self.node.host, self.node.port,
+      limit=self.read_buffer_limit, backlog=1024
+    )
+    print(f"Node listening on {self.node.host}:{self.node.port} (asyncio) ...")
+
+  async def close(self):
+    if self.server is not None:
+      self.server.close()
+      await self.server.wait_closed()
+    for writer in list(self.connections.values()):
+      writer.close()
+    self.connections.clear()
+    for task in list(self.tasks):
+      task.cancel()
+
+  async def connect(self, host, port):
+    """Open an outbound connection and serve it like an inbound one"""
+    self.loop = self.loop or asyncio.get_running_loop()
+    reader, writer = await asyncio.open_connection(host, port, limit=self.read_buffer_limit)
+    self._register(writer)
+    self.spawn(self.serve(reader, writer))
+    print(f"Connected to peer at {host}:{port}")
+    return writer
+
+  async def _handle_connection(self, reader, writer):
+    if len(self.connections) >= self.max_connections:
+      print(f"Connection limit reached, refusing {writer.get_extra_info('peername')}")
+      writer.close()
+      return
+    self._register(writer)
+    print(f"New connection from {writer.get_extra_info('peername')}")
+    await self.serve(reader, writer)
+
+  def _register(self, writer):
+    writer.transport.set_write_buffer_limits(high=self.write_buffer_limit)
+    self.connections[writer.get_extra_info("peername")] = writer
+
+  async def serve(self, reader, writer):
+    """Read and dispatch messages from a connection until it closes"""
+    peer = writer.get_extra_info("peername")
+    try:
+      while True:
+        message = await self.read_message(reader)
+        if message is None:
+          break
+        try:
+          await self.dispatch(message, writer)
+        except Exception as e:
+          print(f"Failed to handle {message['type']} from {peer} : {e}")
+    except (ConnectionError, asyncio.IncompleteReadError):
+      print(f"Connection lost with {peer}")
+    except ProtocolError as e:
+      print(f"Dropping peer {peer} after protocol error : {e}")
+    finally:
+      self.connections.pop(peer, None)
+      writer.close()
+
+  async def read_message(self, reader):
+    """Read one frame, None when the peer closed the connection cleanly"""
+    try:
+      header = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError as e:
+      if not e.partial:
+        return None
+      raise ProtocolError("Connection closed mid-frame") from e
+    message_type, length = decode_header(header)
+    if length > self.max_frame_size:
+      raise ProtocolError(f"Frame of {length} bytes exceeds the {self.max_frame_size} byte limit")
+    if length > self.read_buffer_limit:
+      payload = await self._read_large_frame(reader, length)
+    else:
+      payload = await reader.readexactly(length)
+    if length > EXECUTOR_DECODE_SIZE:
+      return await self.loop.run_in_executor(self.executor, decode_message, message_type, payload)
+    return decode_message(message_type, payload)
+
+  async def _read_large_frame(self, reader, length):
+    """Read a frame body once the shared large frame budget has room for it"""
+    async with self.large_frame_released:
+      await self.large_frame_released.wait_for(lambda: self.large_frame_bytes + length <= self.large_frame_budget)
+      self.large_frame_bytes += length
+    try:
+      return await asyncio.wait_for(reader.readexactly(length), LARGE_FRAME_TIMEOUT)
+    except asyncio.TimeoutError:
+      raise ProtocolError(f"Frame of {length} bytes not delivered within {LARGE_FRAME_TIMEOUT}s")
+    finally:
+      async with self.large_frame_released:
+        self.large_frame_bytes -= length
+        self.large_frame_released.notify_all()
+
+  async def dispatch(self, message, writer):
+    """Hand a message to the node, off the event loop when it is CPU bound"""
+    def reply(response):
+      asyncio.run_coroutine_threadsafe(self.send(writer, response), self.loop)
+
+    if message["type"] in CPU_BOUND_MESSAGES:
+      await self.loop.run_in_executor(self.executor, self.node.handle_message, message, reply)
+    else:
+      self.node.handle_message(message, reply)
+
+  async def send(self, writer, message):
+    await self._write(writer, encode_message(message))
+
+  async def _write(self, writer, frame):
+    if writer.is_closing():
+      return
+    if writer.transport.get_write_buffer_size() > self.write_buffer_limit:
+      print(f"Dropping slow peer {writer.get_extra_info('peername')}")
+      writer.close()
+      return
+    writer.write(frame)
+    try:
+      await writer.drain()
+    except ConnectionError:
+      writer.close()
+
+  async def broadcast(self, message):
+    """Encode once and write the frame to every connected peer concurrently"""
+    frame = encode_message(message)
+    await asyncio.gather(*(self._write(writer, frame) for writer in list(self.connections.values())))
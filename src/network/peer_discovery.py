@@ -1,22 +1,117 @@
+import heapq
+import random
+import time
+from collections import OrderedDict
+
+# Seconds a registration stays valid unless the peer registers again
+PEER_TTL = 30 * 60
+# Most peers returned to a registering node
+SAMPLE_SIZE = 32
+# Registrations allowed per source address, sustained per second and in a burst
+RATE_LIMIT = 5.0
+RATE_BURST = 20
+# Sources tracked by the rate limiter before the least recent is forgotten
+MAX_SOURCES = 100000
+
+
+
+def parse_address(address):
+  """Split "host:port" into (host, port), or None if it is not a usable peer address"""
+  host, separator, port = address.rpartition(":")
+  # Addresses travel comma separated, so a comma would split one into two
+  if not separator or not host or "," in address or not port.isascii() or not port.isdigit():
+    return None
+  port = int(port)
+  if not 0 < port < 65536:
+    return None
+  return host, port
+
+
 class BootstrapNode:
-  """A bootstrap node that controls a list of peer nodes"""
+  """A bootstrap node that controls a list of peer nodes.
+
+  Registrations expire after ttl seconds unless renewed. Addresses are kept
+  in a list with their positions indexed, so a random sample costs
+  O(sample size) and removal is a swap with the last entry; expiry pops a
+  heap of deadlines, skipping the ones that were renewed since.
+  """
+
+  def __init__(self, ttl=PEER_TTL, sample_size=SAMPLE_SIZE):
+    self.ttl = ttl
+    self.sample_size = sample_size
+    self.expiry = {}
+    self.addresses = []
+    self.positions = {}
+    self.deadlines = []
 
-  def __init__(self):
-    self.peers = set()
+  def __len__(self):
+    return len(self.addresses)
 
-  def register_peer(self, address):
-    """Create new peer"""
-    if address not in self.peers:
-      self.peers.add(address)
+  def register_peer(self, address, now=None):
+    """Create or renew a peer and return a random sample of the other live peers"""
+    now = time.monotonic() if now is None else now
+    self.expire(now)
+    if address not in self.positions:
+      self.positions[address] = len(self.addresses)
+      self.addresses.append(address)
       print(f"Peer {address} registered")
-    return list(self.address)
-  
+    self.expiry[address] = now + self.ttl
+    heapq.heappush(self.deadlines, (now + self.ttl, address))
+    return self.sample(exclude=address)
+
   def remove_peer(self, address):
     """Remove peer from network"""
-    if address in self.peers:
-      self.peers.remove(address)
+    position = self.positions.pop(address, None)
+    if position is None:
+      return
+    last = self.addresses.pop()
+    if last != address:
+      self.addresses[position] = last
+      self.positions[last] = position
+    del self.expiry[address]
     print(f"Peer {address} removed")
 
+  def expire(self, now=None):
+    """Drop every peer whose registration has lapsed"""
+    now = time.monotonic() if now is None else now
+    while self.deadlines and self.deadlines[0][0] <= now:
+      deadline, address = heapq.heappop(self.deadlines)
+      if self.expiry.get(address) == deadline:
+        self.remove_peer(address)
+
+  def sample(self, count=None, exclude=None):
+    """Up to count (default sample_size) distinct random live peers"""
+    count = self.sample_size if count is None else count
+    size = len(self.addresses)
+    picked = random.sample(self.addresses, min(count + 1, size))
+    return [address for address in picked if address != exclude][:count]
+
   def get_peers(self):
     """Return the list of registered peers"""
-    return list(self.peers)
\ No newline at end of file
+    self.expire()
+    return list(self.addresses)
+
+
+class RateLimiter:
+  """Token bucket per source, refilled at rate per second up to burst.
+
+  Only the MAX_SOURCES most recently seen sources are tracked, so a flood
+  of spoofed sources cannot grow it without bound.
+  """
+
+  def __init__(self, rate=RATE_LIMIT, burst=RATE_BURST, max_sources=MAX_SOURCES):
+    self.rate = rate
+    self.burst = burst
+    self.max_sources = max_sources
+    self.buckets = OrderedDict()
+
+  def allow(self, source, now=None):
+    """Take a token for source, returns False when it is out of tokens"""
+    now = time.monotonic() if now is None else now
+    tokens, updated = self.buckets.pop(source, (self.burst, now))
+    tokens = min(self.burst, tokens + (now - updated) * self.rate)
+    allowed = tokens >= 1
+    self.buckets[source] = (tokens - 1 if allowed else tokens, now)
+    if len(self.buckets) > self.max_sources:
+      self.buckets.popitem(last=False)
+    return allowed
@@ -0,0 +1,210 @@
+import asyncio
+import random
+
+from src.network.messages import encode_message
+
+
+class PeerConnection:
+  """A long-lived outbound connection with its own send queue.
+
+  A writer task owns the socket: it connects, flushes queued frames in
+  batches with a single drain, and reconnects with exponential backoff
+  and jitter whenever the connection drops. A closed connection is
+  noticed as soon as the peer hangs up, not on the next send. When the
+  queue is full the oldest frame is dropped, so a dead peer never blocks
+  a broadcast.
+  """
+
+  def __init__(self, host, port, queue_size=1024, min_backoff=0.5, max_backoff=30.0, connect_timeout=5.0,
+               on_connect=None):
+    self.host = host
+    self.port = port
+    self.queue = asyncio.Queue(maxsize=queue_size)
+    self.min_backoff = min_backoff
+    self.max_backoff = max_backoff
+    self.connect_timeout = connect_timeout
+    self.on_connect = on_connect
+    self.writer = None
+    self.task = None
+    self.dropped = 0
+    self.reconnects = 0
+
+  @property
+  def address(self):
+    return f"{self.host}:{self.port}"
+
+  @property
+  def connected(self):
+    return self.writer is not None and not self.writer.is_closing()
+
+  def enqueue(self, frame):
+    """Queue a frame without blocking, dropping the oldest one when full"""
+    if self.queue.full():
+      self.queue.get_nowait()
+      self.dropped += 1
+    self.queue.put_nowait(frame)
+
+  def start(self):
+    self.task = asyncio.ensure_future(self.run())
+
+  async def stop(self):
+    if self.task is not None:
+      self.task.cancel()
+      try:
+        await self.task
+      except asyncio.CancelledError:
+        pass
+    if self.writer is not None:
+      self.writer.close()
+
+  async def run(self):
+    backoff = self.min_backoff
+    while True:
+      try:
+        reader, self.writer = await asyncio.wait_for(
+          asyncio.open_connection(self.host, self.port), self.connect_timeout
+        )
+      except (OSError, asyncio.TimeoutError):
+        delay = backoff * random.uniform(0.5, 1.0)
+        print(f"Peer {self.address} unreachable, retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+        backoff = min(backoff * 2, self.max_backoff)
+        continue
+
+      backoff = self.min_backoff
+      self.reconnects += 1
+      print(f"Connected to peer at {self.address}")
+      if self.on_connect is not None:
+        # Whoever serves the reader closes the writer when the peer hangs up
+        self.on_connect(reader, self.writer)
+        watcher = None
+      else:
+        watcher = asyncio.ensure_future(self._discard_until_eof(reader, self.writer))
+      closed = asyncio.ensure_future(self._wait_closed(self.writer))
+      try:
+        await self._flush_forever(closed)
+      except ConnectionError:
+        print(f"Connection to {self.address} lost, reconnecting")
+      finally:
+        self.writer.close()
+        closed.cancel()
+        if watcher is not None:
+          watcher.cancel()
+      await asyncio.sleep(self.min_backoff * random.uniform(0.5, 1.0))
+
+  @staticmethod
+  async def _wait_closed(writer):
+    try:
+      await writer.wait_closed()
+    except ConnectionError:
+      pass
+
+  @staticmethod
+  async def _discard_until_eof(reader, writer):
+    try:
+      while await reader.read(64 * 1024):
+        pass
+    except ConnectionError:
+      pass
+    finally:
+      writer.close()
+
+  async def _flush_forever(self, closed):
+    while True:
+      getter = asyncio.ensure_future(self.queue.get())
+      done = ()
+      try:
+        done, _ = await asyncio.wait((getter, closed), return_when=asyncio.FIRST_COMPLETED)
+      finally:
+        if getter not in done:
+          getter.cancel()
+      if getter not in done:
+        raise ConnectionError("Peer closed the connection")
+      frames = [getter.result()]
+      while not self.queue.empty():
+        frames.append(self.queue.get_nowait())
+      if self.writer.is_closing():
+        # Keep the batch for the next connection
+        for frame in frames:
+          self.enqueue(frame)
+        raise ConnectionError("Writer closed")
+      self.writer.writelines(frames)
+      await self.writer.drain()
+
+
+class PeerPool:
+  """Outbound connections to every known peer, flushed concurrently.
+
+  broadcast() encodes a message once and only appends the frame to each
+  peer's queue, so it returns immediately; every PeerConnection drains
+  its own queue on the event loop and one slow peer delays nobody else.
+  """
+
+  def __init__(self, event_loop, server=None, **connection_options):
+    self.event_loop = event_loop
+    self.server = server
+    self.connection_options = connection_options
+    self.connections = {}
+
+  def add_peer(self, host, port):
+    """Start a persistent connection to host:port (no-op if already pooled)"""
+    self.event_loop.loop.call_soon_threadsafe(self._add_peer, host, int(port))
+
+  def _add_peer(self, host, port):
+    if (host, port) in self.connections:
+      return
+    on_connect = None
+    if self.server is not None:
+      # Serve replies sent back on the pooled connection
+      on_connect = lambda reader, writer: self.server.spawn(self.server.serve(reader, writer))
+    connection = PeerConnection(host, port, on_connect=on_connect, **self.connection_options)
+    self.connections[(host, port)] = connection
+    connection.start()
+
+  def remove_peer(self, host, port):
+    self.event_loop.submit(self._remove_peer(host, int(port)))
+
+  async def _remove_peer(self, host, port):
+    connection = self.connections.pop((host, port), None)
+    if connection is not None:
+      await connection.stop()
+
+  def broadcast(self, message, exclude=None):
+    """Queue a message for every pooled peer, without waiting on any socket"""
+    frame = encode_message(message)
+    self.event_loop.loop.call_soon_threadsafe(self._enqueue_all, frame, exclude)
+
+  def relay(self, message, fanout, exclude=None):
+    """Queue a message for at most fanout randomly chosen pooled peers"""
+    frame = encode_message(message)
+    self.event_loop.loop.call_soon_threadsafe(self._enqueue_sample, frame, fanout, exclude)
+
+  def send(self, host, port, message):
+    """Queue a message for a single pooled peer"""
+    frame = encode_message(message)
+    self.event_loop.loop.call_soon_threadsafe(self._enqueue, (host, int(port)), frame)
+
+  def _enqueue_all(self, frame, exclude):
+    for key, connection in self.connections.items():
+      if exclude is None or key not in exclude:
+        connection.enqueue(frame)
+
+  def _enqueue_sample(self, frame, fanout, exclude):
+    keys = [key for key in self.connections if exclude is None or key not in exclude]
+    for key in random.sample(keys, min(fanout, len(keys))):
+      self.connections[key].enqueue(frame)
+
+  def _enqueue(self, key, frame):
+    connection = self.connections.get(key)
+    if connection is not None:
+      connection.enqueue(frame)
+
+  def peers(self):
+    return list(self.connections)
+
+  def close(self):
+    self.event_loop.submit(self._close()).result()
+
+  async def _close(self):
+    await asyncio.gather(*(connection.stop() for connection in self.connections.values()))
+    self.connections.clear()
@@ -0,0 +1,206 @@
+import hashlib
+import struct
+import threading
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from src.utils.crypto_utils import deserialize_key, serialize_key, sign_message, verify_signature
+
+# Messages sent under one key before both sides move to the next one
+ROTATE_AFTER = 1 << 20
+# Key epochs a frame may run ahead of the last one received, bounding the
+# HKDF work an unauthenticated header can cause
+MAX_EPOCH_SKIP = 2
+# Key epoch and message counter, authenticated with every ciphertext
+NONCE_HEADER = struct.Struct(">IQ")
+SESSION_INFO = b"PoloCoin session v1"
+
+
+class HandshakeError(Exception):
+  """Raised when a peer's handshake is malformed or its signature does not verify"""
+
+
+def _derive(key_material, salt, info, length):
+  return HKDF(algorithm=hashes.SHA256(), length=length, salt=salt, info=info).derive(key_material)
+
+
+def _next_key(key):
+  return _derive(key, None, b"rotate", 32)
+
+
+def _transcript(role, initiator_ephemeral, responder_ephemeral):
+  return f"{SESSION_INFO.decode()} {role} {initiator_ephemeral.hex()} {responder_ephemeral.hex()}"
+
+
+class SessionChannel:
+  """AES-GCM encryption for one peer with a key per direction.
+
+  Every message carries its key epoch and a counter in the nonce. Both
+  sides derive the next key with HKDF after ROTATE_AFTER messages, so keys
+  rotate without another round trip. Counters must strictly increase,
+  which rejects replayed or reordered frames. Each channel has its own
+  lock, so peers never wait on one another's frames.
+  """
+
+  def __init__(self, session_id, send_key, receive_key, rotate_after=ROTATE_AFTER):
+    self.session_id = session_id
+    self.rotate_after = rotate_after
+    self.send_epoch = 0
+    self.send_counter = 0
+    self.send_cipher = AESGCM(send_key)
+    self.send_key = send_key
+    self.receive_epoch = 0
+    self.receive_last = -1
+    self.receive_cipher = AESGCM(receive_key)
+    self.receive_key = receive_key
+    self.send_lock = threading.Lock()
+    self.receive_lock = threading.Lock()
+
+  def encrypt(self, message):
+    """Encrypt a str or bytes message into epoch, counter and ciphertext"""
+    with self.send_lock:
+      return self._seal(message)
+
+  def send(self, message, transmit):
+    """Encrypt a message and hand the frame to transmit before any other is sealed.
+
+    The receiver rejects counters that go backwards, so the lock is held
+    through the write to keep frames on the wire in counter order.
+    """
+    with self.send_lock:
+      transmit(self._seal(message))
+
+  def _seal(self, message):
+    if isinstance(message, str):
+      message = message.encode()
+    if self.send_counter >= self.rotate_after:
+      self.send_key = _next_key(self.send_key)
+      self.send_cipher = AESGCM(self.send_key)
+      self.send_epoch += 1
+      self.send_counter = 0
+    header = NONCE_HEADER.pack(self.send_epoch, self.send_counter)
+    self.send_counter += 1
+    return header + self.send_cipher.encrypt(header, message, header)
+
+  def decrypt(self, data):
+    """Decrypt a frame from encrypt(), raising ValueError if it is forged or replayed"""
+    if len(data) < NONCE_HEADER.size:
+      raise ValueError("Truncated secure message")
+    epoch, counter = NONCE_HEADER.unpack_from(data)
+    with self.receive_lock:
+      if epoch < self.receive_epoch or (epoch == self.receive_epoch and counter <= self.receive_last):
+        raise ValueError("Replayed or out of order secure message")
+      # Checked before any key is derived, since the header is not authenticated yet
+      if epoch > self.receive_epoch + MAX_EPOCH_SKIP:
+        raise ValueError("Secure message is too many key epochs ahead")
+      key, cipher = self.receive_key, self.receive_cipher
+      for _ in range(epoch - self.receive_epoch):
+        key = _next_key(key)
+        cipher = AESGCM(key)
+      header = bytes(data[:NONCE_HEADER.size])
+      try:
+        plaintext = cipher.decrypt(header, bytes(data[NONCE_HEADER.size:]), header)
+      except InvalidTag:
+        raise ValueError("Secure message failed authentication")
+      if epoch != self.receive_epoch:
+        self.receive_epoch, self.receive_key, self.receive_cipher = epoch, key, cipher
+      self.receive_last = counter
+      return plaintext
+
+
+class Handshake:
+  """One side of an ephemeral X25519 exchange signed by the node's identity key.
+
+  The initiator sends its identity public key and a fresh X25519 key. The
+  responder answers with its own pair and a signature over both ephemeral
+  keys, and the initiator finishes by signing both keys too. Each side thus
+  signs a transcript the other just made fresh, so no handshake message can
+  be replayed into a new session, and the role in the signed text stops a
+  signature being reflected back. The shared secret is expanded with HKDF
+  into one AES-GCM key per direction, so the identity key is used once per
+  peer instead of once per message, and old sessions stay secret if it leaks.
+  """
+
+  def __init__(self, private_key, public_key):
+    self.private_key = private_key
+    self.public_key = public_key
+    self.ephemeral = X25519PrivateKey.generate()
+    self.ephemeral_public = self.ephemeral.public_key().public_bytes(
+      encoding=serialization.Encoding.Raw, format=serialization.PublicFormat.Raw
+    )
+    self.peer_public_key = None
+    self.peer_ephemeral = None
+
+  def message(self):
+    """The initiator's opening message"""
+    return { "type" : "HANDSHAKE", "data" : {
+      "public_key" : serialize_key(self.public_key).decode(),
+      "ephemeral" : self.ephemeral_public.hex(),
+    } }
+
+  def respond(self, data):
+    """Answer an opening message, returning (peer public key, SessionChannel, reply).
+
+    The channel must not be used until finish() accepts the initiator's
+    signature.
+    """
+    peer_public_key, peer_ephemeral = self._read(data)
+    self.peer_public_key, self.peer_ephemeral = peer_public_key, peer_ephemeral
+    reply = { "type" : "HANDSHAKE", "data" : {
+      "public_key" : serialize_key(self.public_key).decode(),
+      "ephemeral" : self.ephemeral_public.hex(),
+      "signature" : self._sign("responder", peer_ephemeral, self.ephemeral_public),
+    } }
+    return peer_public_key, self._channel(peer_ephemeral), reply
+
+  def complete(self, data, expected_public_key=None):
+    """Verify the responder's reply, returning (peer public key, SessionChannel, finishing message)"""
+    peer_public_key, peer_ephemeral = self._read(data)
+    if expected_public_key is not None and serialize_key(expected_public_key) != serialize_key(peer_public_key):
+      raise HandshakeError("Handshake from an unexpected identity")
+    self._verify(data, "responder", self.ephemeral_public, peer_ephemeral, peer_public_key)
+    channel = self._channel(peer_ephemeral)
+    finish = { "type" : "HANDSHAKE_FINISH", "data" : {
+      "session" : channel.session_id,
+      "signature" : self._sign("initiator", self.ephemeral_public, peer_ephemeral),
+    } }
+    return peer_public_key, channel, finish
+
+  def finish(self, data):
+    """Verify the initiator's finishing signature over the transcript from respond()"""
+    self._verify(data, "initiator", self.peer_ephemeral, self.ephemeral_public, self.peer_public_key)
+
+  def _read(self, data):
+    try:
+      peer_public_key = deserialize_key(data["public_key"].encode())
+      peer_ephemeral = bytes.fromhex(data["ephemeral"])
+    except (KeyError, ValueError, TypeError, AttributeError) as e:
+      raise HandshakeError(f"Malformed handshake : {e}")
+    if len(peer_ephemeral) != 32:
+      raise HandshakeError("Malformed handshake : bad ephemeral key")
+    return peer_public_key, peer_ephemeral
+
+  def _sign(self, role, initiator_ephemeral, responder_ephemeral):
+    return sign_message(_transcript(role, initiator_ephemeral, responder_ephemeral), self.private_key).hex()
+
+  def _verify(self, data, role, initiator_ephemeral, responder_ephemeral, public_key):
+    try:
+      signature = bytes.fromhex(data["signature"])
+    except (KeyError, ValueError, TypeError) as e:
+      raise HandshakeError(f"Malformed handshake : {e}")
+    if not verify_signature(_transcript(role, initiator_ephemeral, responder_ephemeral), signature, public_key):
+      raise HandshakeError("Handshake signature does not verify")
+
+  def _channel(self, peer_ephemeral):
+    shared = self.ephemeral.exchange(X25519PublicKey.from_public_bytes(peer_ephemeral))
+    first, second = sorted((self.ephemeral_public, peer_ephemeral))
+    keys = _derive(shared, first + second, SESSION_INFO, 64)
+    session_id = hashlib.sha256(first + second).hexdigest()
+    if self.ephemeral_public == first:
+      return SessionChannel(session_id, keys[:32], keys[32:])
+    return SessionChannel(session_id, keys[32:], keys[:32])
+
@@ -0,0 +1,179 @@
+import threading
+
+from src.blockchain.block import Block
+
+# Most headers sent in one HEADERS message
+MAX_HEADERS = 2000
+# Most block bodies requested in one GET_BLOCKS message
+BLOCK_BATCH = 128
+# Locator entries before the step between heights starts doubling
+DENSE_LOCATOR_ENTRIES = 10
+
+
+def build_locator(chain, tip=None):
+  """List [height, hash] pairs walking back from the tip with growing steps.
+
+  Ten most recent blocks, then exponentially spaced ones, always ending
+  with genesis, so a peer can find the common ancestor in O(log n) entries.
+  """
+  height = len(chain) - 1 if tip is None else tip
+  locator = []
+  step = 1
+  while height > 0:
+    locator.append([height, chain[height].hash])
+    if len(locator) >= DENSE_LOCATOR_ENTRIES:
+      step *= 2
+    height -= step
+  locator.append([0, chain[0].hash])
+  return locator
+
+
+class ChainSync:
+  """Headers-first synchronization against a single peer at a time.
+
+  1. A peer advertises its tip (TIP) and we send a block locator (GET_HEADERS).
+  2. The peer finds our common ancestor and returns the following headers.
+  3. We check the header hashes and links, and once the branch is longer
+     than ours we request only the missing bodies in ranges (GET_BLOCKS).
+  4. When every body is in and matches its header, the branch replaces our
+     blocks above the common ancestor.
+  """
+
+  def __init__(self, node):
+    self.node = node
+    self.lock = threading.Lock()
+    self._reset()
+
+  def _reset(self):
+    self.fork_height = None
+    self.headers = []
+    self.bodies = {}
+    self.requested = False
+    self.continuing = False
+
+  @property
+  def chain(self):
+    return self.node.blockchain.chain
+
+  def tip_message(self):
+    tip = self.chain[-1]
+    return { "type" : "TIP", "data" : { "height" : len(self.chain) - 1, "hash" : tip.hash } }
+
+  def get_headers_message(self, extra=None):
+    locator = build_locator(self.chain)
+    if extra:
+      locator = extra + locator
+    return { "type" : "GET_HEADERS", "data" : { "locator" : locator } }
+
+  def handle_tip(self, tip, reply):
+    """Ask for headers when a peer advertises a tip we do not have"""
+    if tip["height"] >= len(self.chain):
+      reply(self.get_headers_message())
+
+  def handle_get_headers(self, request, reply):
+    """Send the headers following the first locator entry on our chain"""
+    chain = self.chain
+    ancestor = 0
+    for height, block_hash in request["locator"]:
+      if height < len(chain) and chain[height].hash == block_hash:
+        ancestor = height
+        break
+    headers = [block.to_header() for block in chain[ancestor + 1:ancestor + 1 + MAX_HEADERS]]
+    reply({ "type" : "HEADERS", "data" : headers })
+
+  def handle_headers(self, headers, reply):
+    """Validate a batch of headers and request more headers or the bodies"""
+    with self.lock:
+      if not headers:
+        # A branch that is a multiple of MAX_HEADERS long ends with an empty reply
+        if self.continuing:
+          self.continuing = False
+          self._request_bodies(reply)
+        return
+      self.continuing = False
+      first = Block.from_header(headers[0])
+      if self.headers and first.previous_hash == self.headers[-1].hash:
+        # Continuation of a branch longer than MAX_HEADERS
+        previous = self.headers[-1]
+      else:
+        fork_height = first.index - 1
+        if fork_height >= len(self.chain) or self.chain[fork_height].hash != first.previous_hash:
+          print(f"Headers from height {first.index} do not connect to the local chain")
+          return
+        self._reset()
+        self.fork_height = fork_height
+        previous = self.chain[fork_height]
+
+      for header in headers:
+        block = Block.from_header(header)
+        if block.index != previous.index + 1 or block.previous_hash != previous.hash:
+          print(f"Header {block.index} does not link to {previous.index}, aborting sync")
+          self._reset()
+          return
+        if block.hash != block.calculate_hash():
+          print(f"Header {block.index} has an invalid hash, aborting sync")
+          self._reset()
+          return
+        self.headers.append(block)
+        previous = block
+
+      if len(headers) == MAX_HEADERS:
+        tip = self.headers[-1]
+        self.continuing = True
+        reply(self.get_headers_message(extra=[[tip.index, tip.hash]]))
+        return
+      self._request_bodies(reply)
+
+  def _request_bodies(self, reply):
+    """Request the bodies of a complete branch of headers, if it is longer than ours"""
+    if self.fork_height + len(self.headers) < len(self.chain):
+      print("Peer branch is not longer than the local chain")
+      self._reset()
+      return
+
+    self.requested = True
+    start = self.fork_height + 1
+    end = self.fork_height + len(self.headers)
+    for batch_start in range(start, end + 1, BLOCK_BATCH):
+      batch_end = min(batch_start + BLOCK_BATCH - 1, end)
+      reply({ "type" : "GET_BLOCKS", "data" : { "start" : batch_start, "end" : batch_end } })
+    print(f"Syncing {len(self.headers)} blocks above height {self.fork_height}")
+
+  def handle_get_blocks(self, request, reply):
+    """Send the full blocks in an inclusive height range"""
+    start = max(0, request["start"])
+    end = min(request["end"], start + BLOCK_BATCH - 1, len(self.chain) - 1)
+    blocks = [block.to_dict() for block in self.chain[start:end + 1]]
+    reply({ "type" : "BLOCKS", "data" : blocks })
+
+  def handle_blocks(self, blocks, reply):
+    """Match downloaded bodies to their headers and switch branch when complete"""
+    with self.lock:
+      if not self.requested:
+        return
+      for data in blocks:
+        offset = data["index"] - self.fork_height - 1
+        if not 0 <= offset < len(self.headers):
+          continue
+        header = self.headers[offset]
+        block = Block.from_dict(data)
+        # from_dict recomputes the Merkle root, so this checks the body too
+        if block.hash != header.hash or block.calculate_hash() != header.hash:
+          print(f"Block {block.index} does not match its header, aborting sync")
+          self._reset()
+          return
+        self.bodies[block.index] = block
+
+      if len(self.bodies) < len(self.headers):
+        return
+
+      new_blocks = [self.bodies[header.index] for header in self.headers]
+      try:
+        self.node.blockchain.splice_chain(self.fork_height, new_blocks)
+      except ValueError as e:
+        print(f"Local chain changed during sync : {e}")
+        self._reset()
+        return
+      print(f"Synchronized {len(new_blocks)} blocks, new tip at height {len(self.chain) - 1}")
+      self._reset()
+    self.node.broadcast(self.tip_message())
@@ -0,0 +1,170 @@
+import hashlib
+import random
+
+# Stakes are weighted in units of 10**-8, so the sums in the tree are exact integers
+STAKE_SCALE = 10 ** 8
+
+
+class _Node:
+    __slots__ = ("key", "priority", "weight", "total", "left", "right")
+
+    def __init__(self, key, weight):
+        self.key = key
+        # Derived from the key alone, so the tree's shape depends only on who is staking
+        self.priority = int.from_bytes(hashlib.sha256(str(key).encode()).digest(), "big")
+        self.weight = weight
+        self.total = weight
+        self.left = None
+        self.right = None
+
+
+def _total(node):
+    return node.total if node is not None else 0
+
+
+def _refresh(node):
+    node.total = node.weight + _total(node.left) + _total(node.right)
+
+
+def _split(node, key):
+    """Split a tree into the keys below key and the rest"""
+    if node is None:
+        return None, None
+    if node.key < key:
+        below, rest = _split(node.right, key)
+        node.right = below
+        _refresh(node)
+        return node, rest
+    below, rest = _split(node.left, key)
+    node.left = rest
+    _refresh(node)
+    return below, node
+
+
+def _merge(low, high):
+    """Join two trees where every key of low sorts before every key of high"""
+    if low is None or high is None:
+        return low or high
+    if low.priority > high.priority:
+        low.right = _merge(low.right, high)
+        _refresh(low)
+        return low
+    high.left = _merge(low, high.left)
+    _refresh(high)
+    return high
+
+
+def _insert(node, new):
+    if node is None:
+        return new
+    if new.priority > node.priority:
+        new.left, new.right = _split(node, new.key)
+        _refresh(new)
+        return new
+    if new.key < node.key:
+        node.left = _insert(node.left, new)
+    else:
+        node.right = _insert(node.right, new)
+    _refresh(node)
+    return node
+
+
+def _delete(node, key):
+    if node.key == key:
+        return _merge(node.left, node.right)
+    if key < node.key:
+        node.left = _delete(node.left, key)
+    else:
+        node.right = _delete(node.right, key)
+    _refresh(node)
+    return node
+
+
+class StakeSampler:
+    """Stake-weighted random selection backed by a treap with subtree sums.
+
+    Setting a stake and drawing a validator are both O(log n) expected.
+    Each staker gets its node when first added. Nodes are ordered by key,
+    with heap priorities hashed from the key, so the tree has the same
+    shape on every node that holds the same stakes, whatever order they
+    were set in. Weights are fixed-point integers, so the sums carry no
+    rounding either. A seeded draw therefore picks the same validator
+    everywhere without re-sorting anything.
+    """
+
+    def __init__(self, stakes=None, seed=None):
+        self.random = random.Random(seed)
+        self._root = None
+        self._stakes = {}
+        for key, amount in (stakes or {}).items():
+            self.set_stake(key, amount)
+
+    def __len__(self):
+        return len(self._stakes)
+
+    def __contains__(self, key):
+        return key in self._stakes
+
+    def get_stake(self, key):
+        return self._stakes.get(key, 0)
+
+    @property
+    def total_stake(self):
+        return _total(self._root) / STAKE_SCALE
+
+    def seed(self, seed):
+        self.random.seed(seed)
+
+    def set_stake(self, key, amount):
+        """Set key's stake; a stake of zero or less removes the key"""
+        if amount <= 0:
+            if self._stakes.pop(key, None) is not None:
+                self._root = _delete(self._root, key)
+            return
+        weight = round(amount * STAKE_SCALE)
+        if key in self._stakes:
+            self._reweigh(key, weight)
+        else:
+            self._root = _insert(self._root, _Node(key, weight))
+        self._stakes[key] = amount
+
+    def add_stake(self, key, delta):
+        self.set_stake(key, self.get_stake(key) + delta)
+
+    def remove(self, key):
+        self.set_stake(key, 0)
+
+    def sample(self, seed=None):
+        """Draw a key with probability proportional to its stake, None if empty.
+
+        With a seed the draw is deterministic, e.g. seeded by the previous
+        block hash so every node selects the same validator.
+        """
+        rng = random.Random(seed) if seed is not None else self.random
+        total = _total(self._root)
+        if total <= 0:
+            return None
+        target = rng.randrange(total)
+        node = self._root
+        while True:
+            left = _total(node.left)
+            if target < left:
+                node = node.left
+            elif target < left + node.weight:
+                return node.key
+            else:
+                target -= left + node.weight
+                node = node.right
+
+    def _reweigh(self, key, weight):
+        """Change an existing key's weight, adjusting the sums on its path"""
+        path = []
+        node = self._root
+        while node.key != key:
+            path.append(node)
+            node = node.left if key < node.key else node.right
+        delta = weight - node.weight
+        node.weight = weight
+        node.total += delta
+        for ancestor in path:
+            ancestor.total += delta
@@ -1,82 +1,151 @@
+import atexit
+import threading
+
+from psycopg2.extras import execute_values
+
 from src.utils.Database import Database as db
+from src.staking.sampler import StakeSampler
 
 class StakingPool:
-    @staticmethod
-    def add_stake(public_key, amount):
+    """Stakes cached in memory and written back to the database in batches.
+
+    The whole staking_pools table is read once; after that reads never touch
+    the database. Writes update the cache, mark the key dirty and are
+    coalesced into a single upsert per flush, so a key staked a thousand
+    times between flushes costs one row. With synchronous=True every write
+    is flushed before returning.
+    """
+
+    flush_interval = 1.0
+    synchronous = False
+
+    _stakes = None
+    _sampler = None
+    _dirty = set()
+    _lock = threading.RLock()
+    _flush_lock = threading.Lock()
+    _flusher = None
+    _stop = threading.Event()
+    _exit_hook = False
+
+    @classmethod
+    def configure(cls, flush_interval=None, synchronous=None):
+        """Set how often dirty stakes are flushed and whether writes wait for it."""
+        if flush_interval is not None:
+            cls.flush_interval = flush_interval
+        if synchronous is not None:
+            cls.synchronous = synchronous
+
+    @classmethod
+    def _load(cls):
+        """Read every stake once into the cache and the validator sampler."""
+        with cls._lock:
+            if cls._stakes is None:
+                with db.cursor() as cursor:
+                    cursor.execute("SELECT public_key, total_stake FROM staking_pools;")
+                    rows = cursor.fetchall()
+                cls._stakes = {public_key: float(stake) for public_key, stake in rows}
+                cls._sampler = StakeSampler(cls._stakes)
+            return cls._stakes
+
+    @classmethod
+    def _set(cls, public_key, amount):
+        cls._stakes[public_key] = amount
+        cls._sampler.set_stake(public_key, amount)
+        cls._dirty.add(public_key)
+
+    @classmethod
+    def _written(cls):
+        if cls.synchronous:
+            cls.flush()
+        elif cls._flusher is None:
+            cls._start_flusher()
+
+    @classmethod
+    def add_stake(cls, public_key, amount):
         """Add a stake for a node."""
-        conn = db.get_connection()
-        cursor = conn.cursor()
-
-        # Check if the node already has a stake
-        query_check = "SELECT total_stake FROM staking_pools WHERE public_key = %s;"
-        cursor.execute(query_check, (public_key,))
-        result = cursor.fetchone()
-
-        if result:
-            # Update the existing stake
-            query_update = "UPDATE staking_pools SET total_stake = total_stake + %s WHERE public_key = %s;"
-            cursor.execute(query_update, (amount, public_key))
-        else:
-            # Insert a new stake
-            query_insert = "INSERT INTO staking_pools (public_key, total_stake) VALUES (%s, %s);"
-            cursor.execute(query_insert, (public_key, amount))
-
-        conn.commit()
-        db.release_connection(conn)
-
-    @staticmethod
-    def remove_stake(public_key, amount):
+        with cls._lock:
+            stakes = cls._load()
+            cls._set(public_key, stakes.get(public_key, 0) + float(amount))
+        cls._written()
+
+    @classmethod
+    def remove_stake(cls, public_key, amount):
         """Remove a stake from a node."""
-        conn = db.get_connection()
-        cursor = conn.cursor()
-
-        # Check the current stake of the node
-        query_check = "SELECT total_stake FROM staking_pools WHERE public_key = %s;"
-        cursor.execute(query_check, (public_key,))
-        result = cursor.fetchone()
-
-        if result and result[0] >= amount:
-            # Update the stake by subtracting the amount
-            query_update = "UPDATE staking_pools SET total_stake = total_stake - %s WHERE public_key = %s;"
-            cursor.execute(query_update, (amount, public_key))
-        else:
-            print("Not enough staked coins or node does not exist.")
-
-        conn.commit()
-        db.release_connection(conn)
-
-    @staticmethod
-    def get_stake(public_key):
+        with cls._lock:
+            stakes = cls._load()
+            stake = stakes.get(public_key)
+            if stake is None or stake < amount:
+                print("Not enough staked coins or node does not exist.")
+                return False
+            cls._set(public_key, stake - float(amount))
+        cls._written()
+        return True
+
+    @classmethod
+    def get_stake(cls, public_key):
         """Get the amount of staked coins for a node."""
-        conn = db.get_connection()
-        cursor = conn.cursor()
-
-        query = "SELECT total_stake FROM staking_pools WHERE public_key = %s;"
-        cursor.execute(query, (public_key,))
-        result = cursor.fetchone()
-
-        db.release_connection(conn)
-        return result[0] if result else 0
-
-    @staticmethod
-    def select_validator():
-        """Select a validator based on stake."""
-        conn = db.get_connection()
-        cursor = conn.cursor()
-
-        # Fetch all stakes from the database
-        query = "SELECT public_key, total_stake FROM staking_pools;"
-        cursor.execute(query)
-        stakes = cursor.fetchall()
-
-        db.release_connection(conn)
-
-        # Calculate the total staked amount
-        total_staked = sum(stake[1] for stake in stakes)
-        selected = None
-
-        for public_key, stake in stakes:
-            if selected is None or stake / total_staked > stakes[selected][1] / total_staked:
-                selected = public_key
-
-        return selected
+        return cls._load().get(public_key, 0)
+
+    @classmethod
+    def select_validator(cls, seed=None):
+        """Select a validator with probability proportional to its stake."""
+        cls._load()
+        return cls._sampler.sample(seed)
+
+    @classmethod
+    def flush(cls):
+        """Upsert every dirty stake in one transaction, returning the row count."""
+        with cls._flush_lock:
+            with cls._lock:
+                if not cls._dirty:
+                    return 0
+                rows = [(public_key, cls._stakes[public_key]) for public_key in cls._dirty]
+                cls._dirty = set()
+
+            try:
+                with db.cursor() as cursor:
+                    execute_values(
+                        cursor,
+                        "INSERT INTO staking_pools (public_key, total_stake) VALUES %s "
+                        "ON CONFLICT (public_key) DO UPDATE SET total_stake = EXCLUDED.total_stake;",
+                        rows,
+                    )
+            except Exception as e:
+                with cls._lock:
+                    cls._dirty.update(public_key for public_key, _ in rows)
+                print(f"Failed to flush {len(rows)} stakes : {e}")
+                raise
+            return len(rows)
+
+    @classmethod
+    def _start_flusher(cls):
+        with cls._lock:
+            if cls._flusher is not None:
+                return
+            cls._stop.clear()
+            cls._flusher = threading.Thread(target=cls._flush_forever, daemon=True)
+            cls._flusher.start()
+            if not cls._exit_hook:
+                atexit.register(cls.close)
+                cls._exit_hook = True
+
+    @classmethod
+    def _flush_forever(cls):
+        while not cls._stop.wait(cls.flush_interval):
+            try:
+                cls.flush()
+            except Exception:
+                # Rows stay dirty and are retried on the next tick
+                pass
+
+    @classmethod
+    def close(cls):
+        """Stop the background flusher and write out what is still dirty."""
+        flusher = cls._flusher
+        if flusher is not None:
+            cls._stop.set()
+            flusher.join()
+            cls._flusher = None
+        if cls._dirty:
+            cls.flush()
@@ -1,29 +1,225 @@
+import re
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
-from psycopg2 import pool
+from psycopg2 import extensions
+
+# %s placeholders, skipping escaped %%s
+PLACEHOLDER = re.compile(r"(?<!%)%s")
+
+
+class ConnectionPool:
+    """Thread-safe pool of psycopg2 connections.
+
+    Checkouts block on a condition variable until a connection is idle or
+    the pool may grow, instead of failing like SimpleConnectionPool. Each
+    connection keeps its own cache of prepared statements, and the pool
+    records how long callers waited and how busy it is.
+    """
+
+    def __init__(self, min_connections=1, max_connections=20, timeout=30.0, connect=psycopg2.connect, **connect_kwargs):
+        if not 0 <= min_connections <= max_connections or max_connections < 1:
+            raise ValueError("Invalid pool sizing")
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._connect = connect
+        self._connect_kwargs = connect_kwargs
+        self._condition = threading.Condition()
+        self._idle = []
+        self._in_use = set()
+        self._size = 0
+        self._closed = False
+        self.prepared = {}
+        self.metrics = {
+            "checkouts": 0, "created": 0, "discarded": 0, "timeouts": 0,
+            "wait_total": 0.0, "wait_max": 0.0, "peak_in_use": 0,
+        }
+        for _ in range(min_connections):
+            self._size += 1
+            self._idle.append(self._open())
+
+    def _open(self):
+        try:
+            conn = self._connect(**self._connect_kwargs)
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self.prepared[conn] = {}
+            self.metrics["created"] += 1
+        return conn
+
+    def getconn(self, timeout=None):
+        """Check out a connection, waiting up to timeout seconds for one to free up."""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise Exception("Connection pool is closed.")
+                if self._idle:
+                    conn = self._idle.pop()
+                    create = False
+                    break
+                if self._size < self.max_connections:
+                    # Reserve the slot now and connect outside the lock
+                    self._size += 1
+                    create = True
+                    break
+                remaining = timeout - (time.monotonic() - started)
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    if not self._idle and self._size >= self.max_connections:
+                        self.metrics["timeouts"] += 1
+                        raise Exception(f"No database connection available after {timeout:.1f}s")
+        if create:
+            conn = self._open()
+        elif conn.closed:
+            self._discard(conn)
+            return self.getconn(max(0.0, timeout - (time.monotonic() - started)))
+
+        waited = time.monotonic() - started
+        with self._condition:
+            self._in_use.add(conn)
+            self.metrics["checkouts"] += 1
+            self.metrics["wait_total"] += waited
+            self.metrics["wait_max"] = max(self.metrics["wait_max"], waited)
+            self.metrics["peak_in_use"] = max(self.metrics["peak_in_use"], len(self._in_use))
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Return a connection, rolling back whatever transaction it left open."""
+        with self._condition:
+            if conn not in self._in_use:
+                raise Exception("Connection does not belong to this pool.")
+            self._in_use.discard(conn)
+        if not close and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                close = True
+        if close or conn.closed or self._closed:
+            self._discard(conn)
+            return
+        with self._condition:
+            self._idle.append(conn)
+            self._condition.notify()
+
+    def _discard(self, conn):
+        self.prepared.pop(conn, None)
+        if not conn.closed:
+            conn.close()
+        with self._condition:
+            self._size -= 1
+            self.metrics["discarded"] += 1
+            self._condition.notify()
+
+    def statement_name(self, conn, query):
+        """Name of the prepared statement for query on conn, or None if not prepared yet."""
+        return self.prepared.get(conn, {}).get(query)
+
+    def next_statement_name(self, conn):
+        return f"stmt_{len(self.prepared.get(conn, ()))}"
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self.metrics)
+            stats.update(size=self._size, idle=len(self._idle), in_use=len(self._in_use))
+        stats["wait_avg"] = stats["wait_total"] / stats["checkouts"] if stats["checkouts"] else 0.0
+        return stats
+
+    def closeall(self):
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._condition.notify_all()
+        for conn in idle:
+            self._discard(conn)
+
 
 class Database:
     _connection_pool = None
 
     @staticmethod
-    def initialize(host, database, user, password, port=5432):
+    def initialize(host, database, user, password, port=5432, min_connections=1, max_connections=20,
+                   timeout=30.0, connect=psycopg2.connect):
         """Initialize the connection pool."""
-        Database._connection_pool = psycopg2.pool.SimpleConnectionPool(
-            1, 20, host=host, database=database, user=user, password=password, port=port
+        Database._connection_pool = ConnectionPool(
+            min_connections, max_connections, timeout, connect=connect,
+            host=host, database=database, user=user, password=password, port=port
         )
 
     @staticmethod
-    def get_connection():
-        """Get a connection from the pool."""
+    def _pool():
         if Database._connection_pool is None:
             raise Exception("Database connection pool is not initialized.")
-        return Database._connection_pool.getconn()
+        return Database._connection_pool
+
+    @staticmethod
+    def get_connection(timeout=None):
+        """Get a connection from the pool."""
+        return Database._pool().getconn(timeout)
 
     @staticmethod
-    def release_connection(connection):
+    def release_connection(connection, close=False):
         """Release a connection back to the pool."""
-        if Database._connection_pool is None:
-            raise Exception("Database connection pool is not initialized.")
-        Database._connection_pool.putconn(connection)
+        Database._pool().putconn(connection, close)
+
+    @staticmethod
+    @contextmanager
+    def connection(timeout=None):
+        """Check out a connection that commits on success, rolls back on error and is always released."""
+        conn = Database.get_connection(timeout)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            Database.release_connection(conn)
+
+    @staticmethod
+    @contextmanager
+    def cursor(timeout=None):
+        """Cursor on a pooled connection, see connection()."""
+        with Database.connection(timeout) as conn:
+            with conn.cursor() as cursor:
+                yield cursor
+
+    @staticmethod
+    def execute_prepared(cursor, query, params=()):
+        """Run a %s-parameterized query as a server-side prepared statement.
+
+        The statement is prepared on the first use per connection and reused
+        through EXECUTE afterwards, so Postgres parses and plans it once.
+        """
+        pool = Database._pool()
+        conn = cursor.connection
+        name = pool.statement_name(conn, query)
+        if name is None:
+            counter = iter(range(1, len(params) + 1))
+            statement = PLACEHOLDER.sub(lambda match: f"${next(counter)}", query).rstrip().rstrip(";")
+            name = pool.next_statement_name(conn)
+            cursor.execute(f"PREPARE {name} AS {statement}")
+            # PREPARE is session scoped, a later rollback does not undo it
+            pool.prepared.setdefault(conn, {})[query] = name
+        if params:
+            cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cursor.execute(f"EXECUTE {name}")
+        return cursor
+
+    @staticmethod
+    def stats():
+        """Pool usage and checkout wait metrics."""
+        return Database._pool().stats()
 
     @staticmethod
     def close_all_connections():
@@ -1,9 +1,18 @@
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
 from cryptography.hazmat.primitives import serialization, hashes
 
-def generate_keys():
-  """Generate an RSA keys pair"""
-  private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+# Key types an identity can be generated with
+KEY_TYPES = ("rsa", "ed25519")
+
+def generate_keys(key_type="rsa"):
+  """Generate an RSA or Ed25519 keys pair"""
+  if key_type not in KEY_TYPES:
+    raise ValueError(f"Unknown key type : {key_type}, expected one of {', '.join(KEY_TYPES)}")
+  if key_type == "ed25519":
+    private_key = Ed25519PrivateKey.generate()
+  else:
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
   public_key = private_key.public_key()
   return private_key, public_key
 
@@ -22,9 +31,9 @@ def serialize_key(key, is_private=False):
 def deserialize_key(key, is_private=False):
   """Deserialize a public or private key from bytes"""
   if is_private:
-    return serialization.load_pem_private_key(key_bytes, password=None)
+    return serialization.load_pem_private_key(key, password=None)
   
-  return serialization.load_pem_public_key(key_bytes)
+  return serialization.load_pem_public_key(key)
 
 def encrypt_message(message, public_key):
   """Encrypt a message with a public key"""
@@ -40,10 +49,10 @@ def encrypt_message(message, public_key):
 def decrypt_message(message, private_key):
   """Decrypt a message with a private key"""
   return private_key.decrypt(
-    ciphertext,
+    message,
     padding.OAEP(
       mgf=padding.MGF1(algorithm=hashes.SHA256()),
-      algorothm=hashes.SHA256(),
+      algorithm=hashes.SHA256(),
       label=None
     )
   ).decode()
@@ -51,6 +60,8 @@ def decrypt_message(message, private_key):
 
 def sign_message(message, private_key):
   """Sign a message with a sender's private key"""
+  if isinstance(private_key, Ed25519PrivateKey):
+    return private_key.sign(message.encode())
   return private_key.sign(
     message.encode(),
     padding.PSS(
@@ -63,6 +74,9 @@ def sign_message(message, private_key):
 def verify_signature(message, signature, public_key):
   """Verify a message's signature using the sender's public key"""
   try:
+    if isinstance(public_key, Ed25519PublicKey):
+      public_key.verify(signature, message.encode())
+      return True
     public_key.verify(
       signature, 
       message.encode(),
@@ -0,0 +1,66 @@
+import os
+import tempfile
+
+from src.utils.crypto_utils import deserialize_key, generate_keys, serialize_key
+
+# Key type given to new identities; Ed25519 keys are generated and sign in microseconds
+DEFAULT_KEY_TYPE = "ed25519"
+
+
+def load_identity(path=None, key_type=DEFAULT_KEY_TYPE):
+  """Return the (private key, public key) stored at path, creating it on first use.
+
+  A stored key of either type is loaded as is, so a node keeps its
+  identity across restarts. Without a path a fresh key pair is generated
+  and nothing is written. When two nodes start on the same path at once,
+  only one key is written and both load it.
+  """
+  if path is None:
+    return generate_keys(key_type)
+  try:
+    return read_identity(path)
+  except FileNotFoundError:
+    pass
+  private_key, public_key = generate_keys(key_type)
+  if not save_identity(path, private_key, replace=False):
+    # Another process created the identity first
+    return read_identity(path)
+  return private_key, public_key
+
+
+def read_identity(path):
+  """Load the (private key, public key) stored at path"""
+  with open(path, "rb") as f:
+    private_key = deserialize_key(f.read(), is_private=True)
+  return private_key, private_key.public_key()
+
+
+def save_identity(path, private_key, replace=True):
+  """Write a private key as PEM, readable by the owner only, atomically.
+
+  With replace=False an existing file is left alone and False is returned.
+  """
+  directory = os.path.dirname(os.path.abspath(path))
+  os.makedirs(directory, exist_ok=True)
+  fd, temporary = tempfile.mkstemp(dir=directory, prefix=".identity-")
+  try:
+    os.fchmod(fd, 0o600)
+    with os.fdopen(fd, "wb") as f:
+      f.write(serialize_key(private_key, is_private=True))
+      f.flush()
+      os.fsync(f.fileno())
+    if replace:
+      os.replace(temporary, path)
+      return True
+    # Linking fails if the path exists, and never exposes a partly written key
+    try:
+      os.link(temporary, path)
+    except FileExistsError:
+      return False
+    finally:
+      os.unlink(temporary)
+    return True
+  except BaseException:
+    if os.path.exists(temporary):
+      os.unlink(temporary)
+    raise
@@ -0,0 +1,168 @@
+import os
+
+import pytest
+
+from src.blockchain.block import Block
+from src.blockchain.block_store import BlockStore, CorruptStoreError, INDEX_FILE, INDEX_RECORD, segment_name
+from src.blockchain.blockchain import Blockchain
+from src.blockchain.transaction import Transaction
+
+
+def make_chain(count):
+    blocks = [Block(0, "Genesis Block", "0")]
+    for height in range(1, count):
+        transactions = [{"sender": "Network", "receiver": f"r{height}", "amount": 1,
+                         "transaction_type": "TRANSFER", "timestamp": height}]
+        blocks.append(Block(height, transactions, blocks[-1].hash))
+    return blocks
+
+
+def test_blocks_round_trip_across_segments(tmp_path):
+    blocks = make_chain(50)
+    store = BlockStore(str(tmp_path), segment_size=1024)
+    for block in blocks:
+        store.append(block)
+    assert len(store) == 50
+    assert len([name for name in os.listdir(tmp_path) if name.startswith("blk")]) > 1
+    for block in blocks:
+        stored = store.read_block(block.index)
+        assert stored.hash == block.hash == store.block_hash(block.index)
+        # Dict and object transactions hash to the same Merkle leaves
+        assert stored.calculate_merkle_root() == block.merkle_root == stored.merkle_root
+    assert store.read_block(0).transactions == "Genesis Block"
+    assert [tx.to_dict() for tx in store.read_block(7).transactions] == [dict(blocks[7].transactions[0], fee=0, signature=None)]
+    store.close()
+
+
+def test_reopen_and_truncate(tmp_path):
+    blocks = make_chain(30)
+    store = BlockStore(str(tmp_path), segment_size=1024)
+    for block in blocks:
+        store.append(block)
+    store.close()
+
+    store = BlockStore(str(tmp_path), segment_size=1024)
+    assert len(store) == 30
+    store.truncate(12)
+    assert len(store) == 12
+    with pytest.raises(IndexError):
+        store.read(12)
+    store.append(blocks[12])
+    assert store.read_block(12).hash == blocks[12].hash
+    store.close()
+
+
+def test_torn_writes_are_cut_off_on_open(tmp_path):
+    blocks = make_chain(5)
+    store = BlockStore(str(tmp_path))
+    for block in blocks:
+        store.append(block)
+    store.close()
+    # Half an index record and a stray block tail, as left by a crash mid-append
+    with open(tmp_path / INDEX_FILE, "ab") as index_file:
+        index_file.write(b"\0" * (INDEX_RECORD.size // 2))
+    with open(tmp_path / segment_name(0), "ab") as segment_file:
+        segment_file.write(b"partial block")
+
+    store = BlockStore(str(tmp_path))
+    assert len(store) == 5
+    store.append(Block(5, "next", blocks[4].hash))
+    assert store.read_block(5).transactions == "next"
+    store.close()
+
+
+def flip_byte(path, offset):
+    with open(path, "r+b") as stored:
+        stored.seek(offset)
+        byte = stored.read(1)
+        stored.seek(offset)
+        stored.write(bytes([byte[0] ^ 0xFF]))
+
+
+def test_blocks_lost_from_the_tail_are_dropped_on_open(tmp_path):
+    blocks = make_chain(10)
+    store = BlockStore(str(tmp_path))
+    for block in blocks:
+        store.append(block)
+    segment, offset, _, _, _ = store.record(8)
+    last_offset = store.record(7)[1]
+    store.close()
+    # Index records reached the disk but the last two blocks did not, and block 7 is half written
+    with open(tmp_path / segment_name(segment), "r+b") as segment_file:
+        segment_file.truncate(offset)
+    flip_byte(tmp_path / segment_name(segment), last_offset + 3)
+
+    store = BlockStore(str(tmp_path))
+    assert len(store) == 7
+    assert os.path.getsize(tmp_path / segment_name(segment)) == last_offset
+    store.append(blocks[7])
+    assert store.read_block(7).hash == blocks[7].hash
+    store.close()
+
+
+def test_corruption_before_the_tail_raises_instead_of_truncating(tmp_path):
+    blocks = make_chain(40)
+    store = BlockStore(str(tmp_path), segment_size=1024)
+    for block in blocks:
+        store.append(block)
+    last_segment = store.record(39)[0]
+    first_in_last = next(height for height in range(40) if store.record(height)[0] == last_segment)
+    middle_segment, middle_offset, _, _, _ = store.record(5)
+    before_last = store.record(first_in_last - 1)
+    store.close()
+    index_size = os.path.getsize(tmp_path / INDEX_FILE)
+
+    # A damaged block in an earlier segment is only found when read
+    flip_byte(tmp_path / segment_name(middle_segment), middle_offset + 2)
+    store = BlockStore(str(tmp_path), segment_size=1024)
+    assert len(store) == 40
+    with pytest.raises(CorruptStoreError):
+        store.read(5)
+    store.close()
+
+    # The whole last segment is gone and the block before it is damaged too
+    os.remove(tmp_path / segment_name(last_segment))
+    flip_byte(tmp_path / segment_name(before_last[0]), before_last[1] + 2)
+    with pytest.raises(CorruptStoreError):
+        BlockStore(str(tmp_path), segment_size=1024)
+    assert os.path.getsize(tmp_path / INDEX_FILE) == index_size
+
+
+def test_blockchain_refuses_to_load_a_damaged_store(tmp_path):
+    blockchain = Blockchain(data_dir=str(tmp_path), window=4)
+    for height in range(1, 10):
+        transaction = Transaction("Network", f"r{height}", 1, transaction_type="TRANSFER", timestamp=height)
+        assert blockchain.append_block(Block(height, [transaction], blockchain.chain[-1].hash))
+    segment, offset, _, _, _ = blockchain.chain.store.record(4)
+    blockchain.chain.store.close()
+    flip_byte(tmp_path / segment_name(segment), offset + 2)
+
+    with pytest.raises(CorruptStoreError):
+        Blockchain(data_dir=str(tmp_path), window=4)
+    store = BlockStore(str(tmp_path))
+    assert len(store) == 10
+    store.close()
+
+
+def test_blockchain_restarts_from_disk_with_a_bounded_window(tmp_path):
+    blockchain = Blockchain(data_dir=str(tmp_path), window=4)
+    for height in range(1, 20):
+        transaction = Transaction("Network", f"r{height}", 1, transaction_type="TRANSFER", timestamp=height)
+        assert blockchain.append_block(Block(height, [transaction], blockchain.chain[-1].hash))
+    assert len(blockchain.chain.recent) == 4
+    genesis_hash = blockchain.chain[0].hash
+    blockchain.chain.store.close()
+
+    restarted = Blockchain(data_dir=str(tmp_path), window=4)
+    assert len(restarted.chain) == 20
+    assert restarted.chain[0].hash == genesis_hash
+    assert restarted.get_balance("Network") == 1000 - 19
+    assert restarted.get_balance("r7") == 1
+    assert restarted.is_chain_valid(restarted.chain)
+
+    fork = [Block(18, [Transaction("Network", "fork", 5, transaction_type="TRANSFER", timestamp=1)], restarted.chain[17].hash)]
+    for height in (19, 20):
+        fork.append(Block(height, [], fork[-1].hash))
+    restarted.splice_chain(17, fork)
+    assert len(restarted.chain) == 21 and restarted.chain[-1].hash == fork[-1].hash
+    assert restarted.get_balance("r18") == 0 and restarted.get_balance("fork") == 5
@@ -0,0 +1,263 @@
+import hashlib
+
+from src.blockchain import blockchain as blockchain_module
+from src.blockchain.block import Block
+from src.blockchain.blockchain import Blockchain
+from src.blockchain.merkle_tree import MerkleTree
+from src.blockchain.transaction import Transaction
+
+
+def extend_chain(chain, count, tag="main"):
+    chain = list(chain)
+    for _ in range(count):
+        index = len(chain)
+        chain.append(Block(index, [{"sender": "Network", "receiver": tag, "amount": index}], chain[-1].hash))
+    return chain
+
+
+def test_tampered_block_is_rejected():
+    blockchain = Blockchain()
+    chain = extend_chain(blockchain.chain, 20)
+    chain[10].nonce += 1
+    assert not blockchain.is_chain_valid(chain)
+
+
+def test_validation_resumes_from_checkpoint():
+    blockchain = Blockchain()
+    chain = extend_chain(blockchain.chain, 20)
+    assert blockchain.is_chain_valid(chain)
+    # Only an adopted chain is checkpointed
+    assert blockchain.last_checkpoint(chain) == -1
+    assert blockchain.replace_chain(chain)
+    assert blockchain.last_checkpoint(chain) == 20
+
+    # Only the five new blocks are re-hashed
+    longer = extend_chain(chain, 5)
+    assert blockchain.last_checkpoint(longer) == 20
+    assert blockchain.is_chain_valid(longer)
+
+
+def forge(block, claimed_hash, tag="forged"):
+    forged = Block(block.index, [{"sender": "Network", "receiver": tag, "amount": 1}], block.previous_hash)
+    forged.hash = claimed_hash
+    return forged
+
+
+def test_forged_blocks_below_the_checkpoint_are_never_adopted():
+    blockchain = Blockchain()
+    chain = extend_chain(blockchain.chain, 20)
+    assert blockchain.replace_chain(chain)
+    ours = [block.hash for block in blockchain.chain]
+
+    # A forged block claiming our hash is kept out, our own block stays
+    lying = list(chain)
+    lying[10] = forge(chain[10], chain[10].hash)
+    lying = extend_chain(lying, 5)
+    assert blockchain.replace_chain(lying)
+    assert blockchain.chain[10].calculate_hash() == ours[10]
+    assert blockchain.get_balance("forged") == 0
+
+    # A branch from height 10 whose block 20 claims our checkpointed hash
+    branch = extend_chain(blockchain.chain[:11], 9, tag="branch")
+    branch.append(forge(Block(20, [], branch[-1].hash), blockchain.chain[20].hash))
+    branch = extend_chain(branch, 10, tag="branch")
+    before = [block.hash for block in blockchain.chain]
+    assert blockchain.last_checkpoint(branch) == -1
+    assert not blockchain.is_chain_valid(branch)
+    assert not blockchain.replace_chain(branch)
+    assert [block.hash for block in blockchain.chain] == before
+    assert blockchain.get_balance("branch") == 0
+
+
+def test_parallel_validation_matches_serial(monkeypatch):
+    monkeypatch.setattr(blockchain_module, "PARALLEL_VALIDATION_THRESHOLD", 10)
+    blockchain = Blockchain()
+    chain = extend_chain(blockchain.chain, 40)
+    genesis = blockchain.chain[0].hash
+    assert blockchain._validate_parallel(genesis, chain, 1, 3) is None
+    assert blockchain._validate_parallel("00" * 32, chain, 1, 3) == (1, "an invalid previous hash")
+
+    tampered = list(chain)
+    tampered[30] = forge(chain[30], chain[30].hash)
+    assert blockchain._validate_parallel(genesis, tampered, 1, 3) == (30, "an invalid hash")
+    assert not blockchain.replace_chain(tampered, workers=3)
+    assert blockchain.replace_chain(chain, workers=3)
+    assert [block.hash for block in blockchain.chain] == [block.hash for block in chain]
+
+
+def test_replace_chain_keeps_blocks_before_fork():
+    blockchain = Blockchain()
+    for block in extend_chain(blockchain.chain, 10)[1:]:
+        assert blockchain.append_block(block)
+    shared = blockchain.chain[:6]
+    fork = extend_chain(shared, 8, tag="fork")
+
+    assert blockchain.find_fork_height(fork) == 5
+    assert blockchain.replace_chain(fork)
+    assert [block.hash for block in blockchain.chain] == [block.hash for block in fork]
+    assert blockchain.chain[3] is shared[3]
+    assert not blockchain.replace_chain(fork[:-1])
+
+
+def test_reorg_unwinds_only_diverged_blocks():
+    blockchain = Blockchain()
+    for block in extend_chain(blockchain.chain, 4)[1:]:
+        assert blockchain.append_block(block)
+    assert blockchain.get_balance("main") == 1 + 2 + 3 + 4
+    assert blockchain.get_balance("Network") == 1000 - 10
+
+    fork = extend_chain(blockchain.chain[:3], 3, tag="fork")
+    assert blockchain.replace_chain(fork)
+    assert blockchain.get_balance("main") == 1 + 2
+    assert blockchain.get_balance("fork") == 3 + 4 + 5
+    assert blockchain.get_balance("Network") == 1000 - 15
+
+
+def test_branch_with_unaffordable_transfer_is_rejected():
+    blockchain = Blockchain()
+    for block in extend_chain(blockchain.chain, 3)[1:]:
+        assert blockchain.append_block(block)
+    original = [block.hash for block in blockchain.chain]
+    fork = extend_chain(blockchain.chain[:2], 2, tag="fork")
+    fork.append(Block(4, [{"sender": "fork", "receiver": "main", "amount": 1000}], fork[-1].hash))
+
+    assert not blockchain.replace_chain(fork)
+    assert [block.hash for block in blockchain.chain] == original
+    assert blockchain.get_balance("main") == 1 + 2 + 3
+    assert "fork" not in blockchain.balances
+
+
+def test_indexes_follow_appends_and_reorgs():
+    blockchain = Blockchain()
+    for block in extend_chain(blockchain.chain, 4)[1:]:
+        assert blockchain.append_block(block)
+    third = blockchain.chain[3]
+    assert blockchain.find_block(third.hash) is third
+    transaction_hash = MerkleTree.hash_leaf(third.transactions[0]).hex()
+    transaction, height = blockchain.find_transaction(transaction_hash)
+    assert height == 3 and transaction.amount == 3
+    assert [tx.amount for tx in blockchain.get_transaction_history("main")] == [1, 2, 3, 4]
+    assert [tx.amount for tx in blockchain.get_transaction_history("Network", limit=2)] == [3, 4]
+
+    fork = extend_chain(blockchain.chain[:3], 3, tag="fork")
+    assert blockchain.replace_chain(fork)
+    assert blockchain.find_block(blockchain.chain[4].hash) is blockchain.chain[4]
+    assert blockchain.find_transaction(MerkleTree.hash_leaf({"sender": "Network", "receiver": "main", "amount": 4}).hex()) is None
+    assert [tx.amount for tx in blockchain.get_transaction_history("main")] == [1, 2]
+    assert [tx.amount for tx in blockchain.get_transaction_history("fork")] == [3, 4, 5]
+    assert len(blockchain.index.address_history("Network")) == 5
+
+
+def test_fees_are_funded_with_pending_spends_and_paid_to_the_validator():
+    blockchain = Blockchain()
+    blockchain.state.set_balance("alice", 100)
+    blockchain.set_stake("validator", 10)
+
+    def transfer(amount, fee, timestamp):
+        return Transaction("alice", "bob", amount, transaction_type="TRANSFER", timestamp=timestamp, fee=fee)
+
+    assert blockchain.add_transaction(transfer(60, 5, 1))
+    # 65 is already pending, so 30 plus a fee of 10 overdraws
+    assert not blockchain.add_transaction(transfer(30, 10, 2))
+    assert blockchain.add_transaction(transfer(30, 5, 3))
+    assert blockchain.mempool.pending_spend("alice") == 100
+
+    transactions = [transaction.to_dict() for transaction in blockchain.mempool.pop_best()]
+    assert blockchain.mempool.pending_spend("alice") == 0
+    assert blockchain.append_block(Block(1, transactions, blockchain.chain[0].hash))
+    assert [blockchain.get_balance(a) for a in ("alice", "bob", "validator")] == [0, 90, 10]
+
+    # A block spending more than the balance once fees are counted is refused
+    overdraft = [transfer(95, 10, 4).to_dict()]
+    blockchain.state.set_balance("alice", 100)
+    assert not blockchain.append_block(Block(2, overdraft, blockchain.chain[1].hash))
+    assert blockchain.get_balance("validator") == 10
+
+
+def test_stakes_move_with_balances_and_are_undone_by_reorgs():
+    blockchain = Blockchain()
+    blockchain.state.set_balance("alice", 100)
+    genesis = blockchain.chain[0]
+
+    def staking(transaction_type, amount, timestamp):
+        return Transaction("alice", "alice", amount, transaction_type=transaction_type, timestamp=timestamp).to_dict()
+
+    block = Block(1, [staking("STAKE", 70, 1), staking("UNSTAKE", 20, 2)], genesis.hash)
+    assert blockchain.append_block(block)
+    assert blockchain.get_balance("alice") == 50 and blockchain.staking_pool == {"alice": 50}
+    assert blockchain.select_validator(seed="x") == "alice"
+
+    # Unstaking more than the stake would mint coins
+    assert not blockchain.append_block(Block(2, [staking("UNSTAKE", 60, 3)], block.hash))
+    assert not blockchain.process_unstaking(Transaction("alice", "alice", 60, transaction_type="UNSTAKE", timestamp=3))
+    assert blockchain.get_balance("alice") == 50 and blockchain.staking_pool == {"alice": 50}
+
+    fork = extend_chain([genesis], 2, tag="fork")
+    assert blockchain.replace_chain(fork)
+    assert blockchain.get_balance("alice") == 100 and blockchain.staking_pool == {}
+    assert blockchain.select_validator(seed="x") is None
+
+
+def test_timestamp_and_fee_cannot_trade_digits_in_the_hash():
+    pairs = [(1700000000.51, 0), (1700000000.5, 1), (1700000000.5, 10), (1700000000.51, 0.5), ("1700000000.5", 1)]
+    hashes = {Transaction("alice", "bob", 5, timestamp=timestamp, fee=fee).calculate_hash() for timestamp, fee in pairs}
+    assert len(hashes) == len(pairs)
+    # Fee-less transactions keep their original hash
+    legacy = Transaction("alice", "bob", 5, transaction_type="TRANSFER", timestamp=1.5)
+    assert legacy.calculate_hash() == hashlib.sha256(b"alicebob5TRANSFER1.5").hexdigest()
+
+
+def test_mempool_follows_included_and_unwound_transactions():
+    blockchain = Blockchain()
+    blockchain.state.set_balance("alice", 100)
+    blockchain.set_stake("validator", 10)
+    # Validation by other nodes is simulated with a random outcome
+    blockchain.validate_block = lambda block=None: True
+    genesis = blockchain.chain[0]
+    included = Transaction("alice", "bob", 30, transaction_type="TRANSFER", timestamp=1, fee=1)
+    assert blockchain.add_transaction(included)
+    blockchain.add_block([included])
+    assert len(blockchain.chain) == 2 and len(blockchain.mempool) == 0
+    # A confirmed transaction cannot be queued again
+    assert not blockchain.add_transaction(included)
+
+    # A reorg to a branch without it puts it back in the pool
+    assert blockchain.replace_chain(extend_chain([genesis], 2, tag="fork"))
+    assert included.calculate_hash() in blockchain.mempool
+    assert blockchain.mempool.pending_spend("alice") == 31
+
+
+def test_create_block_extends_the_tip_and_keeps_transactions_of_a_rejected_block():
+    blockchain = Blockchain()
+    blockchain.state.set_balance("alice", 100)
+    blockchain.staking_system.register_candidate("delegate")
+    first = Transaction("alice", "bob", 10, transaction_type="TRANSFER", timestamp=1)
+    assert blockchain.add_transaction(first)
+    block = blockchain.create_block()
+    assert block.index == 1 and blockchain.chain[-1] is block
+    assert len(blockchain.mempool) == 0 and blockchain.get_balance("bob") == 10
+
+    second = Transaction("alice", "bob", 20, transaction_type="TRANSFER", timestamp=2)
+    assert blockchain.add_transaction(second)
+    blockchain.append_block = lambda block: False
+    assert blockchain.create_block() is None
+    assert len(blockchain.chain) == 2 and second.calculate_hash() in blockchain.mempool
+
+
+def test_add_block_pays_fees_once_and_reorgs_undo_slashes():
+    blockchain = Blockchain()
+    blockchain.state.set_balance("alice", 100)
+    blockchain.set_stake("validator", 10)
+    genesis = blockchain.chain[0]
+    blockchain.validate_block = lambda block=None: True
+    assert blockchain.add_block([Transaction("alice", "bob", 10, transaction_type="TRANSFER", timestamp=1, fee=2)])
+    assert blockchain.get_balance("validator") == 2 and blockchain.staking_pool == {"validator": 10}
+
+    blockchain.validate_block = lambda block=None: False
+    assert blockchain.add_block([]) is False
+    assert len(blockchain.chain) == 2 and blockchain.staking_pool == {"validator": 9}
+
+    # The slash belongs to the tip it was built on, so unwinding that tip undoes it
+    assert blockchain.replace_chain(extend_chain([genesis], 2, tag="fork"))
+    assert blockchain.staking_pool == {"validator": 10}
+    assert blockchain.get_balance("validator") == 0
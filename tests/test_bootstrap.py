@@ -0,0 +1,92 @@
+import asyncio
+import socket
+import threading
+
+from src.boostrap import BootstrapServer
+from src.network.node import Node
+from src.network.peer_discovery import BootstrapNode, RateLimiter
+
+
+def test_registrations_expire_unless_renewed():
+    registry = BootstrapNode(ttl=10, sample_size=4)
+    for i in range(6):
+        registry.register_peer(f"10.0.0.{i}:5000", now=0)
+    registry.register_peer("10.0.0.0:5000", now=8)
+    sample = registry.register_peer("10.0.0.9:5000", now=12)
+    assert sorted(registry.addresses) == ["10.0.0.0:5000", "10.0.0.9:5000"]
+    assert sample == ["10.0.0.0:5000"]
+
+
+def test_sample_is_bounded_distinct_and_excludes_the_caller():
+    registry = BootstrapNode(sample_size=8)
+    for i in range(100):
+        sample = registry.register_peer(f"10.0.{i}.1:5000", now=0)
+    assert len(sample) == 8 == len(set(sample))
+    assert "10.0.99.1:5000" not in sample
+    registry.remove_peer("10.0.5.1:5000")
+    assert len(registry) == 99 and "10.0.5.1:5000" not in registry.positions
+    assert all(registry.addresses[position] == address for address, position in registry.positions.items())
+
+
+def test_rate_limiter_refills_per_source():
+    limiter = RateLimiter(rate=1, burst=2)
+    assert [limiter.allow("a", now=0) for _ in range(3)] == [True, True, False]
+    assert limiter.allow("b", now=0)
+    assert limiter.allow("a", now=1.5)
+
+
+def test_server_answers_concurrent_registrations():
+    async def run():
+        bootstrap = BootstrapServer(rate_limiter=RateLimiter(rate=0, burst=300))
+        server = await bootstrap.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        async def register(i):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(f"REGISTER 10.1.{i // 250}.{i % 250}:5000\n".encode())
+            await writer.drain()
+            response = (await reader.readline()).decode().strip()
+            writer.close()
+            return response
+
+        responses = await asyncio.gather(*(register(i) for i in range(400)))
+        await bootstrap.close()
+        return bootstrap, responses
+
+    bootstrap, responses = asyncio.run(run())
+    assert len(bootstrap.bootstrap_node) == 300
+    assert responses.count("RATE_LIMITED") == 100
+    assert all(len(response.split(",")) <= 32 for response in responses)
+
+
+def test_registrations_must_name_a_host_and_port():
+    bootstrap = BootstrapServer(rate_limiter=RateLimiter(rate=0, burst=100))
+    for address in ("10.0.0.1", "10.0.0.1:", ":5000", "10.0.0.1:http", "10.0.0.1:0", "10.0.0.1:70000", "a,b:5000"):
+        assert bootstrap.handle_request(f"REGISTER {address}", "10.0.0.1") == "ERROR"
+    assert len(bootstrap.bootstrap_node) == 0
+    assert bootstrap.handle_request("REGISTER 10.0.0.1:5000", "10.0.0.1") == ""
+    assert len(bootstrap.bootstrap_node) == 1
+
+
+def test_node_skips_peers_it_cannot_parse():
+    listener = socket.create_server(("127.0.0.1", 0))
+    port = listener.getsockname()[1]
+
+    def answer():
+        connection, _ = listener.accept()
+        with connection:
+            connection.makefile().readline()
+            connection.sendall(b"10.0.0.1:5000,garbage,10.0.0.2:99999,:80,10.0.0.3:6000\n")
+
+    server = threading.Thread(target=answer)
+    server.start()
+    node = Node("127.0.0.1", 0)
+    connected = []
+    node.connect_to_peer = lambda host, peer_port: connected.append((host, peer_port))
+    try:
+        peers = node.connect_to_bootstrap_node("127.0.0.1", port)
+    finally:
+        server.join()
+        listener.close()
+    assert peers == ["10.0.0.1:5000", "10.0.0.3:6000"]
+    assert connected == [("10.0.0.1", 5000), ("10.0.0.3", 6000)]
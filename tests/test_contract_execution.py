@@ -0,0 +1,131 @@
+import copy
+import random
+import threading
+
+import pytest
+
+from src.blockchain.smart_contracts.base_contract import BaseContract
+from src.blockchain.smart_contracts.execution import ContractCall, ExecutionEngine
+from src.blockchain.smart_contracts.token_contract import TokenContract
+
+
+def make_token(accounts):
+    token = TokenContract("creator", "Polo", "POLO", 10 ** 9)
+    for i in range(accounts):
+        token.state["balances"][f"a{i}"] = 100
+    return token
+
+
+def serial_outcome(token, transfers):
+    token = copy.deepcopy(token)
+    errors = []
+    for sender, recipient, amount in transfers:
+        try:
+            token.transfer(sender, recipient, amount)
+            errors.append(False)
+        except Exception:
+            errors.append(True)
+    return token.state, errors, [event["data"] for event in token.events]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_parallel_block_matches_serial_execution(workers):
+    random.seed(workers)
+    token = make_token(500)
+    transfers = [(f"a{random.randrange(500)}", f"a{random.randrange(500)}", random.randrange(1, 80)) for _ in range(600)]
+    # Chains where a transfer is only funded by the one before it
+    transfers += [("a0", "fresh0", 100), ("fresh0", "fresh1", 90), ("fresh1", "fresh2", 90)]
+    expected_state, expected_errors, expected_events = serial_outcome(token, transfers)
+
+    engine = ExecutionEngine(workers=workers, min_parallel=1, chunk_size=64)
+    results = engine.execute([ContractCall(token, "transfer", *transfer) for transfer in transfers])
+
+    assert token.state == expected_state
+    assert [not result.ok for result in results] == expected_errors
+    assert [event["data"] for event in token.events] == expected_events
+    if workers > 1:
+        assert results[-1].reexecuted and results[-1].ok
+
+
+class Registry(BaseContract):
+    def __init__(self):
+        super().__init__("creator")
+        self.state["entries"] = {}
+        self.state["count"] = 0
+
+    def register(self, name, tags):
+        self.state["entries"][name] = {"tags": list(tags)}
+        self.state["count"] += 1
+        if not tags:
+            raise Exception("An entry needs at least one tag")
+
+    def tag(self, name, tag):
+        self.state["entries"][name]["tags"].append(tag)
+
+
+def test_execute_is_atomic_and_isolates_nested_values():
+    registry = Registry()
+    registry.execute("register", "alice", ["admin"])
+    with pytest.raises(Exception):
+        registry.execute("register", "bob", [])
+    assert registry.state == {"entries": {"alice": {"tags": ["admin"]}}, "count": 1}
+
+    engine = ExecutionEngine(workers=2, min_parallel=1)
+    calls = [ContractCall(registry, "tag", "alice", f"t{i}") for i in range(5)]
+    calls += [ContractCall(registry, "register", f"user{i}", ["member"]) for i in range(5)]
+    results = engine.execute(calls)
+    assert all(result.ok for result in results)
+    assert registry.state["entries"]["alice"]["tags"] == ["admin", "t0", "t1", "t2", "t3", "t4"]
+    assert registry.state["count"] == 6
+
+
+def test_transfer_batch_is_atomic_with_one_event():
+    token = make_token(3)
+    token.transfer_batch([("a0", "new", 100), ("new", "a1", 60), ("a1", "a2", 160)])
+    assert [token.balance_of(a) for a in ("a0", "new", "a1", "a2")] == [0, 40, 0, 260]
+    assert len(token.events) == 1 and token.events[0]["data"]["count"] == 3
+
+    before = copy.deepcopy(token.state)
+    with pytest.raises(Exception):
+        token.transfer_batch([("a2", "a0", 10), ("a0", "a1", 50)])
+    assert token.state == before and len(token.events) == 1
+
+
+def test_atomic_snapshot_rolls_back_and_batches_run_in_the_engine():
+    token = make_token(2)
+    with pytest.raises(Exception):
+        with token.atomic():
+            token.mint("creator", 5)
+            token.transfer("a0", "a1", 500)
+    assert token.state["total_supply"] == 10 ** 9 and token.balance_of("a1") == 100 and not token.events
+
+    with token.atomic() as snapshot:
+        token.transfer("a0", "a1", 30)
+        assert token.balance_of("a1") == 130 and "a1" in snapshot["balances"]
+    assert token.balance_of("a1") == 130 and len(token.events) == 1
+
+    calls = [ContractCall(token, "transfer_batch", [("a1", f"b{i}", 1) for i in range(3)]) for _ in range(4)]
+    results = ExecutionEngine(workers=2, min_parallel=1).execute(calls)
+    assert all(result.ok for result in results) and results[1].reexecuted
+    assert token.balance_of("a1") == 118 and token.balance_of("b0") == 4
+
+
+def test_engines_run_concurrently_from_threads():
+    # Other threads are running, so workers must not be forked from this process
+    tokens = [make_token(50) for _ in range(2)]
+    transfers = [(f"a{i % 50}", f"a{(i * 7) % 50}", 3) for i in range(120)]
+    expected = serial_outcome(tokens[0], transfers)[0]
+    results = [None, None]
+
+    def run(slot):
+        assert ExecutionEngine._start_method() == "forkserver"
+        engine = ExecutionEngine(workers=2, min_parallel=1, chunk_size=16)
+        results[slot] = engine.execute([ContractCall(tokens[slot], "transfer", *transfer) for transfer in transfers])
+
+    threads = [threading.Thread(target=run, args=(slot,)) for slot in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(token.state == expected for token in tokens)
+    assert all(any(result.reexecuted for result in slot) for slot in results)
@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+from psycopg2 import extensions
+
+from src.utils.Database import ConnectionPool, Database
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.queries = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return self.status
+
+    def commit(self):
+        self.commits += 1
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.connection.queries.append((query, params))
+        self.connection.status = extensions.TRANSACTION_STATUS_INTRANS
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = ConnectionPool(1, 2, timeout=0.2, connect=FakeConnection)
+    monkeypatch.setattr(Database, "_connection_pool", pool)
+    return pool
+
+
+def test_pool_blocks_until_a_connection_is_released(pool):
+    first, second = pool.getconn(), pool.getconn()
+    with pytest.raises(Exception):
+        pool.getconn()
+    threading.Timer(0.05, pool.putconn, args=(first,)).start()
+    assert pool.getconn(timeout=1) is first
+    stats = pool.stats()
+    assert stats["size"] == 2 and stats["in_use"] == 2 and stats["timeouts"] == 1
+    assert stats["wait_max"] >= 0.04
+    pool.putconn(second)
+
+
+def test_connection_context_manager_releases_on_error(pool):
+    with pytest.raises(ValueError):
+        with Database.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            raise ValueError("boom")
+    conn = pool.getconn()
+    assert conn.rollbacks == 1 and conn.commits == 0
+    assert pool.stats()["in_use"] == 1
+    pool.putconn(conn)
+
+    with Database.cursor() as cursor:
+        cursor.execute("SELECT 1")
+    assert cursor.connection.commits == 1
+
+
+def test_statements_are_prepared_once_per_connection(pool):
+    for _ in range(3):
+        with Database.cursor() as cursor:
+            Database.execute_prepared(cursor, "SELECT * FROM nodes WHERE host = %s AND port = %s", ("a", 1))
+    queries = [query for query, _ in cursor.connection.queries]
+    assert queries == [
+        "PREPARE stmt_0 AS SELECT * FROM nodes WHERE host = $1 AND port = $2",
+        "EXECUTE stmt_0 (%s, %s)",
+        "EXECUTE stmt_0 (%s, %s)",
+        "EXECUTE stmt_0 (%s, %s)",
+    ]
+
+
+def test_concurrent_checkouts_never_exceed_max_size(pool):
+    pool.timeout = 5
+
+    def worker():
+        for _ in range(50):
+            with Database.connection():
+                time.sleep(0.0005)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = pool.stats()
+    assert stats["checkouts"] == 400
+    assert stats["peak_in_use"] <= 2 and stats["in_use"] == 0
@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import random
+import threading
+
+from src.network.dht import DHT, KBucket
+
+
+def node_id(i):
+    return hashlib.sha256(f"node-{i}".encode()).hexdigest()
+
+
+def make_dht(i, k=20):
+    dht = DHT(k=k)
+    dht.node_id = node_id(i)
+    return dht
+
+
+def test_full_bucket_keeps_old_peers_and_caches_newcomers():
+    bucket = KBucket(k=2)
+    assert bucket.add("a", "1") is None
+    assert bucket.add("b", "2") is None
+    assert bucket.add("a", "1") is None  # refreshed, b is now the oldest
+    assert bucket.add("c", "3") == ("b", "2")
+    assert list(bucket.peers) == ["b", "a"]
+    bucket.remove("b")
+    assert list(bucket.peers) == ["a", "c"]
+
+
+def test_closest_peers_spans_buckets():
+    dht = make_dht(0)
+    for i in range(1, 300):
+        dht.add_peer(node_id(i), f"127.0.0.1:{i}")
+    target = node_id(1000)
+    known = [peer for bucket in dht.routing_table for peer in bucket.peers.items()]
+    expected = sorted(known, key=lambda peer: int(peer[0], 16) ^ int(target, 16))[:20]
+    assert dht.closest_peers(target) == expected
+
+
+def test_iterative_lookup_converges_in_few_rounds():
+    random.seed(7)
+    count = 400
+    network = {f"10.0.0.{i}:{i}": make_dht(i, k=8) for i in range(count)}
+    addresses = list(network)
+    for address, dht in network.items():
+        for other in random.sample(addresses, 120):
+            if other != address:
+                dht.add_peer(network[other].node_id, other)
+
+    async def find_node(address, target):
+        if address == addresses[13]:
+            raise ConnectionError("unreachable")
+        return network[address].closest_peers(target)
+
+    newcomer = make_dht(count, k=8)
+    for address in addresses[:3] + [addresses[13]]:
+        newcomer.add_peer(network[address].node_id, address)
+    target = node_id(5000)
+    closest, rounds = asyncio.run(newcomer.lookup(target, find_node))
+
+    unreachable = network[addresses[13]].node_id
+    reachable = [dht.node_id for dht in network.values() if dht.node_id != unreachable]
+    expected = sorted(reachable, key=lambda peer_id: int(peer_id, 16) ^ int(target, 16))[:8]
+    assert [peer_id for peer_id, _ in closest] == expected
+    assert rounds <= 12
+    assert unreachable not in dict(newcomer.closest_peers(unreachable, len(newcomer)))
+
+
+def test_closest_peers_matches_a_full_scan_for_near_and_far_targets():
+    dht = make_dht(0, k=4)
+    own = int(dht.node_id, 16)
+    # Peers near our own id fill the low buckets as well as the far ones
+    for i in range(1, 400):
+        dht.add_peer(node_id(i), f"127.0.0.1:{i}")
+        dht.add_peer(format(own ^ (i * 7919 % (1 << 40)), "064x"), f"10.0.0.1:{i}")
+    known = [peer for bucket in dht.routing_table for peer in bucket.peers.items()]
+    targets = [dht.node_id, node_id(1000), format(own ^ 0b1011, "064x"), format(own ^ (1 << 30) ^ 5, "064x")]
+    for target in targets:
+        for count in (1, 3, 20, len(known) + 5):
+            expected = sorted(known, key=lambda peer: int(peer[0], 16) ^ int(target, 16))[:count]
+            assert dht.closest_peers(target, count) == expected
+
+
+def full_bucket(ping):
+    dht = DHT(k=2, ping=ping)
+    dht.node_id = "0" * 64
+    # All three share bucket 256
+    dht.add_peer("f" + "0" * 63, "old")
+    dht.add_peer("e" + "0" * 63, "young")
+    return dht
+
+
+def test_learn_evicts_the_oldest_peer_only_when_it_fails_a_ping():
+    pinged = []
+
+    async def dead(address):
+        pinged.append(address)
+        raise ConnectionError("no answer")
+
+    async def alive(address):
+        pinged.append(address)
+
+    dht = full_bucket(dead)
+    asyncio.run(dht.learn("d" + "0" * 63, "new"))
+    assert pinged == ["old"]
+    assert list(dht.routing_table[256].peers.values()) == ["young", "new"]
+
+    pinged.clear()
+    dht = full_bucket(alive)
+    asyncio.run(dht.learn("d" + "0" * 63, "new"))
+    assert pinged == ["old"]
+    # The live peer is kept and refreshed; the newcomer waits as a replacement
+    assert list(dht.routing_table[256].peers.values()) == ["young", "old"]
+    assert list(dht.routing_table[256].replacements.values()) == ["new"]
+
+
+def test_lookup_does_not_wait_on_eviction_pings_or_learn_hearsay():
+    pinged = []
+
+    async def silent(address):
+        pinged.append(address)
+        await asyncio.Event().wait()
+
+    replies = {
+        "old": [("c" + "0" * 63, "reported")],
+        "young": [],
+        "reported": [("b" + "0" * 63, "hearsay")],
+    }
+
+    async def find_node(address, target):
+        if address not in replies:
+            raise ConnectionError("unreachable")
+        return replies[address]
+
+    async def run():
+        dht = full_bucket(silent)
+        closest, _ = await asyncio.wait_for(dht.lookup("1" + "0" * 63, find_node), 1)
+        return dht, closest
+
+    dht, closest = asyncio.run(run())
+    assert [address for _, address in closest] == ["reported", "old"]
+    assert pinged == ["old"]
+    bucket = dht.routing_table[256]
+    # Peers that answered are known; the one only vouched for by others is not
+    assert set(bucket.peers.values()) | set(bucket.replacements.values()) == {"old", "young", "reported"}
+
+
+def test_routing_table_survives_concurrent_updates():
+    dht = make_dht(0, k=8)
+    errors = []
+
+    def churn(offset):
+        try:
+            for i in range(offset, offset + 2000):
+                dht.add_peer(node_id(i), str(i))
+                if i % 3 == 0:
+                    dht.remove_peer(node_id(i - 1))
+                dht.closest_peers(node_id(i + 1))
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=churn, args=(offset,)) for offset in (1, 5000, 10000)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert sum(len(bucket) for bucket in dht.routing_table) == len(dht)
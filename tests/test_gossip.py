@@ -0,0 +1,128 @@
+import random
+from collections import deque
+from types import SimpleNamespace
+
+from src.blockchain.block import Block
+from src.blockchain.blockchain import Blockchain
+from src.blockchain.transaction import Transaction
+from src.network.gossip import Gossip, SeenCache
+from src.network.messages import create_block_message, create_transaction_message
+from src.network.node import Node
+
+
+def test_seen_cache_is_bounded_and_expires():
+    cache = SeenCache(capacity=3, ttl=10)
+    assert cache.add("a", now=0)
+    assert not cache.add("a", now=1)
+    for key in "bcd":
+        cache.add(key, now=2)
+    assert len(cache) == 3 and "a" not in cache
+    assert cache.get("b", now=11) is None
+    assert cache.add("b", now=13)
+
+
+class Network:
+    """Delivers relayed frames between in-memory gossip nodes, counting payloads"""
+
+    def __init__(self, size, degree, fanout):
+        self.queue = deque()
+        self.payloads = 0
+        self.nodes = []
+        for i in range(size):
+            node = SimpleNamespace(peers=[], blockchain=None)
+            node.peer_pool = SimpleNamespace(relay=lambda message, count, i=i: self.queue.append((i, message, count)))
+            node.gossip = Gossip(node, fanout=fanout)
+            self.nodes.append(node)
+        self.links = [random.sample([j for j in range(size) if j != i], degree) for i in range(size)]
+
+    def receive(self, i, message):
+        self.payloads += 1
+        transaction = Transaction.from_dict(message["data"])
+        gossip = self.nodes[i].gossip
+        if gossip.accept(transaction.calculate_hash()):
+            gossip.announce("transactions", transaction.calculate_hash(), message)
+
+    def run(self):
+        while self.queue:
+            sender, inventory, count = self.queue.popleft()
+            for peer in random.sample(self.links[sender], count):
+                request = []
+                self.nodes[peer].gossip.handle_inv(inventory["data"], request.append)
+                for get_data in request:
+                    self.nodes[sender].gossip.handle_get_data(
+                        get_data["data"], lambda message, peer=peer: self.receive(peer, message)
+                    )
+
+
+def test_each_node_downloads_a_transaction_once():
+    random.seed(3)
+    network = Network(size=300, degree=12, fanout=6)
+    transaction = Transaction("alice", "bob", 5, timestamp=1700000000)
+    network.nodes[0].gossip.announce("transactions", transaction.calculate_hash(), create_transaction_message(transaction))
+    network.run()
+
+    reached = sum(transaction.calculate_hash() in node.gossip.seen for node in network.nodes)
+    assert reached > 290
+    # Every payload crossed exactly one link, to a node that had not seen it
+    assert network.payloads == reached - 1
+
+
+def test_announced_hashes_are_requested_once():
+    gossip = Gossip(SimpleNamespace(peer_pool=None, peers=[], blockchain=None))
+    requests = []
+    gossip.handle_inv({ "transactions" : ["aa", "bb"] }, requests.append)
+    gossip.handle_inv({ "transactions" : ["aa", "bb", "cc"] }, requests.append)
+    gossip.accept("cc")
+    gossip.handle_inv({ "transactions" : ["cc"] }, requests.append)
+    assert [request["data"] for request in requests] == [{ "transactions" : ["aa", "bb"] }, { "transactions" : ["cc"] }]
+
+
+def test_gossiped_blocks_are_seen_only_once_they_check_out():
+    node = Node("127.0.0.1", 0)
+    node.blockchain = Blockchain()
+    added = []
+    node.add_block_to_chain = added.append
+    block = Block(1, [], node.blockchain.chain[0].hash)
+    message = create_block_message(block)
+
+    forged = dict(message["data"], hash="ab" * 32)
+    node.handle_message({ "type" : "BLOCK", "data" : forged })
+    # A claimed hash cannot poison the seen cache for the real block
+    assert "ab" * 32 not in node.gossip.seen and block.hash not in node.gossip.seen
+    node.handle_message({ "type" : "BLOCK", "data" : { "hash" : block.hash } })
+    orphan = create_block_message(Block(1, [], "cd" * 32))
+    node.handle_message(orphan)
+    assert added == [] and block.hash not in node.gossip.seen
+
+    node.handle_message(message)
+    node.handle_message(message)
+    assert [new_block.hash for new_block in added] == [block.hash]
+    assert block.hash in node.gossip.seen
+
+
+def test_transactions_are_seen_only_once_admitted_and_blocks_announced_once_accepted():
+    node = Node("127.0.0.1", 0)
+    node.blockchain = Blockchain()
+    announced = []
+    node.gossip.announce = lambda kind, item_hash, message: announced.append((kind, item_hash))
+    transaction = Transaction("alice", "bob", 10, transaction_type="TRANSFER", timestamp=1)
+    message = create_transaction_message(transaction)
+
+    node.handle_message(message)
+    # Refused while alice has no funds, so the same transaction is still welcome later
+    assert transaction.calculate_hash() not in node.gossip.seen and announced == []
+    node.blockchain.state.set_balance("alice", 100)
+    node.handle_message(message)
+    assert transaction.calculate_hash() in node.gossip.seen
+    assert announced == [("transactions", transaction.calculate_hash())]
+
+    announced.clear()
+    node.select_validator = lambda: node.public_key_pem
+    node.reward_validator = lambda validator, amount: None
+    block = Block(1, [], node.blockchain.chain[0].hash)
+    node.blockchain.add_block = lambda transactions: False
+    node.add_block_to_chain(block)
+    assert announced == []
+    node.blockchain.add_block = lambda transactions: True
+    node.add_block_to_chain(block)
+    assert announced == [("blocks", block.hash)]
@@ -0,0 +1,56 @@
+import os
+import stat
+
+import pytest
+
+from src.network.node import Node
+from src.utils import identity
+from src.utils.crypto_utils import KEY_TYPES, generate_keys, serialize_key, sign_message, verify_signature
+from src.utils.identity import load_identity, save_identity
+
+
+def test_node_keeps_its_identity_across_restarts(tmp_path):
+    path = str(tmp_path / "keys" / "node.pem")
+    first = Node("127.0.0.1", 0, identity_path=path)
+    second = Node("127.0.0.1", 0, identity_path=path)
+    assert first.public_key_pem == second.public_key_pem
+    assert first.dht.node_id == second.dht.node_id
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert Node("127.0.0.1", 0).dht.node_id != first.dht.node_id
+
+
+def test_stored_rsa_identities_still_load(tmp_path):
+    path = str(tmp_path / "rsa.pem")
+    private_key, public_key = generate_keys("rsa")
+    save_identity(path, private_key)
+    loaded_private, loaded_public = load_identity(path)
+    assert serialize_key(loaded_public) == serialize_key(public_key)
+    assert verify_signature("hello", sign_message("hello", loaded_private), public_key)
+
+
+def test_signatures_dispatch_on_key_type():
+    for key_type in KEY_TYPES:
+        private_key, public_key = generate_keys(key_type)
+        signature = sign_message("block", private_key)
+        assert verify_signature("block", signature, public_key)
+        assert not verify_signature("blocks", signature, public_key)
+    with pytest.raises(ValueError):
+        generate_keys("dsa")
+
+
+def test_concurrent_first_starts_share_one_identity(tmp_path, monkeypatch):
+    path = str(tmp_path / "node.pem")
+    racer, _ = generate_keys("ed25519")
+    generate = identity.generate_keys
+
+    def generate_while_another_node_saves(key_type):
+        # The other node writes its key between our read attempt and our write
+        save_identity(path, racer)
+        return generate(key_type)
+
+    monkeypatch.setattr(identity, "generate_keys", generate_while_another_node_saves)
+    _, public_key = load_identity(path)
+    assert serialize_key(public_key) == serialize_key(racer.public_key())
+    assert not save_identity(path, generate("ed25519")[0], replace=False)
+    assert serialize_key(load_identity(path)[1]) == serialize_key(racer.public_key())
+    assert [name for name in os.listdir(tmp_path) if name.startswith(".identity-")] == []
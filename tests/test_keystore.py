@@ -0,0 +1,38 @@
+import os
+import stat
+
+import pytest
+
+from src.blockchain.keystore import Keystore
+from src.blockchain.transaction import load_verifying_key
+
+
+def test_generated_wallets_are_persisted(tmp_path):
+    path = str(tmp_path / "wallets.dat")
+    keystore = Keystore(path, workers=2, chunk_size=16)
+    try:
+        addresses = keystore.generate(80) + keystore.generate(3)
+    finally:
+        keystore.close()
+    assert len(set(addresses)) == 83
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    reopened = Keystore(path)
+    assert reopened.addresses() == addresses
+    wallet = reopened.wallet(addresses[5])
+    assert wallet.address == addresses[5]
+    signature = wallet.sign_transaction("payload")
+    assert load_verifying_key(reopened.public_key(addresses[5])).verify(bytes.fromhex(signature), b"payload")
+
+
+def test_batch_signatures_verify_in_input_order(tmp_path):
+    keystore = Keystore(str(tmp_path / "wallets.dat"), workers=2, chunk_size=32)
+    try:
+        addresses = keystore.generate(10)
+        items = [(addresses[i % 10], f"transaction {i}") for i in range(200)]
+        signatures = keystore.sign_batch(items)
+    finally:
+        keystore.close()
+    for (address, data), signature in zip(items, signatures):
+        assert load_verifying_key(keystore.public_key(address)).verify(bytes.fromhex(signature), data.encode())
+    with pytest.raises(ValueError):
+        keystore.sign_batch([("unknown", "data")])
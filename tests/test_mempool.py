@@ -0,0 +1,68 @@
+import hashlib
+
+from src.blockchain.mempool import Mempool
+
+
+class FakeTransaction:
+    def __init__(self, sender, nonce, fee):
+        self.sender = sender
+        self.nonce = nonce
+        self.fee = fee
+
+    def calculate_hash(self):
+        return hashlib.sha256(f"{self.sender}{self.nonce}{self.fee}".encode()).hexdigest()
+
+
+def test_duplicates_are_rejected():
+    mempool = Mempool()
+    transaction = FakeTransaction("alice", 1, 5)
+    assert mempool.add(transaction)
+    assert not mempool.add(FakeTransaction("alice", 1, 5))
+    assert len(mempool) == 1
+
+
+def test_pop_best_returns_highest_fees_first():
+    mempool = Mempool()
+    for nonce, fee in enumerate([3, 9, 1, 7, 5]):
+        mempool.add(FakeTransaction("alice", nonce, fee))
+    assert [tx.fee for tx in mempool.pop_best(3)] == [9, 7, 5]
+    assert [tx.fee for tx in mempool.pop_best()] == [3, 1]
+    assert len(mempool) == 0
+
+
+def test_full_pool_evicts_lowest_fee():
+    mempool = Mempool(max_size=3)
+    for nonce, fee in enumerate([4, 2, 6]):
+        mempool.add(FakeTransaction("alice", nonce, fee))
+    assert not mempool.add(FakeTransaction("bob", 0, 1))
+    assert mempool.add(FakeTransaction("bob", 1, 5))
+    assert sorted(tx.fee for tx in mempool) == [4, 5, 6]
+    assert mempool.lowest_fee() == 4
+
+
+def test_sender_index_and_limit():
+    mempool = Mempool(max_per_sender=2)
+    assert mempool.add(FakeTransaction("alice", 0, 1))
+    assert mempool.add(FakeTransaction("alice", 1, 1))
+    assert not mempool.add(FakeTransaction("alice", 2, 1))
+    assert [tx.nonce for tx in mempool.get_by_sender("alice")] == [0, 1]
+
+
+def test_old_transactions_expire():
+    mempool = Mempool(max_age=60)
+    mempool.add(FakeTransaction("alice", 0, 1), now=1000)
+    mempool.add(FakeTransaction("bob", 0, 1), now=1050)
+    assert mempool.expire(now=1070) == 1
+    assert [tx.sender for tx in mempool] == ["bob"]
+
+
+def test_pending_spends_are_tracked_per_sender():
+    mempool = Mempool()
+    first, second = FakeTransaction("alice", 0, 1), FakeTransaction("alice", 1, 9)
+    assert mempool.add(first, spend=40)
+    assert mempool.add(second, spend=25)
+    assert mempool.pending_spend("alice") == 65 and mempool.pending_spend("bob") == 0
+    mempool.pop_best(1)
+    assert mempool.pending_spend("alice") == 40
+    mempool.remove(first.calculate_hash())
+    assert mempool.pending_spend("alice") == 0 and "alice" not in mempool.spends
@@ -0,0 +1,47 @@
+import hashlib
+
+from src.blockchain.merkle_tree import MerkleTree
+
+
+def make_transactions(count):
+    return [{"sender": f"user_{i}", "receiver": "user_0", "amount": i} for i in range(count)]
+
+
+def test_single_transaction_root_is_leaf_hash():
+    transactions = make_transactions(1)
+    tree = MerkleTree(transactions)
+    assert tree.root == MerkleTree.hash_leaf(transactions[0])
+
+
+def test_odd_leaf_is_paired_with_itself():
+    transactions = make_transactions(3)
+    a, b, c = (MerkleTree.hash_leaf(tx) for tx in transactions)
+    ab = hashlib.sha256(a + b).digest()
+    cc = hashlib.sha256(c + c).digest()
+    assert MerkleTree(transactions).root == hashlib.sha256(ab + cc).digest()
+
+
+def test_append_matches_full_rebuild():
+    transactions = make_transactions(37)
+    tree = MerkleTree()
+    assert tree.merkle_root is None
+    for i, tx in enumerate(transactions, start=1):
+        tree.append(tx)
+        assert tree.root == MerkleTree(transactions[:i]).root
+
+
+def test_update_matches_full_rebuild():
+    transactions = make_transactions(10)
+    tree = MerkleTree(transactions)
+    transactions[6] = {"sender": "user_6", "receiver": "user_9", "amount": 60}
+    tree.update(6, transactions[6])
+    assert tree.merkle_root == MerkleTree(transactions).merkle_root
+
+
+def test_leaf_commits_to_the_signature():
+    from src.blockchain.transaction import Transaction
+
+    signed = {"sender": "alice", "receiver": "bob", "amount": 5, "transaction_type": "TRANSFER", "timestamp": 1, "signature": "ab" * 32}
+    resigned = dict(signed, signature="cd" * 32)
+    assert MerkleTree.hash_leaf(signed) != MerkleTree.hash_leaf(resigned)
+    assert MerkleTree.hash_leaf(signed) == MerkleTree.hash_leaf(Transaction.from_dict(signed))
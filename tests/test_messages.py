@@ -0,0 +1,87 @@
+import hashlib
+import socket
+import threading
+
+import pytest
+
+from src.network.messages import (FrameDecoder, encode_message, read_message, MAX_MESSAGE_SIZE, FRAME_HEADER, MAGIC,
+                                  ProtocolError, READ_CHUNK_SIZE)
+
+
+def make_block(transaction_count):
+    transactions = [{
+        "sender": hashlib.sha256(f"sender_{i}".encode()).hexdigest(),
+        "receiver": hashlib.sha256(f"receiver_{i}".encode()).hexdigest(),
+        "amount": i * 10,
+        "signature": hashlib.sha512(f"signature_{i}".encode()).hexdigest(),
+        "transaction_type": "TRANSFER",
+        "timestamp": 1700000000.5 + i,
+    } for i in range(transaction_count)]
+    return {
+        "index": 7,
+        "timestamp": 1700000123.25,
+        "transactions": transactions,
+        "previous_hash": "ab" * 32,
+        "merkle_root": "cd" * 32,
+        "hash": "00" * 32,
+        "nonce": 99,
+    }
+
+
+def test_large_block_survives_arbitrary_splits():
+    message = {"type": "BLOCK", "data": make_block(500)}
+    frame = encode_message(message)
+    decoder = FrameDecoder()
+    received = []
+    for i in range(0, len(frame), 1000):
+        received.extend(decoder.feed(frame[i:i + 1000]))
+    assert received == [message]
+
+
+def test_merged_frames_are_split():
+    messages = [
+        {"type": "TRANSACTION", "data": make_block(1)["transactions"][0]},
+        {"type": "CHAIN_RESPONSE", "data": [dict(make_block(0), transactions="Genesis Block"), make_block(2)]},
+        {"type": "PEER_UPDATE", "data": ["127.0.0.1:5000"]},
+    ]
+    stream = b"".join(encode_message(message) for message in messages)
+    assert FrameDecoder().feed(stream) == messages
+
+
+def test_absent_transaction_fields_stay_absent():
+    message = {"type": "BLOCK", "data": dict(make_block(0), transactions=[{"sender": "a", "receiver": "b", "amount": 1}])}
+    assert FrameDecoder().feed(encode_message(message)) == [message]
+
+
+def test_non_standard_transaction_falls_back_to_json():
+    message = {"type": "TRANSACTION", "data": {"sender": "node", "receiver": "peer", "recipient": None, "amount": -5}}
+    assert FrameDecoder().feed(encode_message(message)) == [message]
+
+
+@pytest.mark.parametrize("data", [["not", "a", "dict"], {"receiver": "b", "amount": 1, "note": "no sender"}])
+def test_malformed_transaction_payloads_are_protocol_errors(data):
+    with pytest.raises(ProtocolError):
+        FrameDecoder().feed(encode_message({"type": "TRANSACTION", "data": data}))
+
+
+def test_socket_frames_are_read_in_chunks():
+    left, right = socket.socketpair()
+    message = {"type": "BLOCK", "data": make_block(2000)}
+    frame = encode_message(message)
+    assert len(frame) > 2 * READ_CHUNK_SIZE
+    sender = threading.Thread(target=left.sendall, args=(frame,))
+    sender.start()
+    assert read_message(right) == message
+    sender.join()
+    # A peer claiming a huge frame and then hanging up gets nothing allocated for it
+    left.sendall(FRAME_HEADER.pack(MAGIC, 1, MAX_MESSAGE_SIZE) + b"partial")
+    left.close()
+    with pytest.raises(ProtocolError):
+        read_message(right)
+    right.close()
+
+
+def test_oversized_frame_is_rejected():
+    header = FRAME_HEADER.pack(MAGIC, 1, MAX_MESSAGE_SIZE + 1)
+    with pytest.raises(ProtocolError):
+        FrameDecoder().feed(header)
@@ -0,0 +1,44 @@
+import hashlib
+import os
+
+import pytest
+
+from src.blockchain import miner
+from src.blockchain.block import Block
+from src.blockchain.miner import ProofOfWorkMiner, difficulty_target, search_nonces
+
+
+def make_block():
+    return Block(1, [{"sender": "a", "receiver": "b", "amount": 1}], "00" * 32)
+
+
+def test_midstate_search_matches_full_header_hashes():
+    prefix = make_block().header_prefix()
+    target = difficulty_target(2)
+    nonce, digest, attempts = search_nonces(prefix, target, 0, 100000)
+    expected = next(n for n in range(100000) if int(hashlib.sha256(prefix + str(n).encode()).hexdigest(), 16) < target)
+    assert nonce == expected and attempts == nonce + 1
+    assert digest == hashlib.sha256(prefix + str(nonce).encode()).hexdigest()
+    # Interleaved workers cover the same nonces between them
+    found = [search_nonces(prefix, target, start, 100000, 3)[0] for start in range(3)]
+    assert min(found) == expected
+    assert search_nonces(prefix, target, 0, expected) == (None, None, expected)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_mined_block_hash_matches_calculate_hash(workers):
+    block = make_block()
+    result = ProofOfWorkMiner(workers).mine(block, difficulty=3)
+    assert block.nonce == result.nonce
+    assert block.hash == block.calculate_hash() == result.hash
+    assert block.hash.startswith("000")
+
+
+def dying_worker(*args):
+    os._exit(3)
+
+
+def test_dead_worker_does_not_hang_mining(monkeypatch):
+    monkeypatch.setattr(miner, "_mining_worker", dying_worker)
+    with pytest.raises(Exception, match="exit code 3"):
+        ProofOfWorkMiner(2).mine(make_block(), difficulty=8)
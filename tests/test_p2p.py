@@ -0,0 +1,100 @@
+import asyncio
+from types import SimpleNamespace
+
+from src.network import p2p
+from src.network.messages import FRAME_HEADER, MAGIC, MESSAGE_TYPES, encode_message
+from src.network.p2p import P2PServer
+
+
+def make_server(**kwargs):
+    received = []
+    node = SimpleNamespace(host="127.0.0.1", port=0, handle_message=lambda message, reply: received.append(message))
+    return P2PServer(node, **kwargs), received
+
+
+async def start(server):
+    await server.start()
+    return server.server.sockets[0].getsockname()[1]
+
+
+async def closed_by_server(reader):
+    return await asyncio.wait_for(reader.read(), 5) == b""
+
+
+def test_connections_past_the_limit_are_refused():
+    async def run():
+        server, received = make_server(max_connections=2)
+        port = await start(server)
+        peers = [await asyncio.open_connection("127.0.0.1", port) for _ in range(2)]
+        for _, writer in peers:
+            writer.write(encode_message({"type": "PEER_UPDATE", "data": ["127.0.0.1:5000"]}))
+            await writer.drain()
+        while len(received) < 2:
+            await asyncio.sleep(0.01)
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        refused = await closed_by_server(reader)
+        writer.close()
+        connected = len(server.connections)
+        await server.close()
+        return refused, connected, len(received)
+
+    assert asyncio.run(run()) == (True, 2, 2)
+
+
+def test_oversized_and_stalled_frames_drop_the_peer(monkeypatch):
+    monkeypatch.setattr(p2p, "LARGE_FRAME_TIMEOUT", 0.2)
+
+    async def run():
+        server, received = make_server(read_buffer_limit=1024, max_frame_size=4096)
+        port = await start(server)
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(FRAME_HEADER.pack(MAGIC, MESSAGE_TYPES["PEER_UPDATE"], 8192))
+        oversized = await closed_by_server(reader)
+
+        # A large frame whose body never arrives releases its share of the budget
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(FRAME_HEADER.pack(MAGIC, MESSAGE_TYPES["PEER_UPDATE"], 2048) + b"[")
+        stalled = await closed_by_server(reader)
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(encode_message({"type": "PEER_UPDATE", "data": ["x" * 2000]}))
+        await writer.drain()
+        while not received:
+            await asyncio.sleep(0.01)
+        writer.close()
+        budget = server.large_frame_bytes
+        await server.close()
+        return oversized, stalled, budget, received
+
+    oversized, stalled, budget, received = asyncio.run(run())
+    assert oversized and stalled and budget == 0
+    assert received == [{"type": "PEER_UPDATE", "data": ["x" * 2000]}]
+
+
+def test_slow_peer_is_dropped_without_blocking_others():
+    async def run():
+        server, _ = make_server(write_buffer_limit=64 * 1024)
+        port = await start(server)
+        slow_reader, slow_writer = await asyncio.open_connection("127.0.0.1", port)
+        fast_reader, fast_writer = await asyncio.open_connection("127.0.0.1", port)
+        while len(server.connections) < 2:
+            await asyncio.sleep(0.01)
+
+        slow = next(w for w in server.connections.values() if w.get_extra_info("peername") == slow_writer.get_extra_info("sockname"))
+        message = {"type": "PEER_UPDATE", "data": ["x" * 256 * 1024]}
+        # The slow peer never reads, so its writes pile up until the server gives up on it
+        sends = [server.spawn(server.send(slow, message)) for _ in range(200)]
+        await asyncio.wait_for(asyncio.gather(*sends), 10)
+        dropped = slow.is_closing()
+
+        await server.broadcast(message)
+        frame = encode_message(message)
+        delivered = await asyncio.wait_for(fast_reader.readexactly(len(frame)), 5) == frame
+        slow_writer.close()
+        fast_writer.close()
+        await server.close()
+        return dropped, delivered
+
+    assert asyncio.run(run()) == (True, True)
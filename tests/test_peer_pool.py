@@ -0,0 +1,117 @@
+import asyncio
+import socket
+import time
+from types import SimpleNamespace
+
+from src.blockchain.transaction import Transaction
+from src.network import node as node_module
+from src.network import peer_pool
+from src.network.messages import encode_message
+from src.network.node import Node
+from src.network.p2p import EventLoopThread, P2PServer
+from src.network.peer_pool import PeerConnection, PeerPool
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_connection_backs_off_reconnects_and_notices_hangups(monkeypatch, capsys):
+    monkeypatch.setattr(peer_pool.random, "uniform", lambda low, high: high)
+    first, second = encode_message({"type": "PEER_UPDATE", "data": ["a"]}), encode_message({"type": "PEER_UPDATE", "data": ["b"]})
+
+    async def run():
+        port = free_port()
+        connection = PeerConnection("127.0.0.1", port, min_backoff=0.1, max_backoff=0.4)
+        connection.enqueue(first)
+        connection.start()
+        await asyncio.sleep(1.0)
+        retries = [line.split("retrying in ")[1] for line in capsys.readouterr().out.splitlines() if "retrying in" in line]
+
+        received, writers = bytearray(), []
+
+        async def handle(reader, writer):
+            writers.append(writer)
+            while data := await reader.read(1024):
+                received.extend(data)
+
+        server = await asyncio.start_server(handle, "127.0.0.1", port)
+        await wait_until(lambda: bytes(received) == first)
+        # The peer hangs up while nothing is queued
+        writers[0].close()
+        await wait_until(lambda: connection.reconnects == 2)
+        connection.enqueue(second)
+        await wait_until(lambda: bytes(received) == first + second)
+        await connection.stop()
+        server.close()
+        return retries
+
+    assert asyncio.run(run())[:4] == ["0.1s", "0.2s", "0.4s", "0.4s"]
+
+
+def test_pool_fans_out_broadcasts_relays_and_sends():
+    event_loop = EventLoopThread()
+    event_loop.start()
+    servers, received = [], []
+    for i in range(3):
+        messages = []
+        node = SimpleNamespace(host="127.0.0.1", port=0, handle_message=lambda message, reply, messages=messages: messages.append(message["data"][0]))
+        server = P2PServer(node)
+        event_loop.submit(server.start()).result()
+        servers.append(server)
+        received.append(messages)
+    ports = [server.server.sockets[0].getsockname()[1] for server in servers]
+
+    pool = PeerPool(event_loop, min_backoff=0.05)
+    for port in ports:
+        pool.add_peer("127.0.0.1", port)
+    pool.broadcast({"type": "PEER_UPDATE", "data": ["all"]})
+    pool.broadcast({"type": "PEER_UPDATE", "data": ["some"]}, exclude={("127.0.0.1", ports[0])})
+    pool.relay({"type": "PEER_UPDATE", "data": ["relayed"]}, 2)
+    pool.send("127.0.0.1", ports[2], {"type": "PEER_UPDATE", "data": ["direct"]})
+
+    try:
+        deadline = time.monotonic() + 5
+        while sum(map(len, received)) < 8 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert [messages.count("all") for messages in received] == [1, 1, 1]
+        assert [messages.count("some") for messages in received] == [0, 1, 1]
+        assert sum(messages.count("relayed") for messages in received) == 2
+        assert [messages.count("direct") for messages in received] == [0, 0, 1]
+        assert sorted(pool.peers()) == sorted(("127.0.0.1", port) for port in ports)
+    finally:
+        pool.close()
+        for server in servers:
+            event_loop.submit(server.close()).result()
+        event_loop.stop()
+
+
+def test_threaded_node_only_pools_when_opted_in(monkeypatch):
+    node = Node("127.0.0.1", 0)
+    node.broadcast_transaction(Transaction("alice", "bob", 1, timestamp=1))
+    assert node.peer_pool is None and node.event_loop is None
+
+    added, removed, broadcasts = [], [], []
+    node.peer_pool = SimpleNamespace(add_peer=lambda host, port: added.append(port), remove_peer=lambda host, port: removed.append(port),
+                                     broadcast=broadcasts.append)
+    registered = [("10.0.0.1", 5000), ("10.0.0.2", 5000)]
+    monkeypatch.setattr(Node, "load_node_addresses", staticmethod(lambda: list(registered)))
+
+    node.broadcast_transaction(Transaction("alice", "bob", 2, timestamp=2))
+    registered[1] = ("10.0.0.3", 5001)
+    node.broadcast_transaction(Transaction("alice", "bob", 3, timestamp=3))
+    assert (added, removed, len(broadcasts)) == ([5000, 5000], [], 2)
+
+    node.known_nodes_loaded_at -= node_module.KNOWN_NODES_TTL + 1
+    node.broadcast_transaction(Transaction("alice", "bob", 4, timestamp=4))
+    assert (added[2:], removed, len(broadcasts)) == ([5001], [5000], 3)
+    assert node.known_nodes == {("10.0.0.1", 5000), ("10.0.0.3", 5001)}
@@ -0,0 +1,79 @@
+from collections import Counter
+
+import pytest
+
+from src.blockchain.blockchain import Blockchain
+from src.staking.sampler import StakeSampler
+
+
+def test_prefix_sums_follow_updates_and_removals():
+    sampler = StakeSampler({f"v{i}": i + 1 for i in range(10)})
+    assert sampler.total_stake == 55
+    sampler.set_stake("v3", 0)
+    sampler.add_stake("v9", 5)
+    assert sampler.total_stake == 55 - 4 + 5
+    assert "v3" not in sampler and len(sampler) == 9
+    sampler.set_stake("new", 7)
+    assert sampler.get_stake("v9") == 15 and len(sampler) == 10
+    assert sampler.total_stake == 63
+
+
+def test_sampling_is_proportional_to_stake():
+    sampler = StakeSampler({"a": 1, "b": 3, "c": 6}, seed=1)
+    counts = Counter(sampler.sample() for _ in range(20000))
+    assert abs(counts["a"] / 20000 - 0.1) < 0.02
+    assert abs(counts["b"] / 20000 - 0.3) < 0.02
+    assert abs(counts["c"] / 20000 - 0.6) < 0.02
+
+
+def test_removed_and_empty_stakers_are_never_sampled():
+    sampler = StakeSampler()
+    assert sampler.sample() is None
+    sampler.set_stake("a", 5)
+    sampler.set_stake("b", 5)
+    sampler.remove("a")
+    assert {sampler.sample(seed) for seed in range(200)} == {"b"}
+
+
+def test_seeded_selection_is_deterministic():
+    stakes = {f"v{i}": (i % 7) + 1 for i in range(1000)}
+    first, second = StakeSampler(stakes), StakeSampler(stakes)
+    assert [first.sample(h) for h in range(50)] == [second.sample(h) for h in range(50)]
+
+
+def test_seeded_selection_ignores_insertion_order_and_history():
+    stakes = {f"v{i}": (i % 7) + 0.1 for i in range(300)}
+    first = StakeSampler(stakes)
+    second = StakeSampler()
+    for key in reversed(list(stakes)):
+        second.set_stake(key, 1000)
+    second.set_stake("gone", 5)
+    for key, amount in stakes.items():
+        second.set_stake(key, amount)
+    second.remove("gone")
+    assert [first.sample(h) for h in range(200)] == [second.sample(h) for h in range(200)]
+    # Unseeded draws and updates keep working on the reordered tree
+    second.set_stake("late", 50)
+    assert abs(second.total_stake - sum(stakes.values()) - 50) < 1e-9
+
+
+def test_blockchain_keeps_sampler_in_step_with_staking_pool():
+    blockchain = Blockchain()
+    blockchain.add_stake("alice", 100)
+    blockchain.add_stake("bob", 50)
+    blockchain.withdraw_stake("bob", 50)
+    blockchain.slash_validator("alice")
+    assert "bob" not in blockchain.validator_sampler
+    assert blockchain.validator_sampler.total_stake == blockchain.staking_pool["alice"] == 90
+    assert blockchain.select_validator(seed="parent") == "alice"
+
+
+def test_fixed_point_weights_keep_sums_exact_and_draws_cheap(monkeypatch):
+    sampler = StakeSampler({f"v{i}": 0.1 for i in range(30)})
+    assert sampler.total_stake == 3
+    first = [sampler.sample(f"block-{h}") for h in range(20)]
+    # A stake change between seeded draws touches one path, nothing is re-sorted
+    monkeypatch.setattr("builtins.sorted", lambda *args, **kwargs: pytest.fail("re-sorted the stakers"))
+    sampler.add_stake("v3", 0.2)
+    sampler.add_stake("v3", -0.2)
+    assert [sampler.sample(f"block-{h}") for h in range(20)] == first
@@ -0,0 +1,47 @@
+import pytest
+
+from src.blockchain.block import Block
+from src.blockchain.transaction import Transaction
+
+
+def make_transaction(i, fee=0):
+    return Transaction("Network", f"r{i}", i, transaction_type="TRANSFER", timestamp=1700000000 + i, fee=fee)
+
+
+def test_sealed_transactions_are_immutable_and_cache_their_hash():
+    transaction = make_transaction(1)
+    transaction.signature = "ab"  # still open
+    assert not hasattr(transaction, "__dict__")
+    digest = transaction.seal().calculate_hash()
+    with pytest.raises(AttributeError):
+        transaction.amount = 5
+    assert transaction._hash == digest == transaction.calculate_hash()
+
+
+def test_transaction_bytes_round_trip():
+    transaction = make_transaction(3, fee=2)
+    decoded = Transaction.from_bytes(transaction.to_bytes())
+    assert decoded.to_dict() == transaction.to_dict()
+    assert decoded.calculate_hash() == transaction.calculate_hash()
+    assert decoded.sealed
+
+
+def test_block_bytes_round_trip_keeps_hash_and_merkle_root():
+    block = Block(1, [make_transaction(i) for i in range(10)], "00" * 32)
+    data = block.to_bytes()
+    decoded = Block.from_bytes(data)
+    assert decoded.hash == block.hash == decoded.calculate_hash()
+    assert decoded.merkle_root == block.merkle_root
+    assert decoded.to_bytes() == data
+    with pytest.raises(AttributeError):
+        decoded.nonce = 1
+    with pytest.raises(AttributeError):
+        decoded.add_transaction(make_transaction(11))
+
+
+def test_sealing_a_block_freezes_its_transactions():
+    block = Block(1, [make_transaction(1)], "00" * 32)
+    block.add_transaction(make_transaction(2))
+    block.seal()
+    assert isinstance(block.transactions, tuple)
+    assert all(transaction.sealed for transaction in block.transactions)
@@ -0,0 +1,164 @@
+import queue
+import socket
+import threading
+
+import pytest
+
+from src.network.messages import read_message
+from src.network.node import Node
+from src.network.session import Handshake, HandshakeError, SessionChannel
+from src.utils.crypto_utils import generate_keys, serialize_key
+
+
+def open_channels():
+    alice, bob = generate_keys(), generate_keys()
+    alice_handshake, bob_handshake = Handshake(*alice), Handshake(*bob)
+    _, bob_channel, response = bob_handshake.respond(alice_handshake.message()["data"])
+    _, alice_channel, finish = alice_handshake.complete(response["data"], bob[1])
+    bob_handshake.finish(finish["data"])
+    return alice_channel, bob_channel
+
+
+def test_handshake_derives_matching_keys_per_direction():
+    alice, bob = open_channels()
+    assert alice.session_id == bob.session_id
+    message = "x" * (1 << 20)
+    assert bob.decrypt(alice.encrypt(message)).decode() == message
+    assert alice.decrypt(bob.encrypt(b"pong")) == b"pong"
+    assert alice.send_key != alice.receive_key
+
+
+def test_replayed_and_tampered_frames_are_rejected():
+    alice, bob = open_channels()
+    frame = alice.encrypt("hello")
+    bob.decrypt(frame)
+    with pytest.raises(ValueError):
+        bob.decrypt(frame)
+    forged = bytearray(alice.encrypt("hello"))
+    forged[-1] ^= 1
+    with pytest.raises(ValueError):
+        bob.decrypt(bytes(forged))
+
+
+def test_keys_rotate_without_a_round_trip():
+    alice = SessionChannel("s", b"a" * 32, b"b" * 32, rotate_after=3)
+    bob = SessionChannel("s", b"b" * 32, b"a" * 32, rotate_after=3)
+    frames = [alice.encrypt(f"m{i}") for i in range(10)]
+    # Frames may be skipped, later epochs are derived on demand
+    assert [bob.decrypt(frames[i]) for i in (0, 2, 7, 9)] == [b"m0", b"m2", b"m7", b"m9"]
+    assert alice.send_epoch == bob.receive_epoch == 3
+
+
+def test_handshake_from_another_identity_is_rejected():
+    alice, bob, mallory = generate_keys(), generate_keys(), generate_keys()
+    alice_handshake = Handshake(*alice)
+    _, _, response = Handshake(*mallory).respond(alice_handshake.message()["data"])
+    with pytest.raises(HandshakeError):
+        alice_handshake.complete(response["data"], bob[1])
+    # A valid signature under a swapped ephemeral key does not verify
+    response["data"]["ephemeral"] = Handshake(*mallory).message()["data"]["ephemeral"]
+    with pytest.raises(HandshakeError):
+        alice_handshake.complete(response["data"])
+
+
+def test_replayed_handshake_messages_are_rejected():
+    alice, bob = generate_keys(), generate_keys()
+    first, responder = Handshake(*alice), Handshake(*bob)
+    _, _, response = responder.respond(first.message()["data"])
+    first.complete(response["data"], bob[1])
+    # The responder's signature covers the first initiator's key, not a new one
+    with pytest.raises(HandshakeError):
+        Handshake(*alice).complete(response["data"], bob[1])
+    # A finish recorded from one session does not finish another for the same opening
+    opening = Handshake(*alice)
+    recorded, replayed = Handshake(*bob), Handshake(*bob)
+    _, _, finish = opening.complete(recorded.respond(opening.message()["data"])[2]["data"], bob[1])
+    replayed.respond(opening.message()["data"])
+    with pytest.raises(HandshakeError):
+        replayed.finish(finish["data"])
+
+
+def test_nodes_exchange_secure_messages_over_a_socket():
+    sender, receiver = Node("127.0.0.1", 0), Node("127.0.0.1", 0)
+    received = queue.Queue()
+    handle = receiver.handle_secure_message
+    receiver.handle_secure_message = lambda payload, reply=None: received.put(handle(payload, sender.public_key, reply))
+    left, right = socket.socketpair()
+    threading.Thread(target=receiver.handle_client, args=(right,), daemon=True).start()
+
+    sender.send_secure_message(left, "first", receiver.public_key)
+    sender.send_secure_message(left, "second " * 1000, receiver.public_key)
+    assert received.get(timeout=5) == "first"
+    assert received.get(timeout=5) == "second " * 1000
+    assert len(sender.peer_sessions) == len(receiver.sessions) == 1
+    left.close()
+
+
+def test_concurrent_senders_keep_frames_in_counter_order():
+    sender, receiver = Node("127.0.0.1", 0), Node("127.0.0.1", 0)
+    received = queue.Queue()
+    handle = receiver.handle_secure_message
+    receiver.handle_secure_message = lambda payload, reply=None: received.put(handle(payload, sender.public_key, reply))
+    left, right = socket.socketpair()
+    threading.Thread(target=receiver.handle_client, args=(right,), daemon=True).start()
+    sender.send_secure_message(left, "open", receiver.public_key)
+    assert received.get(timeout=5) == "open"
+
+    def send_many(thread):
+        for i in range(50):
+            sender.send_secure_message(left, f"{thread}-{i}" + "x" * 2000, receiver.public_key)
+
+    threads = [threading.Thread(target=send_many, args=(t,)) for t in range(4)]
+    for thread in threads:
+        thread.start()
+    messages = [received.get(timeout=5) for _ in range(200)]
+    for thread in threads:
+        thread.join()
+    # A frame overtaken by a later counter would be rejected and come back as None
+    assert None not in messages
+    assert sorted(m.split("x")[0] for m in messages) == sorted(f"{t}-{i}" for t in range(4) for i in range(50))
+    left.close()
+
+
+def test_frames_too_many_epochs_ahead_are_rejected_before_deriving_keys(monkeypatch):
+    from src.network import session
+    alice = SessionChannel("s", b"a" * 32, b"b" * 32, rotate_after=1)
+    bob = SessionChannel("s", b"b" * 32, b"a" * 32, rotate_after=1)
+    frames = [alice.encrypt(f"m{i}") for i in range(10)]
+    derived = []
+    next_key = session._next_key
+    monkeypatch.setattr(session, "_next_key", lambda key: derived.append(key) or next_key(key))
+    forged = session.NONCE_HEADER.pack(1 << 30, 0) + b"\0" * 32
+    with pytest.raises(ValueError):
+        bob.decrypt(forged)
+    with pytest.raises(ValueError):
+        bob.decrypt(frames[session.MAX_EPOCH_SKIP + 1])
+    assert derived == []
+    assert bob.decrypt(frames[session.MAX_EPOCH_SKIP]) == f"m{session.MAX_EPOCH_SKIP}".encode()
+
+
+def test_sender_reopens_a_session_the_receiver_lost():
+    sender, receiver = Node("127.0.0.1", 0), Node("127.0.0.1", 0)
+    received = queue.Queue()
+    handle = receiver.handle_secure_message
+    receiver.handle_secure_message = lambda payload, reply=None: received.put(handle(payload, sender.public_key, reply))
+    left, right = socket.socketpair()
+    threading.Thread(target=receiver.handle_client, args=(right,), daemon=True).start()
+    sender.send_secure_message(left, "before", receiver.public_key)
+    assert received.get(timeout=5) == "before"
+
+    # As after a restart of the receiver
+    receiver.sessions.clear()
+    lost = sender.peer_sessions[serialize_key(receiver.public_key)]
+    sender.send_secure_message(left, "lost", receiver.public_key)
+    assert received.get(timeout=5) is None
+    left.settimeout(5)
+    error = read_message(left)
+    assert error == { "type" : "SESSION_ERROR", "data" : { "session" : lost.session_id } }
+    sender.handle_message(error)
+    assert sender.peer_sessions == {}
+
+    sender.send_secure_message(left, "after", receiver.public_key)
+    assert received.get(timeout=5) == "after"
+    assert list(receiver.sessions) == [sender.peer_sessions[serialize_key(receiver.public_key)].session_id]
+    left.close()
@@ -0,0 +1,79 @@
+import pytest
+from psycopg2 import extensions
+
+from src.staking import staking_pool
+from src.staking.staking_pool import StakingPool
+from src.utils.Database import ConnectionPool
+
+
+class RecordingConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.closed = 0
+        self.queries = []
+        self.commits = 0
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.queries.append(query)
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def get_transaction_status(self):
+        return extensions.TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    conn = RecordingConnection([("alice", 10)])
+    upserts = []
+    monkeypatch.setattr(staking_pool.db, "_connection_pool", ConnectionPool(0, 1, connect=lambda: conn))
+    monkeypatch.setattr(staking_pool, "execute_values", lambda cursor, query, rows: upserts.append(sorted(rows)))
+    monkeypatch.setattr(StakingPool, "_stakes", None)
+    monkeypatch.setattr(StakingPool, "_dirty", set())
+    monkeypatch.setattr(StakingPool, "synchronous", False)
+    # Keep the background flusher out of the test
+    monkeypatch.setattr(StakingPool, "_flusher", object())
+    conn.upserts = upserts
+    return conn
+
+
+def test_reads_are_served_from_memory(connection):
+    assert StakingPool.get_stake("alice") == 10
+    assert StakingPool.get_stake("bob") == 0
+    assert len(connection.queries) == 1
+
+
+def test_writes_are_coalesced_into_one_upsert(connection):
+    for _ in range(100):
+        StakingPool.add_stake("bob", 1)
+    assert StakingPool.remove_stake("alice", 4)
+    assert not StakingPool.remove_stake("carol", 1)
+    assert connection.upserts == []
+
+    assert StakingPool.flush() == 2
+    assert connection.upserts == [[("alice", 6.0), ("bob", 100.0)]]
+    # One commit for the initial load, one for the flush
+    assert connection.commits == 2
+    assert StakingPool.flush() == 0
+
+
+def test_synchronous_mode_flushes_every_write(connection):
+    StakingPool.configure(synchronous=True)
+    StakingPool.add_stake("bob", 5)
+    assert connection.upserts == [[("bob", 5.0)]]
@@ -0,0 +1,141 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.blockchain import block as block_module
+from src.blockchain.block import Block
+from src.blockchain.blockchain import Blockchain
+from src.network import sync
+from src.network.messages import FRAME_HEADER, decode_message, encode_message
+from src.network.node import SYNC_HANDLERS
+from src.network.sync import ChainSync, build_locator
+
+
+@pytest.fixture(autouse=True)
+def fixed_clock(monkeypatch):
+    # Both chains then share the same genesis block
+    monkeypatch.setattr(block_module, "time", SimpleNamespace(time=lambda: 1700000000.0))
+
+
+def make_sync(heights, fork=None, tag="main"):
+    """A ChainSync over a chain up to height heights, sharing the blocks of fork=(sync, height) up to height"""
+    blockchain = Blockchain()
+    base = fork[0].node.blockchain.chain[1:fork[1] + 1] if fork else []
+    for block in base:
+        assert blockchain.append_block(block)
+    while len(blockchain.chain) <= heights:
+        index = len(blockchain.chain)
+        block = Block(index, [{"sender": "Network", "receiver": tag, "amount": 1}], blockchain.chain[-1].hash)
+        assert blockchain.append_block(block)
+    broadcasts = []
+    return ChainSync(SimpleNamespace(blockchain=blockchain, broadcast=broadcasts.append)), broadcasts
+
+
+def over_the_wire(message):
+    frame = encode_message(message)
+    return decode_message(message["type"], frame[FRAME_HEADER.size:])
+
+
+def run_sync(local, remote, first=None):
+    """Deliver messages between two syncs until both go quiet, returning the message types sent"""
+    inbox = [(local, first or remote.tip_message())]
+    sent = []
+    while inbox:
+        target, message = inbox.pop(0)
+        sent.append(message["type"])
+        peer = remote if target is local else local
+        reply = lambda response, peer=peer: inbox.append((peer, over_the_wire(response)))
+        getattr(target, SYNC_HANDLERS[message["type"]])(over_the_wire(message)["data"], reply)
+    return sent
+
+
+def hashes(sync_state):
+    return [block.hash for block in sync_state.chain]
+
+
+def test_locator_is_dense_near_the_tip_then_sparse():
+    local, _ = make_sync(300)
+    locator = build_locator(local.chain)
+    heights = [height for height, _ in locator]
+    assert heights[:10] == list(range(300, 290, -1))
+    assert heights[-1] == 0 and heights == sorted(heights, reverse=True)
+    assert len(locator) < 25
+    assert all(local.chain[height].hash == block_hash for height, block_hash in locator)
+    assert heights[10:13] == [289, 285, 277]
+
+
+def test_headers_first_sync_downloads_only_the_missing_branch(monkeypatch):
+    monkeypatch.setattr(sync, "MAX_HEADERS", 50)
+    local, broadcasts = make_sync(60)
+    remote, _ = make_sync(320, fork=(local, 40), tag="fork")
+
+    sent = run_sync(local, remote)
+    assert hashes(local) == hashes(remote)
+    # The sparse locator finds the ancestor at 37, so 283 headers come in batches of 50,
+    # then the bodies in batches of BLOCK_BATCH
+    assert sent.count("GET_HEADERS") == 6 and sent.count("GET_BLOCKS") == 3
+    assert broadcasts == [local.tip_message()]
+    assert local.fork_height is None and not local.headers
+
+
+def test_tip_we_already_have_requests_nothing():
+    local, _ = make_sync(30)
+    remote, _ = make_sync(20, fork=(local, 20))
+    assert run_sync(local, remote) == ["TIP"]
+
+
+def test_headers_that_do_not_connect_are_ignored():
+    local, _ = make_sync(10)
+    other, _ = make_sync(30, tag="other")
+    headers = [block.to_header() for block in other.chain[5:]]
+    headers[0]["previous_hash"] = "ff" * 32
+
+    before = hashes(local)
+    replies = []
+    local.handle_headers(headers, replies.append)
+    assert replies == [] and local.fork_height is None
+    assert hashes(local) == before
+
+
+def test_invalid_header_aborts_sync():
+    local, _ = make_sync(10)
+    remote, _ = make_sync(40, fork=(local, 10))
+    headers = [block.to_header() for block in remote.chain[11:]]
+    headers[5]["nonce"] += 1
+
+    replies = []
+    local.handle_headers(headers, replies.append)
+    assert replies == [] and local.fork_height is None and not local.headers
+
+    # A batch that skips a block links to the wrong parent
+    headers = [block.to_header() for block in remote.chain[11:]]
+    del headers[5]
+    local.handle_headers(headers, replies.append)
+    assert replies == [] and local.fork_height is None and not local.headers
+
+
+def test_body_that_does_not_match_its_header_aborts_sync():
+    local, _ = make_sync(10)
+    remote, _ = make_sync(40, fork=(local, 10), tag="fork")
+    before = hashes(local)
+
+    replies = []
+    local.handle_headers([block.to_header() for block in remote.chain[11:]], replies.append)
+    assert [reply["type"] for reply in replies] == ["GET_BLOCKS"]
+    blocks = [block.to_dict() for block in remote.chain[11:]]
+    blocks[3]["transactions"] = [{"sender": "Network", "receiver": "thief", "amount": 500}]
+    local.handle_blocks(blocks, replies.append)
+    assert local.fork_height is None and not local.requested
+    assert hashes(local) == before
+
+
+def test_branch_of_exactly_max_headers_still_downloads_its_bodies(monkeypatch):
+    monkeypatch.setattr(sync, "MAX_HEADERS", 50)
+    local, broadcasts = make_sync(20)
+    remote, _ = make_sync(70, fork=(local, 20), tag="fork")
+
+    sent = run_sync(local, remote)
+    # 50 headers, then an empty reply to the follow-up that ends the branch
+    assert sent.count("GET_HEADERS") == 2 and sent.count("HEADERS") == 2
+    assert hashes(local) == hashes(remote)
+    assert broadcasts == [local.tip_message()]
@@ -0,0 +1,60 @@
+import pytest
+
+from src.blockchain import transaction_store
+from src.blockchain.transaction import Transaction
+from src.blockchain.transaction_store import TransactionWriter
+
+
+def test_writer_batches_queued_transactions(monkeypatch):
+    batches = []
+    monkeypatch.setattr(transaction_store, "insert_transactions", lambda batch: batches.append(batch) or len(batch))
+    writer = TransactionWriter(batch_size=400, max_delay=0.5)
+    for i in range(1000):
+        assert writer.submit(Transaction("Network", f"r{i}", i, transaction_type="TRANSFER", timestamp=i))
+    writer.start()
+    writer.flush()
+    assert [len(batch) for batch in batches] == [400, 400, 200]
+    assert writer.written == 1000
+    writer.close()
+    assert writer.thread is None
+
+
+def test_writer_never_blocks_when_full():
+    writer = TransactionWriter(queue_size=2)
+    transaction = Transaction("Network", "bob", 1, transaction_type="TRANSFER", timestamp=1)
+    assert writer.submit_many([transaction] * 3) == 2
+    assert writer.dropped == 1
+
+
+def test_failed_batches_are_retried(monkeypatch):
+    calls = []
+
+    def flaky_insert(batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            raise Exception("connection reset")
+        return len(batch)
+
+    monkeypatch.setattr(transaction_store, "insert_transactions", flaky_insert)
+    writer = TransactionWriter(max_delay=0.01).start()
+    writer.submit(Transaction("Network", "bob", 1, transaction_type="TRANSFER", timestamp=1))
+    writer.close()
+    assert calls == [1, 1]
+    assert writer.written == 1 and writer.dropped == 0
+
+
+def test_rows_keep_the_fee():
+    transaction = Transaction("alice", "bob", 5, signature="ab", transaction_type="TRANSFER", timestamp=7, fee=0.5)
+    row = transaction_store.transaction_row(transaction)
+    assert len(row) == len(transaction_store.TRANSACTION_COLUMNS)
+    assert Transaction(*row).to_dict() == transaction.to_dict()
+    assert Transaction(*row).calculate_hash() == transaction.calculate_hash()
+
+
+def test_filters_are_passed_as_parameters():
+    where, params = transaction_store.transaction_filters(after_id=10, sender="alice'; DROP TABLE transactions; --", receiver=None)
+    assert where == " WHERE id > %s AND sender = %s"
+    assert params == (10, "alice'; DROP TABLE transactions; --")
+    assert transaction_store.transaction_filters() == ("", ())
+    with pytest.raises(ValueError):
+        transaction_store.transaction_filters(where="1=1")
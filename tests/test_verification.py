@@ -0,0 +1,52 @@
+from src.blockchain.transaction import Transaction, load_verifying_key
+from src.blockchain.verification import BatchVerifier, verify_transactions
+from src.blockchain.wallet import Wallet
+
+
+def signed_batch(wallets, count):
+    transactions, expected = [], []
+    for i in range(count):
+        wallet = wallets[i % len(wallets)]
+        transaction = Transaction(wallet.address, "bob", i + 1, transaction_type="TRANSFER", timestamp=1700000000 + i)
+        transaction.signature = wallet.sign_transaction(transaction.calculate_hash())
+        valid = True
+        if i % 7 == 3:
+            # Signed by another wallet
+            transaction.signature = wallets[(i + 1) % len(wallets)].sign_transaction(transaction.calculate_hash())
+            valid = False
+        elif i % 11 == 5:
+            transaction.signature = None
+            valid = False
+        elif i % 13 == 6:
+            transaction.signature = "zz"
+            valid = False
+        transactions.append(transaction)
+        expected.append(valid)
+    return transactions, expected
+
+
+def test_mixed_batch_across_the_process_pool():
+    wallets = [Wallet() for _ in range(4)]
+    public_keys = {wallet.address: wallet.public_key.to_string().hex() for wallet in wallets}
+    transactions, expected = signed_batch(wallets, 150)
+    transactions.append(Transaction("Network", "bob", 5, timestamp=1))
+    transactions.append(Transaction("stranger", "bob", 5, signature="00", timestamp=1))
+    expected += [True, False]
+
+    verifier = BatchVerifier(workers=2, chunk_size=16)
+    try:
+        assert verifier.verify(transactions, public_keys) == expected
+        # The pool is reused for the next batch
+        assert verifier.verify(transactions[:80], public_keys) == expected[:80]
+    finally:
+        verifier.close()
+    assert verify_transactions(transactions, public_keys, workers=1) == expected
+
+
+def test_verifying_keys_are_parsed_once():
+    public_key = Wallet().public_key.to_string().hex()
+    load_verifying_key.cache_clear()
+    first = load_verifying_key(public_key)
+    assert load_verifying_key(public_key) is first
+    info = load_verifying_key.cache_info()
+    assert (info.hits, info.misses) == (1, 1)